@@ -12,10 +12,16 @@ from src.gui.main_window import MainWindow
 # Checking src/gui/tabs/devices_tab.py, I did NOT copy the `configure_mqtt_environment` call.
 # I need to verify if I copied it.
 from src.gui.tabs.devices_tab import configure_mqtt_environment
+from src.instruments.metrics import start_http_server
 
 if __name__ == "__main__":
     configure_mqtt_environment()
 
+    # e.g. CORTEX_METRICS_PORT=9100: message rates and GUI update rates on localhost:9100/metrics
+    metrics_port = int(os.environ.get("CORTEX_METRICS_PORT", "0"))
+    if metrics_port:
+        start_http_server(metrics_port)
+
     app = QApplication(sys.argv)
 
     win = MainWindow()
@@ -0,0 +1,38 @@
+"""
+Backend host: runs every instrument backend listed in a config file in one process.
+
+    python backend_main.py                          # config/backends.json
+    python backend_main.py my_backends.json --broker localhost
+    python backend_main.py --metrics-port 9101      # Prometheus metrics on localhost:9101/metrics
+"""
+import argparse
+import os
+import sys
+
+# Ensure the root directory is in sys.path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from src.instruments.backend.backend_host import BackendHost
+from src.instruments.metrics import start_http_server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the CORTEX instrument backends.")
+    parser.add_argument("config", nargs="?", default="config/backends.json",
+                        help="device config file (default: config/backends.json)")
+    parser.add_argument("--broker", default=None,
+                        help="MQTT broker, overrides the config and CORTEX_MQTT_BROKER")
+    parser.add_argument("--metrics-port", type=int, default=int(os.environ.get("CORTEX_METRICS_PORT", "0")),
+                        help="serve metrics on http://127.0.0.1:PORT/metrics (default: CORTEX_METRICS_PORT, off)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.config):
+        print(f"Error: '{args.config}' not found.")
+        sys.exit(1)
+
+    host = BackendHost.from_config(args.config, broker_address=args.broker)
+    if not host.backends:
+        print("No backend could be initialized.")
+        sys.exit(1)
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    host.run()
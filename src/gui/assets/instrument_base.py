@@ -1,12 +1,15 @@
 from dataclasses import dataclass
 from typing import Callable, Any, Optional
-from PyQt6.QtCore import QObject
+from PyQt6.QtCore import QObject, pyqtSignal, pyqtSlot
+from src.instruments.metrics import registry
+
+_gui_updates = registry.counter("cortex_gui_updates_total", "Values shown by the GUI", ("instrument", "parameter"))
 
 @dataclass
 class Parameter:
     name: str
     label: str
-    param_type: str  # 'bool', 'float', 'int', 'str', 'input'
+    param_type: str  # 'bool', 'float', 'int', 'str', 'input', 'image' (2D uint8 array)
     set_cmd: Optional[Callable[[Any], None]] = None # Function to set value
     get_cmd: Optional[Callable[[], Any]] = None     # Function to read value
     unit: str = ""
@@ -21,10 +24,16 @@ class Parameter:
         return self.param_type == 'float'
 
 class InstrumentBase(QObject):
+    # Emitted from the MQTT thread, applied on the GUI thread
+    state_changed = pyqtSignal(dict)
+
     def __init__(self, name):
         super().__init__()
         self.name = name
         self.parameters = {} # Dictionary to store params
+        self.values = {} # Last known value per parameter name, shown by widgets created later
+        self.updating_widgets = False # True while widgets show a received value (not a user edit)
+        self.state_changed.connect(self.apply_state)
 
     def add_parameter(self, param: Parameter):
         self.parameters[param.name] = param
@@ -35,3 +44,52 @@ class InstrumentBase(QObject):
 
     def get_all_params(self):
         return self.parameters.values()
+
+    # --- Last known state ---
+
+    def bind_state(self, topic: str, broker_address: Optional[str] = None):
+        """Mirrors the retained backend snapshot of `topic` into the parameters (see state_store.py)."""
+        # Imported here: paho must not load before configure_mqtt_environment() ran
+        from src.instruments.mqtt_connection import DEFAULT_BROKER
+        from src.instruments.frontend.state_store import get_state_store
+        get_state_store(broker_address or DEFAULT_BROKER).watch(topic, self.state_changed.emit)
+
+    @pyqtSlot(dict)
+    def apply_state(self, values: dict):
+        for name, value in values.items():
+            self.set_value(name, value)
+
+    def set_value(self, name: str, value, text: Optional[str] = None, rich: Optional[str] = None):
+        """
+        Stores a received value and shows it on the parameter's widget, if any. GUI thread only.
+        `text` is the plain display string (default str(value)), `rich` an optional HTML
+        version for 'input' labels.
+        """
+        self.values[name] = (value, text, rich)
+        _gui_updates.labels(self.name, name).inc()
+        param = self.parameters.get(name)
+        if param is not None:
+            self.show_value(param)
+
+    def show_value(self, param: Parameter):
+        if param.name not in self.values:
+            return
+        value, text, rich = self.values[param.name]
+        text = text if text is not None else str(value)
+        self.updating_widgets = True
+        try:
+            if param.param_type == 'bool':
+                if param.update_widget:
+                    param.update_widget(bool(value))
+            elif param.param_type == 'input':
+                if getattr(param, 'update_widget_rich', None):
+                    param.update_widget_rich(rich or text)
+                if param.update_widget:  # Set when the Live Update tab plots this readout
+                    param.update_widget(text)
+            elif param.param_type == 'image':
+                if param.update_widget:
+                    param.update_widget(value)
+            elif param.update_widget:
+                param.update_widget(text)
+        finally:
+            self.updating_widgets = False
@@ -2,6 +2,7 @@ import sys
 import os
 import InitializeCortex
 from src.gui.assets.instrument_base import InstrumentBase, Parameter
+from src.instruments.mqtt_connection import DEFAULT_BROKER
 from src.instruments.frontend.frontend_awg import RemoteAWG
 
 # ==============================================================================
@@ -13,8 +14,9 @@ from src.instruments.frontend.frontend_awg import RemoteAWG
 DISPLAY_NAME = "AWG TG2511A"
 
 # Connection Settings
-MQTT_BROKER  = "fys-s-dep-bkr01.fysad.fys.kuleuven.be"
+MQTT_BROKER  = DEFAULT_BROKER  # CORTEX_MQTT_BROKER env var, see mqtt_connection.py
 MQTT_TOPIC   = "TG2511A/0000"
+FLUSH_INTERVAL = 0.05  # s, fast setpoint changes within this window collapse to the last value
 
 # Parameter Configuration
 # You can adjust labels, units, and scannability here.
@@ -85,7 +87,9 @@ class MqttAWG(InstrumentBase):
         print(f"[{self.name}] Connecting to {MQTT_BROKER} on topic {MQTT_TOPIC}...")
         try:
             # We use the global configuration variables here
-            self.driver = RemoteAWG(MQTT_TOPIC, broker_address=MQTT_BROKER)
+            self.driver = RemoteAWG(MQTT_TOPIC, broker_address=MQTT_BROKER, flush_interval=FLUSH_INTERVAL)
+            # Widgets start from the backend's retained state (output, frequency, amplitude)
+            self.bind_state(MQTT_TOPIC, MQTT_BROKER)
             print(f"[{self.name}] Connected successfully.")
         except Exception as e:
             print(f"[{self.name}] Connection failed: {e}")
@@ -12,6 +12,12 @@ DISPLAY_NAME = "Hamamatsu Camera"
 CATEGORY = 'Sensor'
 RESOURCE_ID  = "HAMAMATSU/0000"
 
+# Regions of interest summed on every frame: name -> (x, y, width, height) in pixels
+ROIS = {
+    "roi1": (96, 96, 16, 16),
+    "roi2": (144, 96, 16, 16),
+}
+
 # ==============================================================================
 #   SECTION 2: INSTRUMENT LOGIC
 # ==============================================================================
@@ -30,19 +36,48 @@ class CameraPlugin(InstrumentBase):
             get_cmd=None
         ))
 
+        for name in ROIS:
+            self.add_parameter(Parameter(
+                name=name,
+                label=f"{name.upper()} Count",  # "Count": plottable in the Live Update tab
+                param_type='input',
+                unit="",
+                set_cmd=None,
+                get_cmd=None
+            ))
+
+        # Downsampled live view, refreshed at most every 100 ms
+        self.add_parameter(Parameter(
+            name="live_image",
+            label=None,
+            param_type='image',
+            set_cmd=None,
+            get_cmd=None
+        ))
+
         self.connect_instrument()
 
     def connect_instrument(self):
         print(f"[{self.name}] Subscribing to {RESOURCE_ID}...")
         try:
-            self.driver = MqttCamera(RESOURCE_ID)
-            self.driver.open()
+            self.driver = MqttCamera(RESOURCE_ID, rois=ROIS)
+            # Connect before open(): a retained count may arrive right away
             self.driver.count_updated.connect(self.on_count_update)
+            self.driver.rois_updated.connect(self.on_rois_update)
+            self.driver.image_updated.connect(self.on_image_update)
+            self.driver.open()
         except Exception as e:
             print(f"[{self.name}] Connection failed: {e}")
 
     @pyqtSlot(int)
     def on_count_update(self, value):
-        param = self.parameters.get("total_count")
-        if param and param.update_widget:
-            param.update_widget(str(value))
+        self.set_value("total_count", value)
+
+    @pyqtSlot(float, object)
+    def on_rois_update(self, timestamp, sums):
+        for name, value in sums.items():
+            self.set_value(name, value)
+
+    @pyqtSlot(object)
+    def on_image_update(self, image):
+        self.set_value("live_image", image)
@@ -1,7 +1,10 @@
 import json
+import math
 import sys, os
 import InitializeCortex
+from PyQt6.QtCore import pyqtSignal, pyqtSlot
 from src.gui.assets.instrument_base import InstrumentBase, Parameter
+from src.instruments.mqtt_connection import DEFAULT_BROKER
 from src.instruments.frontend.frontend_powersupply import RemotePowerSupply
 
 # ==============================================================================
@@ -12,8 +15,11 @@ from src.instruments.frontend.frontend_powersupply import RemotePowerSupply
 JSON_FILE = 'config/powersupplylist.json'
 
 # Default Settings for all Power Supplies
-MQTT_BROKER = "fys-s-dep-bkr01.fysad.fys.kuleuven.be"
+MQTT_BROKER = DEFAULT_BROKER  # CORTEX_MQTT_BROKER env var, see mqtt_connection.py
 ACTIVE_CHANNELS = [1, 2, 3] # Channels to create widgets for
+FLUSH_INTERVAL = 0.05 # s, fast setpoint changes within this window collapse to the last value
+TELEMETRY_PERIOD = 1.0 # s, measured V/I refresh while the GUI is open
+RAMP_RATE = 0.5 # V/s, ramps started from the GUI (run inside the backend)
 
 def load_psu_config():
     if not os.path.exists(JSON_FILE):
@@ -41,6 +47,9 @@ def create_psu_class(device_config):
 
     # Define the class logic (Closure)
     class DynamicPSU(InstrumentBase):
+        # Telemetry arrives on the MQTT thread, widgets are updated on the GUI thread
+        telemetry_updated = pyqtSignal(float, object)
+
         def __init__(self):
             # The name passed here becomes the Frame Title in the GUI
             super().__init__(dev_name) 
@@ -63,6 +72,15 @@ def create_psu_class(device_config):
                 set_cmd=lambda val, c=ch_num: self.set_volts_wrapper(c, val)
             ))
 
+            # Ramp target (Float): the backend ramps at RAMP_RATE, a new Set cancels it
+            self.add_parameter(Parameter(
+                name=f"ch{ch_num}_ramp",
+                label=f"Ch{ch_num} Ramp To (V)",
+                param_type="float",
+                unit="V",
+                set_cmd=lambda val, c=ch_num: self.ramp_wrapper(c, val)
+            ))
+
             # Enable (Checkbox)
             self.add_parameter(Parameter(
                 name=f"ch{ch_num}_enable",
@@ -70,19 +88,51 @@ def create_psu_class(device_config):
                 param_type="bool",
                 set_cmd=lambda val, c=ch_num: self.set_enable_wrapper(c, val)
             ))
+
+            # Measured Voltage / Current (Readout)
+            self.add_parameter(Parameter(
+                name=f"ch{ch_num}_meas_volt",
+                label=f"Ch{ch_num} Meas (V)",
+                param_type="input",
+                unit="V",
+            ))
+            self.add_parameter(Parameter(
+                name=f"ch{ch_num}_meas_curr",
+                label=f"Ch{ch_num} Meas (A)",
+                param_type="input",
+                unit="A",
+            ))
         
         def connect_instrument(self):
             print(f"[{self.name}] Connecting to {self.topic}...")
             try:
-                self.driver = RemotePowerSupply(self.topic, broker_address=MQTT_BROKER)
+                self.driver = RemotePowerSupply(self.topic, broker_address=MQTT_BROKER,
+                                                flush_interval=FLUSH_INTERVAL)
+                # Setpoints from the retained backend state, measurements from (retained) telemetry
+                self.bind_state(self.topic, MQTT_BROKER)
+                self.telemetry_updated.connect(self.on_telemetry)
+                self.driver.subscribe_telemetry(self.telemetry_updated.emit, period=TELEMETRY_PERIOD)
             except Exception as e:
                 print(f"[{self.name}] Connection failed: {e}")
 
+        @pyqtSlot(float, object)
+        def on_telemetry(self, timestamp, readings):
+            for ch, (volts, amps, setpoint, target) in readings.items():
+                self.set_value(f"ch{ch}_meas_volt", volts, f"{volts:.3f}")
+                self.set_value(f"ch{ch}_meas_curr", amps, f"{amps:.4f}")
+                if not math.isnan(target):
+                    # Ramp in progress: follow the setpoint the backend has reached
+                    self.set_value(f"ch{ch}_volt", setpoint, f"{setpoint:.3f}")
+
         # --- Wrappers ---
         def set_volts_wrapper(self, channel, volts):
             if self.driver:
                 self.driver.set_voltage(channel, float(volts))
 
+        def ramp_wrapper(self, channel, volts):
+            if self.driver:
+                self.driver.ramp(channel, float(volts), rate=RAMP_RATE)
+
         def set_enable_wrapper(self, channel, is_on):
             if self.driver:
                 if is_on: self.driver.enable(channel)
@@ -1,13 +1,14 @@
 import sys, os
 import InitializeCortex
 from src.gui.assets.instrument_base import InstrumentBase, Parameter
+from src.instruments.mqtt_connection import DEFAULT_BROKER
 from src.instruments.frontend.frontend_shutter import RemoteShutter
 
 # ==============================================================================
 #   SECTION 1: USER CONFIGURATION
 # ==============================================================================
 DISPLAY_NAME = "Ionisation Lasers Shutter"
-MQTT_BROKER  = "fys-s-dep-bkr01.fysad.fys.kuleuven.be"
+MQTT_BROKER  = DEFAULT_BROKER  # CORTEX_MQTT_BROKER env var, see mqtt_connection.py
 MQTT_TOPIC   = "shutter/0000"
 
 CONFIG = {
@@ -21,6 +22,20 @@ CONFIG = {
         "unit":  "ms",
         "type":  "float",
         "scan":  False  # Scanning pulse duration is rare, but possible
+    },
+    # Train settings used by the next Pulse / Armed (timed by the DAQ counter)
+    "pulse_count": {
+        "label": "Pulses per Train",
+        "type":  "int",
+    },
+    "pulse_period": {
+        "label": "Train Period",
+        "unit":  "ms",
+        "type":  "float",
+    },
+    "armed": {
+        "label": "Fire on Trigger",
+        "type":  "bool",
     }
 }
 
@@ -32,6 +47,9 @@ class ShutterPlugin(InstrumentBase):
         super().__init__(DISPLAY_NAME)
         self.driver = None
         self.category = 'Miscellaneous'
+        self.pulse_ms = 1.0
+        self.pulse_count = 1
+        self.pulse_period_ms = 0.0
 
         # --- 1. Main Shutter State (Switch) ---
         cfg = CONFIG["state"]
@@ -52,6 +70,30 @@ class ShutterPlugin(InstrumentBase):
             unit=cfg["unit"],
             set_cmd=self.pulse_wrapper
         ))
+
+        # --- 3. Pulse train and external trigger ---
+        cfg = CONFIG["pulse_count"]
+        self.add_parameter(Parameter(
+            name="pulse_count",
+            label=cfg["label"],
+            param_type=cfg["type"],
+            set_cmd=self.set_pulse_count
+        ))
+        cfg = CONFIG["pulse_period"]
+        self.add_parameter(Parameter(
+            name="pulse_period",
+            label=cfg["label"],
+            param_type=cfg["type"],
+            unit=cfg["unit"],
+            set_cmd=self.set_pulse_period
+        ))
+        cfg = CONFIG["armed"]
+        self.add_parameter(Parameter(
+            name="armed",
+            label=cfg["label"],
+            param_type=cfg["type"],
+            set_cmd=self.arm_wrapper
+        ))
         
         self.connect_instrument()
 
@@ -59,6 +101,7 @@ class ShutterPlugin(InstrumentBase):
         print(f"[{self.name}] Connecting to {MQTT_BROKER}...")
         try:
             self.driver = RemoteShutter(MQTT_TOPIC, broker_address=MQTT_BROKER)
+            self.bind_state(MQTT_TOPIC, MQTT_BROKER)
         except Exception as e:
             print(f"[{self.name}] Connection failed: {e}")
 
@@ -70,6 +113,21 @@ class ShutterPlugin(InstrumentBase):
                 self.driver.close_shutter()
 
     def pulse_wrapper(self, duration_ms):
+        self.pulse_ms = float(duration_ms)
+        if self.driver:
+            self.driver.pulse(self.pulse_ms, self.pulse_count, self.pulse_period_ms)
+            print(f"[{self.name}] Pulsed for {duration_ms}ms x {self.pulse_count}")
+
+    # Train settings are kept here and sent with the next pulse
+    def set_pulse_count(self, count):
+        self.pulse_count = max(1, int(count))
+
+    def set_pulse_period(self, period_ms):
+        self.pulse_period_ms = float(period_ms)
+
+    def arm_wrapper(self, armed: bool):
         if self.driver:
-            self.driver.pulse(float(duration_ms))
-            print(f"[{self.name}] Pulsed for {duration_ms}ms")
+            if armed:
+                self.driver.arm(self.pulse_ms, self.pulse_count, self.pulse_period_ms)
+            else:
+                self.driver.disarm()
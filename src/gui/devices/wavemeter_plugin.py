@@ -2,7 +2,7 @@ import sys
 import os
 import InitializeCortex
 from src.gui.assets.instrument_base import InstrumentBase, Parameter
-from src.instruments.frontend.frontend_wavemeter import MqttWavemeter
+from src.instruments.frontend.frontend_wavemeter import MqttWavemeterChannels
 from functools import partial
 from PyQt6.QtCore import pyqtSlot
 from src.gui.assets.csstyle import Style
@@ -12,7 +12,8 @@ from src.gui.assets.csstyle import Style
 # ==============================================================================
 DISPLAY_NAME = "HighFinesse Wavemeter (Multi-Channel)"
 CATEGORY = 'Sensor'
-RESOURCE_BASE  = "HFWM/8731/frequency/"
+RESOURCE_BASE  = "HFWM/8731"
+CHANNELS = 8
 
 # ==============================================================================
 #   SECTION 2: INSTRUMENT LOGIC
@@ -20,12 +21,12 @@ RESOURCE_BASE  = "HFWM/8731/frequency/"
 class WavemeterPlugin(InstrumentBase):
     def __init__(self):
         super().__init__(DISPLAY_NAME)
-        self.drivers = {}
+        self.driver = None
         self.category = CATEGORY
         self.channel_sigmas = {} # Stores latest sigma for each channel
 
         # Define 8 channels
-        for ch in range(1, 9):
+        for ch in range(1, CHANNELS + 1):
             self.add_channel_parameters(ch)
 
         self.connect_instrument()
@@ -52,67 +53,61 @@ class WavemeterPlugin(InstrumentBase):
         ))
 
     def connect_instrument(self):
-        for ch in range(1, 9):
-            resource_id = f"{RESOURCE_BASE}{ch}"
-            print(f"[{self.name}] Subscribing to {resource_id}...")
-            try:
-                driver = MqttWavemeter(resource_id)
-                driver.open()
-                self.drivers[ch] = driver
+        # One subscription (HFWM/8731/frequency/+) for every channel
+        print(f"[{self.name}] Subscribing to {RESOURCE_BASE}/frequency/+...")
+        try:
+            self.driver = MqttWavemeterChannels(RESOURCE_BASE, CHANNELS)
 
-                # Connect Signals
-                driver.frequency_updated.connect(partial(self.on_freq_update, channel=ch))
-                driver.sigma_updated.connect(partial(self.on_sigma_update, channel=ch))
+            # Connect Signals (before open(): retained readings may arrive right away)
+            self.driver.frequency_updated.connect(self.on_freq_update)
+            self.driver.sigma_updated.connect(self.on_sigma_update)
+            self.driver.open()
 
-            except Exception as e:
-                print(f"[{self.name}] Connection failed for Ch {ch}: {e}")
+        except Exception as e:
+            print(f"[{self.name}] Connection failed: {e}")
 
     def get_freq_wrapper(self, channel):
-        if channel in self.drivers:
-            val = self.drivers[channel].getdata()
+        if self.driver:
+            val = self.driver.getdata(channel)
             return f"{val:.6f}"
         return "0.0"
 
     def set_setpoint_wrapper(self, channel, value):
-        if channel in self.drivers:
-            self.drivers[channel].set_setpoint(value)
+        if self.driver:
+            self.driver.set_setpoint(channel, value)
         else:
             print(f"[{self.name}] Error: No driver for Ch {channel}")
 
-    @pyqtSlot(float)
-    def on_freq_update(self, value, channel=None):
+    @pyqtSlot(int, float)
+    def on_freq_update(self, channel, value):
         param_name = f"frequency_ch{channel}"
-        
-        if param_name in self.parameters:
-            param = self.parameters[param_name]
-            
-            if param.update_widget:
-                # 1. Formatage du nombre complet (6 décimales)
-                full_str = f"{value:.6f}" 
-                
-                # 2. Découpage : Partie principale vs les 3 derniers digits
-                # ex: si value = 193.123456
-                # main_part = "193.123"
-                # fine_part = "456"
-                main_part = full_str[:-3]
-                fine_part = full_str[-3:]
-                
-                # 3. Construction HTML
-                # On met 'fine_part' dans un span avec une police réduite (ex: 10pt ou 11px)
-                # On ajoute l'unité THz à la fin (en taille normale)
-                text = (
-                    f"<html>"
-                    f"{main_part}"
-                    f"<span style='font-size: 13pt;'>{fine_part}</span>" 
-                    f" <span style='font-size: 13pt; color: #B9BBBE; font-weight: normal;'>THz</span>"
-                    f"</html>"
-                )
-                
-                param.update_widget_rich(text)
-                param.update_widget(full_str)
-
-    @pyqtSlot(float)
-    def on_sigma_update(self, sigma, channel=None):
+
+        # 1. Formatage du nombre complet (6 décimales)
+        full_str = f"{value:.6f}"
+
+        # 2. Découpage : Partie principale vs les 3 derniers digits
+        # ex: si value = 193.123456
+        # main_part = "193.123"
+        # fine_part = "456"
+        main_part = full_str[:-3]
+        fine_part = full_str[-3:]
+
+        # 3. Construction HTML
+        # On met 'fine_part' dans un span avec une police réduite (ex: 10pt ou 11px)
+        # On ajoute l'unité THz à la fin (en taille normale)
+        text = (
+            f"<html>"
+            f"{main_part}"
+            f"<span style='font-size: 13pt;'>{fine_part}</span>"
+            f" <span style='font-size: 13pt; color: #B9BBBE; font-weight: normal;'>THz</span>"
+            f"</html>"
+        )
+
+        # Kept as last value, so the label is filled even if its widget is created later
+        self.set_value(param_name, value, full_str, rich=text)
+
+    @pyqtSlot(int, float)
+    def on_sigma_update(self, channel, sigma):
         self.channel_sigmas[channel] = sigma
 
         # Threshold: 10 MHz = 0.00001 THz
@@ -11,6 +11,7 @@ from src.gui.assets.csstyle import Style
 from src.gui.tabs.devices_tab import InstrumentPanel
 from src.gui.tabs.live_update_tab import LiveUpdateWidget
 from src.gui.tabs.scan_tab import ScanTab
+from src.gui.tabs.trace_tab import TraceTab
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -32,6 +33,7 @@ class MainWindow(QMainWindow):
         self.sidebar.addItem("Devices")
         self.sidebar.addItem("Live Update")
         self.sidebar.addItem("Scan")
+        self.sidebar.addItem("Tracing")
         self.sidebar.setCurrentRow(0)
         self.sidebar.currentRowChanged.connect(self.display_page)
         main_layout.addWidget(self.sidebar)
@@ -54,5 +56,9 @@ class MainWindow(QMainWindow):
         self.scan_page = ScanTab()
         self.stack.addWidget(self.scan_page)
 
+        # --- Page 4: Command Tracing ---
+        self.trace_page = TraceTab()
+        self.stack.addWidget(self.trace_page)
+
     def display_page(self, index):
         self.stack.setCurrentIndex(index)
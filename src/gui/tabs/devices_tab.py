@@ -32,6 +32,8 @@ from src.gui.assets.csstyle import Style
 from src.gui.assets.instrument_base import InstrumentBase, Parameter
 from src.gui.widgets.smaller_toggle import AnimatedToggle
 from src.gui.widgets.flow_layout import FlowLayout
+from src.gui.widgets.image_view import ImageView
+from src.instruments.tracing import tracer
 
 
 # ==============================================================================
@@ -42,7 +44,12 @@ def configure_mqtt_environment():
     """
     Detects if the environment requires a Mock MQTT client.
     Patches sys.modules to substitute paho.mqtt with the mock if needed.
+    Set CORTEX_MQTT_MOCK=0 to keep the real paho client (e.g. with tests/local_broker.py).
     """
+    if os.environ.get("CORTEX_MQTT_MOCK", "1") == "0":
+        print(">> [System] Using the real MQTT client")
+        return
+
     mock_mqtt = None
     
     # 1. Try importing the mock from known locations
@@ -117,9 +124,11 @@ class InstrumentFrame(QFrame):
         
         # Input Widget
         input_widget = self._create_input_widget(param, row_layout)
+        # Show the last known value right away (retained backend state, see state_store.py)
+        self.instrument.show_value(param)
         
         # 'Send' Button (Only for non-boolean params)
-        if param.param_type != "bool" and param.param_type != 'input':
+        if param.param_type not in ("bool", "input", "image"):
             btn = QPushButton("Send")
             btn.setStyleSheet(Style.Button.suggested)
             btn.setCursor(Qt.CursorShape.PointingHandCursor)
@@ -158,11 +167,19 @@ class InstrumentFrame(QFrame):
             if hasattr(param, 'update_widget_style'):
                  param.update_widget_style = widget.setStyleSheet
             return widget
+
+        elif param.param_type == 'image':
+            widget = ImageView()
+            parent_layout.addWidget(widget)
+            param.update_widget = widget.set_image
+            return widget
             
         return QWidget() # Fallback empty widget
 
     def send_command(self, param: Parameter, value):
         """Handles type conversion and execution of the instrument command."""
+        if self.instrument.updating_widgets:
+            return  # Widget changed to show a received value, not by the user
         try:
             # 1. Convert Type
             if param.param_type == "float":
@@ -172,7 +189,8 @@ class InstrumentFrame(QFrame):
             
             # 2. Execute
             if param.set_cmd:
-                param.set_cmd(value)
+                with tracer.click():  # Start of the command's trace, if tracing is on
+                    param.set_cmd(value)
                 print(f"[{self.instrument.name}] Set {param.name} = {value}")
                 
         except ValueError:
@@ -221,6 +239,14 @@ class InstrumentPanel(QWidget):
             base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
             devices_path = os.path.join(base_dir, "devices")
 
+        # One bulk subscription to the retained state of every backend, before the
+        # plugins connect, so their widgets start with the last known values
+        try:
+            from src.instruments.frontend.state_store import get_state_store
+            get_state_store()
+        except Exception as e:
+            print(f">> [State] Could not subscribe to backend states: {e}")
+
         self._load_and_display_plugins(devices_path)
 
         # Select first item by default
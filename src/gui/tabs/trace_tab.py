@@ -0,0 +1,106 @@
+import time
+
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (
+    QWidget,
+    QHBoxLayout,
+    QVBoxLayout,
+    QPushButton,
+    QLabel,
+    QTableWidget,
+    QTableWidgetItem,
+    QHeaderView,
+    QFileDialog,
+)
+
+from src.gui.assets.csstyle import Style
+from src.instruments.tracing import PERCENTILES, STAGES, tracer
+
+
+class TraceTab(QWidget):
+    """
+    Command latency per device and stage (see src/instruments/tracing.py),
+    refreshed every second while tracing is on.
+    """
+    COLUMNS = ["Device", "Stage", "Count"] + [f"p{p} (ms)" for p in PERCENTILES] + ["Max (ms)"]
+
+    def __init__(self):
+        super().__init__()
+        layout = QVBoxLayout(self)
+
+        # --- Controls ---
+        controls = QHBoxLayout()
+        self.btn_toggle = QPushButton()
+        self.btn_toggle.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_toggle.clicked.connect(self.toggle_tracing)
+        controls.addWidget(self.btn_toggle)
+
+        self.btn_reset = QPushButton("Reset")
+        self.btn_reset.setStyleSheet(Style.Button.reset)
+        self.btn_reset.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_reset.clicked.connect(self.reset)
+        controls.addWidget(self.btn_reset)
+
+        self.btn_dump = QPushButton("Save to File...")
+        self.btn_dump.setStyleSheet(Style.Button.simple_light)
+        self.btn_dump.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.btn_dump.clicked.connect(self.dump)
+        controls.addWidget(self.btn_dump)
+
+        controls.addStretch()
+        self.lbl_status = QLabel()
+        controls.addWidget(self.lbl_status)
+        layout.addLayout(controls)
+
+        # --- Table ---
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(1000)
+        self._update_controls()
+
+    def toggle_tracing(self):
+        tracer.enable(not tracer.enabled)
+        self._update_controls()
+
+    def _update_controls(self):
+        if tracer.enabled:
+            self.btn_toggle.setText("Stop Tracing")
+            self.btn_toggle.setStyleSheet(Style.Button.stop)
+        else:
+            self.btn_toggle.setText("Start Tracing")
+            self.btn_toggle.setStyleSheet(Style.Button.start)
+        self.lbl_status.setText("Tracing on" if tracer.enabled else "Tracing off (no overhead)")
+
+    def reset(self):
+        tracer.reset()
+        self.table.setRowCount(0)
+
+    def dump(self):
+        default = time.strftime("cortex_trace_%Y%m%d_%H%M%S.json")
+        path, _ = QFileDialog.getSaveFileName(self, "Save Trace", default, "JSON (*.json)")
+        if path:
+            tracer.dump(path)
+
+    def refresh(self):
+        if not tracer.enabled or not self.isVisible():
+            return
+        rows = []
+        for device, stages in sorted(tracer.summary().items()):
+            for stage in STAGES:
+                if stage in stages:
+                    rows.append((device, stage, stages[stage]))
+
+        self.table.setRowCount(len(rows))
+        for row, (device, stage, stats) in enumerate(rows):
+            values = [device, stage, str(stats["count"])]
+            values += [f"{stats[f'p{p}'] * 1e3:.2f}" for p in PERCENTILES]
+            values.append(f"{stats['max'] * 1e3:.2f}")
+            for column, text in enumerate(values):
+                self.table.setItem(row, column, QTableWidgetItem(text))
@@ -0,0 +1,23 @@
+import numpy as np
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QImage, QPixmap
+from PyQt6.QtWidgets import QLabel
+
+
+class ImageView(QLabel):
+    """Shows a 2D uint8 array (e.g. a downsampled camera frame) as a grayscale picture."""
+
+    def __init__(self, size: int = 256, parent=None):
+        super().__init__(parent)
+        self.setFixedSize(size, size)
+        self.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        self.setStyleSheet("background-color: black;")
+
+    def set_image(self, image: np.ndarray):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        height, width = image.shape
+        # QImage only wraps the buffer; the pixmap conversion copies it before `image` goes away
+        qimage = QImage(image.data, width, height, image.strides[0], QImage.Format.Format_Grayscale8)
+        pixmap = QPixmap.fromImage(qimage)
+        self.setPixmap(pixmap.scaled(self.size(), Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.FastTransformation))
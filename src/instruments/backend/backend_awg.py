@@ -1,61 +1,116 @@
-import ast
-from typing import Any
-import paho.mqtt.client as mqtt
+import time
+from contextlib import nullcontext
+import numpy as np
 import InitializeCortex
-from src.instruments.hardware.awg import TG2511A
+from src.instruments.codec import AWG, CodecError, arb_topic, decode_arb, read_correlation_id
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.backend.mqtt_backend import MqttBackend
+from src.instruments.backend.backend_host import BackendHost
+from src.instruments.backend.hardware.awg import TG2511A, AWG_RESSOURCE
 
 topic = 'TG2511A/0000'
 
-class BackendAWG(TG2511A):
-
-    def __init__(self, resource_string: str, mqtt_topic: str):
-        super().__init__(resource_string)
-        self.mqtt_path = mqtt_topic
-        
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        
-    def open_mqtt(self):
-        # Renamed to avoid confusion with hardware open() if it exists
-        self.client.connect(host="fys-s-dep-bkr01.fysad.fys.kuleuven.be")
-        self.client.loop_start()
-    
-    def on_connect(self, client, userdata, flags, rc, props=None):
-        if rc == 0:
-            client.subscribe(self.mqtt_path)
-            print(f'AWG subscribed to {self.mqtt_path}')
-
-    def on_message(self, client, userdata, message):
-        payload_str = message.payload.decode()
+class BackendAWG(TG2511A, MqttBackend):
+    schema = AWG
+    label = "AWG"
+    # A queued ARB upload is replaced by a newer one for the same slot
+    coalesce_modes = ("freq", "ampl", "arb")
+
+    def __init__(self, resource_string: str, mqtt_topic: str, sync: bool = False, check_errors: bool = False):
+        """
+        Args:
+            sync: end every command/batch with *OPC?, so its ack means "applied"
+            check_errors: read the error queue once per command/batch and fail the ack on errors
+        """
+        TG2511A.__init__(self, resource_string)
+        MqttBackend.__init__(self, mqtt_topic)
+        self.sync = sync
+        self.check_errors = check_errors
+        self.arb_topic = arb_topic(mqtt_topic)
+        self._sweep_range = {}  # 'sweep_start' / 'sweep_stop' -> Hz
+
+    def open_mqtt(self, broker_address: str = DEFAULT_BROKER):
+        super().open_mqtt(broker_address)
+        self.connection.subscribe(self.arb_topic, self.on_arb)
+
+    def close_mqtt(self):
+        if self.connection is not None:
+            self.connection.unsubscribe(self.arb_topic, self.on_arb)
+        super().close_mqtt()
+
+    def on_arb(self, client, userdata, message):
+        # Network thread: like on_message, the upload itself runs on the queue worker
+        received = time.time()
         try:
-            # Expected format: "('mode', value)"
-            mode, value = ast.literal_eval(payload_str)
-            value = float(value)
-        except (ValueError, SyntaxError) as e:
-            print(f"AWG Error: Wrong payload format: {payload_str} | {e}")
+            arb = decode_arb(message.payload)
+        except CodecError as e:
+            print(f"{self.label} Error: Wrong ARB payload: {e}")
+            self.publish_ack(read_correlation_id(message.payload), received, received, received,
+                             f"Wrong ARB payload: {e}")
             return
+        points = np.frombuffer(arb.points, dtype='<f4')
+        self.enqueue([("arb", arb.slot, points)], arb.correlation_id, received)
+
+    def close_hardware(self):
+        self.close()
+
+    def hardware_batch(self, commands):
+        if commands[0][0] == "arb":
+            # The upload is verified on its own (read-back + error queue): no batch, no *OPC?/SYST:ERR? after it
+            return nullcontext()
+        # The whole batch goes out as one ';'-joined write (see TG2511A.batch)
+        return self.batch(sync=self.sync, check_errors=self.check_errors)
 
+    def execute(self, mode: str, value: float, points=None):
+        if mode == "arb":
+            # value: slot, points: float32 samples from on_arb
+            count = self.upload_arb(int(value), points)
+            print(f"AWG: {count} points loaded into ARB{int(value)}")
+            self.update_state(**{f"arb{int(value)}_points": count})
+            return
         print(f"AWG Mode: {mode}, Value: {value}")
-        
-        try:
-            if mode == "enable":
-                self.output_on()
-            elif mode == "disable":
-                self.output_off()
-            elif mode == 'ampl':
-                # FIX: Convert mV to Volts (divide by 1000), not multiply
-                print(f"Setting amplitude: {value} mV")
-                self.set_amplitude(value * 1e-3)
-            elif mode == 'freq':
-                # Convert MHz to Hz
-                print(f"Setting frequency: {value} MHz")
-                self.set_frequency(value * 1e6)
-        except Exception as e:
-            print(f"AWG Hardware Error: {e}")
-            
-            
+
+        if mode == "enable":
+            self.output_on()
+            self.update_state(output=True)
+        elif mode == "disable":
+            self.output_off()
+            self.update_state(output=False)
+        elif mode == 'ampl':
+            # FIX: Convert mV to Volts (divide by 1000), not multiply
+            print(f"Setting amplitude: {value} mV")
+            self.set_amplitude(value * 1e-3)
+            self.update_state(amplitude=value)
+        elif mode == 'freq':
+            # Convert MHz to Hz
+            print(f"Setting frequency: {value} MHz")
+            self.set_frequency(value * 1e6)
+            self.update_state(frequency=value)
+        elif mode in ('sweep_start', 'sweep_stop'):
+            # Written once both ends are known, then one end can change alone
+            self._sweep_range[mode] = value * 1e6
+            if len(self._sweep_range) == 2:
+                self.set_sweep_range(self._sweep_range['sweep_start'], self._sweep_range['sweep_stop'])
+            self.update_state(**{mode: value})
+        elif mode == 'sweep_time':
+            self.set_sweep_time(value)
+            self.update_state(sweep_time=value)
+        elif mode == 'sweep_mode':
+            self.set_sweep_mode("LOG" if value else "LINEAR")
+            self.update_state(sweep_log=bool(value))
+        elif mode == 'sweep':
+            if value:
+                # Sweeps start on 'trigger' only, so the frontend knows when (see fly_scan.py)
+                self.set_sweep_trigger("MAN")
+            self.enable_sweep(bool(value))
+            self.update_state(sweep=bool(value))
+        elif mode == 'trigger':
+            started = self.trigger_sweep()
+            print(f"AWG: sweep triggered at {started:.6f}")
+            self.update_state(sweep_triggered=started)
+            return started  # Ack.value, see fly_scan.py
+
+
 if __name__ == "__main__":
     awg = BackendAWG(resource_string = AWG_RESSOURCE, mqtt_topic = topic)
-    awg.open_mqtt()
-    while True: continue
+    BackendHost([awg]).run()
@@ -0,0 +1,130 @@
+"""
+Runs any number of instrument backends in one process (see backend_main.py).
+
+All backends share one MQTT connection per broker. The main thread sleeps on
+an event until SIGINT/SIGTERM, then every backend finishes its queued
+commands, unsubscribes and releases its instrument.
+
+Config (config/backends.json):
+    {
+        "broker": "localhost",                       # optional, default CORTEX_MQTT_BROKER
+        "devices": [
+            {"name": "AWG", "type": "awg", "topic": "TG2511A/0000",
+             "options": {"resource_string": "TCPIP0::192.168.1.209::9221::SOCKET"}},
+            {"name": "Rigol Rack Top", "type": "powersupply", "id": "RIGOLPS", "serialnumber": "0000",
+             "options": {"ip": "192.168.1.10"}}
+        ]
+    }
+
+`type` is a key of BACKEND_TYPES or a "module:Class" path for new backends.
+The topic is `topic`, or `id/serialnumber` like in powersupplylist.json.
+`options` are passed to the backend constructor; entries with an option left
+at null are skipped as not configured.
+"""
+import importlib
+import json
+import signal
+import threading
+from typing import Optional
+
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+
+# Imported lazily, so a host without e.g. a DAQ card does not need nidaqmx
+BACKEND_TYPES = {
+    "awg": "src.instruments.backend.backend_awg:BackendAWG",
+    "powersupply": "src.instruments.backend.backend_powersupply:BackendPowerSupply",
+    "shutter": "src.instruments.backend.backend_shutter:BackendShutter",
+    "pattern": "src.instruments.backend.backend_pattern_generator:BackendPatternGenerator",
+}
+
+
+def load_backend_class(backend_type: str):
+    path = BACKEND_TYPES.get(backend_type, backend_type)
+    if ":" not in path:
+        raise ValueError(f"Unknown backend type '{backend_type}'")
+    module_name, class_name = path.split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_backend(entry: dict):
+    """Instantiates the backend described by one config entry."""
+    topic = entry.get("topic") or f"{entry['id']}/{entry['serialnumber']}"
+    options = entry.get("options", {})
+    missing = [key for key, value in options.items() if value is None]
+    if missing:
+        raise ValueError(f"{', '.join(missing)} not configured")
+    backend_class = load_backend_class(entry["type"])
+    return backend_class(mqtt_topic=topic, **options)
+
+
+class BackendHost:
+    def __init__(self, backends=(), broker_address: str = DEFAULT_BROKER):
+        self.backends = list(backends)
+        self.broker_address = broker_address
+        self._stop_event = threading.Event()
+
+    @classmethod
+    def from_config(cls, path: str, broker_address: Optional[str] = None,
+                    only: Optional[str] = None) -> "BackendHost":
+        """Creates the backends listed in a config file. `only` keeps one device type."""
+        with open(path, 'r') as f:
+            config = json.load(f)
+
+        backends = []
+        devices = [entry for entry in config.get("devices", []) if only is None or entry.get("type") == only]
+        print(f"Found {len(devices)} backend(s) defined in {path}.")
+        for entry in devices:
+            name = entry.get("name", entry.get("topic", "Unknown"))
+            try:
+                backend = create_backend(entry)
+                print(f"Initialized {name} -> Topic: {backend.mqtt_path}")
+                backends.append(backend)
+            except KeyError as e:
+                print(f"Skipping {name}: missing field {e}")
+            except Exception as e:
+                print(f"Failed to initialize {name}: {e}")
+
+        return cls(backends, broker_address or config.get("broker") or DEFAULT_BROKER)
+
+    def start(self):
+        started = []
+        for backend in self.backends:
+            try:
+                backend.open_mqtt(self.broker_address)
+                started.append(backend)
+            except Exception as e:
+                print(f"{backend.label} {backend.mqtt_path}: failed to connect: {e}")
+                # Dropped from self.backends, so shutdown() will not see it: release the instrument now
+                try:
+                    backend.close_hardware()
+                except Exception as e:
+                    print(f"{backend.label} {backend.mqtt_path}: error while closing: {e}")
+        self.backends = started
+
+    def stop(self, *args):
+        """Wakes up run(). Also used as the signal handler."""
+        self._stop_event.set()
+
+    def shutdown(self):
+        for backend in reversed(self.backends):
+            try:
+                backend.shutdown()
+            except Exception as e:
+                print(f"{backend.label} {backend.mqtt_path}: error during shutdown: {e}")
+        self.backends = []
+
+    def run(self):
+        """Starts every backend and blocks until stop() or SIGINT/SIGTERM."""
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
+
+        self.start()
+        print(f"\n{len(self.backends)} backend(s) running on {self.broker_address}. Press Ctrl+C to stop.")
+        try:
+            # The timeout only lets Windows deliver Ctrl+C; nothing is polled
+            while not self._stop_event.wait(1.0):
+                pass
+        finally:
+            print("\nStopping...")
+            self.shutdown()
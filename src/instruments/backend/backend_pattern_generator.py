@@ -0,0 +1,51 @@
+import InitializeCortex
+from src.instruments.codec import PATTERN_GENERATOR
+from src.instruments.backend.mqtt_backend import MqttBackend
+from src.instruments.backend.backend_host import BackendHost
+from src.instruments.backend.hardware.pattern_generator import PatternGenerator
+
+class BackendPatternGenerator(PatternGenerator, MqttBackend):
+    schema = PATTERN_GENERATOR
+    label = "Pattern"
+
+    def __init__(self, mqtt_topic: str, device="Dev1", port="port0", lines=(0, 1, 2, 3), sample_rate=100e3,
+                 trigger=None):
+        PatternGenerator.__init__(self, device=device, port=port, lines=lines, sample_rate=sample_rate,
+                                  trigger=trigger)
+        MqttBackend.__init__(self, mqtt_topic)
+        # Timing table being received ('clear' + 'pulse' commands), loaded by the next run/arm
+        self._staged = None
+        self.update_state(steps=0, repeats=0, armed=False)
+
+    def close_hardware(self):
+        self.cleanup()
+
+    def execute(self, mode: str, line: int, a: float, b: float):
+        if mode == "clear":
+            self._staged = []
+        elif mode == "pulse":
+            if self._staged is None:
+                self._staged = []
+            self._staged.append((line, a, b))
+        elif mode in ("run", "arm"):
+            # a: repeats, b: cycle period in ms (< 0: keep the loaded one).
+            # Without a new table the loaded one is replayed
+            table = self._staged if self._staged is not None else self.table
+            self._staged = None
+            if not table:
+                raise RuntimeError("No pattern loaded")
+            period_ms = b if b >= 0 else self.period_ms
+            if self.load(table, period_ms):
+                print(f"Pattern: {len(table)} pulses compiled to {len(self.samples)} samples")
+            if mode == "run":
+                self.run(int(a))
+            else:
+                self.arm(int(a))
+            self.update_state(steps=len(self.table), repeats=int(a), armed=mode == "arm")
+        elif mode == "stop":
+            self.stop()
+            self.update_state(repeats=0, armed=False)
+
+
+if __name__ == "__main__":
+    BackendHost.from_config('config/backends.json', only="pattern").run()
@@ -1,108 +1,131 @@
-import ast
-import json
-import time
-import os
-import paho.mqtt.client as mqtt
+import math
 import InitializeCortex
-from src.instruments.hardware.dcpowersupply import PowerSupply
+from src.instruments.codec import POWER_SUPPLY
+from src.instruments.backend.mqtt_backend import MqttBackend
+from src.instruments.backend.backend_host import BackendHost
+from src.instruments.backend.ramp import RampRunner, ramp_points
+from src.instruments.backend.telemetry import TelemetryPoller
+from src.instruments.backend.hardware.dcpowersupply import PowerSupply
+
+# Telemetry period while a ramp runs (progress readout), in s
+RAMP_TELEMETRY_PERIOD = 0.2
 
 # --- CLASS DEFINITION ---
-class BackendPowerSupply(PowerSupply):
-    
-    def __init__(self, ip: str, mqtt_topic: str):
-        super().__init__(ip)
-        self.mqtt_path = mqtt_topic
-        
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-
-    def open_mqtt(self):
-        # NOTE: Ensure this host is accessible from where you run the script
-        self.client.connect(host="fys-s-dep-bkr01.fysad.fys.kuleuven.be")
-        self.client.loop_start()
-    
-    def on_connect(self, client, userdata, flags, rc, props=None):
-        if rc == 0:
-            client.subscribe(self.mqtt_path)
-            print(f'PSU subscribed to {self.mqtt_path}')
-
-    def on_message(self, client, userdata, message):
-        payload_str = message.payload.decode()
-        try:
-            # Expected format: "('set', 1, 5.0)" -> mode, channel, value
-            data = ast.literal_eval(payload_str)
-            mode = data[0]
-            channel = int(data[1])
-            value = float(data[2]) if len(data) > 2 else 0.0
-            
-        except (ValueError, SyntaxError, IndexError) as e:
-            print(f"PSU Error: Wrong payload format: {payload_str} | {e}")
-            return
+class BackendPowerSupply(PowerSupply, MqttBackend):
+    schema = POWER_SUPPLY
+    label = "PSU"
+    coalesce_modes = ("set", "ramp")
+    channels = (1, 2, 3)
+
+    def __init__(self, ip: str, mqtt_topic: str, telemetry_idle_interval: float = 5.0,
+                 ramp_rate: float = 1.0, ramp_step: float = 0.1):
+        """
+        Args:
+            ramp_rate: default ramp rate in V/s, changed per channel by 'rate'
+            ramp_step: default largest ramp step in V, changed per channel by 'step'
+        """
+        PowerSupply.__init__(self, ip)
+        MqttBackend.__init__(self, mqtt_topic)
+        # Measured V/I of all channels, one joined query per tick (see PowerSupply.read_all)
+        self.telemetry = TelemetryPoller(self._read_telemetry, self.publish_telemetry,
+                                         self._lock, busy=lambda: self.queue.depth > 0,
+                                         idle_interval=telemetry_idle_interval, name=f"PSU {mqtt_topic}")
+        # Ramps and profiles run on their own timer thread, under the device lock (see ramp.py)
+        self.ramps = RampRunner(self._ramp_step, self._lock, done=self._ramp_done, name=f"PSU {mqtt_topic}")
+        self.ramp_rates = {ch: ramp_rate for ch in self.channels}
+        self.ramp_steps = {ch: ramp_step for ch in self.channels}
+        self._profiles = {ch: [] for ch in self.channels}  # Points received for the next 'profile'
+        # PowerSupply.__init__ switched every output off
+        self.update_state(**{f"ch{ch}_enable": False for ch in self.channels})
+
+    def close_hardware(self):
+        self.ramps.stop()
+        self.close()
+
+    def hardware_batch(self, commands):
+        # The whole batch goes out as one ';'-joined SCPI write
+        return self.batch()
+
+    def coalesce_key(self, commands):
+        # A waiting set or ramp of a channel is replaced by a newer set or ramp of that channel
+        key = super().coalesce_key(commands)
+        return ("setpoint",) + key[1:] if key is not None else None
+
+    def _read_telemetry(self):
+        readings = self.read_all(self.channels)
+        telemetry = {}
+        for ch, (volts, amps) in readings.items():
+            setpoint = self.state.get(f"ch{ch}_volt")
+            target = self.ramps.target(ch)
+            telemetry[ch] = (volts, amps, math.nan if setpoint is None else setpoint,
+                             math.nan if target is None else target)
+        return telemetry
+
+    def _ramp_step(self, channel: int, volts: float):
+        # Ramp thread, device lock held
+        self.set_voltage(channel, volts)
+        self.update_state(**{f"ch{channel}_volt": volts})
+
+    def _ramp_done(self, channel: int, completed: bool):
+        print(f"PSU channel {channel} ramp {'done' if completed else 'stopped'} "
+              f"at {self.state.get(f'ch{channel}_volt')}V")
+        if self.connection is not None:
+            self.publish_state()
+
+    def _start_ramp(self, channel: int, points, interval: float, delay: float):
+        self.ramps.start(channel, points, interval, delay)
+        # Progress readout while the ramp runs
+        self.telemetry.watch(max(interval, RAMP_TELEMETRY_PERIOD), duration=delay + len(points) * interval + 1.0)
 
+    def execute(self, mode: str, channel: int, value: float):
         print(f"PSU Mode: {mode}, Channel: {channel}")
-        
-        try:
-            if mode == "set":
-                print(f"Setting {value}V on channel {channel}")
-                self.set_voltage(channel, value)
-                
-            elif mode == 'enable':
-                self.enable(channel)
-                
-            elif mode == 'disable':
-                self.disable(channel)
-        except Exception as e:
-            print(f"PSU Hardware Error: {e}")
+
+        if mode == "set":
+            # The newest setpoint wins over a running ramp
+            self.ramps.cancel(channel)
+            print(f"Setting {value}V on channel {channel}")
+            self.set_voltage(channel, value)
+            self.update_state(**{f"ch{channel}_volt": value})
+
+        elif mode == 'enable':
+            self.enable(channel)
+            self.update_state(**{f"ch{channel}_enable": True})
+
+        elif mode == 'disable':
+            self.ramps.cancel(channel)
+            self.disable(channel)
+            self.update_state(**{f"ch{channel}_enable": False})
+
+        elif mode == 'watch':
+            # No instrument access: value is the requested telemetry period in s
+            self.telemetry.watch(value)
+
+        elif mode == 'rate':
+            self.ramp_rates[channel] = value
+        elif mode == 'step':
+            self.ramp_steps[channel] = value
+
+        elif mode == 'ramp':
+            start = self.read_setpoint(channel)
+            points = ramp_points(start, value, self.ramp_rates[channel], self.ramp_steps[channel])
+            interval = abs(value - start) / len(points) / self.ramp_rates[channel]
+            print(f"Ramping channel {channel} from {start}V to {value}V in {len(points)} steps of {interval:.3f}s")
+            self._start_ramp(channel, points, interval, delay=interval)
+            self.update_state(**{f"ch{channel}_ramp": value})
+
+        elif mode == 'point':
+            self._profiles[channel].append(value)
+        elif mode == 'profile':
+            # value: dwell time per point in s, the first point is written at once
+            points, self._profiles[channel] = self._profiles[channel], []
+            self._start_ramp(channel, points, value, delay=0.0)
+            self.update_state(**{f"ch{channel}_ramp": points[-1] if points else None})
+
+        elif mode == 'stop':
+            for ch in (self.channels if channel == 0 else (channel,)):
+                self.ramps.cancel(ch)
 
 # --- MAIN RUNNER LOGIC ---
 if __name__ == "__main__":
-    # This block only runs if you execute this file directly
-    # e.g., python backend_powersupply.py
-
-    json_filename = 'config/powersupplies.json'
-    
-    if not os.path.exists(json_filename):
-        print(f"Error: '{json_filename}' not found in the current directory.")
-        exit(1)
-
-    with open(json_filename, 'r') as f:
-        try:
-            psu_data_list = json.load(f)
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON: {e}")
-            exit(1)
-
-    active_psus = []
-
-    print(f"Found {len(psu_data_list)} power supplies defined.")
-
-    for entry in psu_data_list:
-        try:
-            psu_ip = entry['ip']
-            psu_id = entry['id']
-            psu_serial = entry['serialnumber']
-            
-            # Topic format: id/serialnumber
-            mqtt_topic = f"{psu_id}/{psu_serial}"
-            
-            print(f"Initializing PSU ({entry['name']}) -> IP: {psu_ip}, Topic: {mqtt_topic}")
-            
-            psu_backend = BackendPowerSupply(psu_ip, mqtt_topic)
-            psu_backend.open_mqtt()
-            
-            active_psus.append(psu_backend)
-            
-        except KeyError as e:
-            print(f"Skipping entry due to missing field: {e}")
-        except Exception as e:
-            print(f"Failed to initialize PSU {entry.get('name', 'Unknown')}: {e}")
-
-    print("\nAll Power Supplies are running background MQTT listeners.")
-    print("Press Ctrl+C to stop.")
-
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\nStopping...")
+    # Runs only the power supplies of the host config, see backend_main.py for all devices
+    BackendHost.from_config('config/backends.json', only="powersupply").run()
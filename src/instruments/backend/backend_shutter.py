@@ -1,57 +1,63 @@
-import threading
-import ast
-from typing import Any
-import paho.mqtt.client as mqtt
 import InitializeCortex
-from src.instruments.hardware.shutter import Shutter
-
-class BackendShutter(Shutter):
-
-    def __init__(self, resource_string: str, device="Dev1", channel="PFI2"):
-        super().__init__(device=device, channel=channel)
-        self.mqtt_path = resource_string
-        
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        
-    def open_mqtt(self):
-        self.client.connect(host="fys-s-dep-bkr01.fysad.fys.kuleuven.be")
-        self.client.loop_start()
-    
-    def on_connect(self, client, userdata, flags, rc, props=None):
-        if rc == 0:
-            client.subscribe(self.mqtt_path)
-            print(f'Shutter subscribed to {self.mqtt_path}')
-
-    def on_message(self, client, userdata, message):
-        payload_str = message.payload.decode()
-        try:
-            # Expected format: "('pulse', 100)" or "('open', 0)"
-            mode, value = ast.literal_eval(payload_str)
-            value = float(value)
-        except (ValueError, SyntaxError) as e:
-            print(f"Shutter Error: Wrong payload format: {payload_str} | {e}")
-            return
+from src.instruments.codec import SHUTTER
+from src.instruments.backend.mqtt_backend import MqttBackend
+from src.instruments.backend.backend_host import BackendHost
+from src.instruments.backend.hardware.shutter import Shutter
 
+class BackendShutter(Shutter, MqttBackend):
+    schema = SHUTTER
+    label = "Shutter"
+
+    def __init__(self, mqtt_topic: str, device="Dev1", channel="PFI2", counter=None, trigger=None):
+        """
+        Args:
+            counter: DAQ counter timing the pulses (e.g. "ctr0"), None for software pulses
+            trigger: PFI line that fires armed pulses (see Shutter.arm)
+        """
+        Shutter.__init__(self, device=device, channel=channel, counter=counter, trigger=trigger)
+        MqttBackend.__init__(self, mqtt_topic)
+        # Train of the next pulse/arm, set by 'count' and 'period' in the same batch
+        self._train_count = 1
+        self._train_period = None
+        # Shutter.__init__ wrote False to the line
+        self.update_state(state=False, armed=False)
+
+    def close_hardware(self):
+        self.close_shutter()
+        self.cleanup()
+
+    def _take_train(self):
+        train = (self._train_count, self._train_period)
+        self._train_count, self._train_period = 1, None
+        return train
+
+    def execute(self, mode: str, value: float):
         print(f"Shutter Mode: {mode}, Value: {value}")
-        
-        try:
-            if mode == "open":
-                self.open_shutter()
-            elif mode == "close":
-                self.close_shutter()
-            elif mode == 'pulse':
-                print(f"Pulsing shutter for {value} ms...")
-                # Daemon thread ensures it doesn't block shutdown
-                pulse_thread = threading.Thread(target=self.pulse, args=(value,), daemon=True)
-                pulse_thread.start()
-        except Exception as e:
-             print(f"Shutter Hardware Error: {e}")
-             
-             
-            
+
+        if mode == "open":
+            self.open_shutter()
+            self.update_state(state=True, armed=False)
+        elif mode == "close":
+            self.close_shutter()
+            self.update_state(state=False, armed=False)
+        elif mode == 'count':
+            self._train_count = int(value)
+        elif mode == 'period':
+            self._train_period = value
+        elif mode == 'pulse':
+            count, period = self._take_train()
+            print(f"Pulsing shutter for {value} ms x {count}...")
+            # Hardware timed: returns once the counter runs, no thread per pulse
+            self.pulse(value, count, period)
+            self.update_state(state=False, armed=False)
+        elif mode == 'arm':
+            self.arm(value, *self._take_train())
+            self.update_state(state=False, armed=True)
+        elif mode == 'disarm':
+            self.disarm()
+            self.update_state(armed=False)
+
+
 if __name__ == "__main__":
-    shutter = BackendShutter(resource_string = "shutter/0000", mqtt_topic = topic)
-    awg.open_mqtt()
-    while True: continue
+    shutter = BackendShutter(mqtt_topic="shutter/0000", counter="ctr0")
+    BackendHost([shutter]).run()
@@ -0,0 +1,178 @@
+"""
+Bounded command queue with a dedicated worker thread, one per backend device.
+
+The MQTT network thread only decodes and calls put(); slow instrument I/O runs
+on the worker, so a 3-5 s VISA timeout no longer stalls keepalives or the
+other devices sharing the connection.
+
+Back-pressure policies:
+    REJECT       queue full -> the new command is refused
+    DROP_OLDEST  queue full -> the oldest waiting command is discarded
+    COALESCE     a waiting command with the same key is replaced by the new one
+                 (last value wins); queue full and nothing to replace -> refused
+
+Keyless commands are ordering barriers: nothing is coalesced across them.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Hashable, Optional
+
+REJECT = "reject"
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+POLICIES = (REJECT, DROP_OLDEST, COALESCE)
+
+
+class _Entry:
+    __slots__ = ("item", "key", "enqueued")
+
+    def __init__(self, item, key, enqueued):
+        self.item = item
+        self.key = key
+        self.enqueued = enqueued
+
+
+class CommandQueue:
+    def __init__(self, handler: Callable[[Any], None], name: str = "commands", maxsize: int = 64,
+                 policy: str = COALESCE,
+                 on_discard: Optional[Callable[[Any, str], None]] = None,
+                 merge: Optional[Callable[[Any, Any], Any]] = None):
+        """
+        Args:
+            handler: called on the worker thread for every item
+            maxsize: maximum number of waiting items
+            policy: REJECT, DROP_OLDEST or COALESCE
+            on_discard: called with (item, reason) for dropped items
+            merge: merge(old, new) -> item stored when coalescing (default: new)
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}, must be one of {POLICIES}")
+        self.handler = handler
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.on_discard = on_discard
+        self.merge = merge
+
+        self._queue = deque()
+        self._latest = {}  # key -> waiting _Entry, reset at every barrier
+        self._cond = threading.Condition()
+        self._running = True
+
+        # --- Metrics ---
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_service_time = 0.0
+        self.max_service_time = 0.0
+        self.total_service_time = 0.0
+        self.total_wait_time = 0.0
+
+        self._worker = threading.Thread(target=self._run, name=f"{name}-worker", daemon=True)
+        self._worker.start()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, item, key: Optional[Hashable] = None) -> bool:
+        """Queues an item. Returns False if it was refused (queue full or stopped)."""
+        discarded = None
+        with self._cond:
+            if not self._running:
+                return False
+
+            if key is not None and self.policy == COALESCE:
+                entry = self._latest.get(key)
+                if entry is not None:
+                    entry.item = self.merge(entry.item, item) if self.merge else item
+                    self.coalesced += 1
+                    return True
+
+            if len(self._queue) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    oldest = self._queue.popleft()
+                    if oldest.key is not None and self._latest.get(oldest.key) is oldest:
+                        del self._latest[oldest.key]
+                    discarded = oldest.item
+                    self.dropped += 1
+                else:
+                    self.rejected += 1
+                    return False
+
+            entry = _Entry(item, key, time.monotonic())
+            self._queue.append(entry)
+            if key is None:
+                self._latest.clear()  # Barrier
+            else:
+                self._latest[key] = entry
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            self._cond.notify()
+
+        if discarded is not None and self.on_discard:
+            self.on_discard(discarded, "dropped: queue full")
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:
+                    return  # Stopped and drained
+                entry = self._queue.popleft()
+                if entry.key is not None and self._latest.get(entry.key) is entry:
+                    del self._latest[entry.key]
+
+            start = time.monotonic()
+            try:
+                self.handler(entry.item)
+            except Exception as e:
+                self.failed += 1
+                print(f"[{self.name}] Worker error: {e}")
+            service_time = time.monotonic() - start
+
+            self.processed += 1
+            self.last_service_time = service_time
+            self.max_service_time = max(self.max_service_time, service_time)
+            self.total_service_time += service_time
+            self.total_wait_time += start - entry.enqueued
+
+    def stop(self, drain: bool = True, timeout: Optional[float] = None):
+        """Stops the worker, after finishing the waiting items if `drain`."""
+        with self._cond:
+            self._running = False
+            if not drain:
+                discarded = [entry.item for entry in self._queue]
+                self._queue.clear()
+                self._latest.clear()
+            else:
+                discarded = []
+            self._cond.notify_all()
+        if self.on_discard:
+            for item in discarded:
+                self.on_discard(item, "dropped: backend stopping")
+        self._worker.join(timeout)
+
+    def stats(self) -> dict:
+        processed = self.processed or 1
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "service_time_last": self.last_service_time,
+            "service_time_max": self.max_service_time,
+            "service_time_mean": self.total_service_time / processed,
+            "wait_time_mean": self.total_wait_time / processed,
+        }
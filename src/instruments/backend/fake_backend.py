@@ -1,63 +1,120 @@
+import json
+import math
+import os
 import time
 import random
 import threading
 import re
+import numpy as np
 import paho.mqtt.client as mqtt
 from collections import defaultdict
+from src.instruments.frame_ring import FrameRing
+from src.instruments.backend.ramp import RampRunner, ramp_points
+from src.instruments.topic_router import TopicRouter
+from src.instruments.codec import (AWG, FRAME_INLINE, FRAME_SHARED, PATTERN_GENERATOR, POWER_SUPPLY, SHUTTER,
+                                   ack_topic, arb_topic, decode_arb, encode_frame, frame_topic, read_correlation_id,
+                                   state_topic, telemetry_topic)
 
 class InstrumentSimulator:
     def __init__(self, client: mqtt.Client):
         self.client = client
         self.state = {}
+        self.snapshot = {}  # Retained state, see publish_state
 
     def tick(self):
         """Called periodically to publish updates if needed."""
         pass
 
-    def on_message(self, topic: str, payload: str):
-        """Handle incoming commands."""
+    def on_message(self, topic: str, payload: bytes):
+        """Handle incoming commands (raw payload bytes)."""
         pass
 
+    def close(self):
+        """Releases what the simulator allocated (called by FakeBackend.stop)."""
+        pass
+
+    def publish_state(self, topic: str, **values):
+        """Retained snapshot like MqttBackend.publish_state (names as in the GUI plugins)."""
+        self.snapshot.update(values)
+        payload = json.dumps({"timestamp": time.time(), "values": self.snapshot})
+        self.client.publish(state_topic(topic), payload, retain=True)
+
+    def acknowledge(self, topic: str, schema, payload: bytes, error: str = '', value: float = math.nan):
+        """Answers a command like the real backends do (see MqttBackend.publish_ack)."""
+        correlation_id = read_correlation_id(payload)
+        if correlation_id:
+            now = time.time()
+            self.client.publish(ack_topic(topic), schema.encode_ack(correlation_id, now, now, now, error, value))
+
 
 class SimulatedCamera(InstrumentSimulator):
-    def __init__(self, client):
+    def __init__(self, client, shape=(256, 256), shared=True):
         super().__init__(client)
         self.topic = "HAMAMATSU/0000"
+        self.shape = shape
+        # Frames go through a shared-memory ring (same host) or inline in the message
+        self.ring = FrameRing.create(f"cortex_hamamatsu_{os.getpid()}", shape, "uint16") if shared else None
+        # Two fluorescence spots on a dark background (ROIs of the camera plugin)
+        y, x = np.mgrid[0:shape[0], 0:shape[1]]
+        self.spots = 800.0 * (np.exp(-((x - 104) ** 2 + (y - 104) ** 2) / 18.0) +
+                              np.exp(-((x - 152) ** 2 + (y - 104) ** 2) / 18.0))
 
     def tick(self):
-        # Publish random count
-        count = int(random.gauss(500, 50))
-        if count < 0: count = 0
-        self.client.publish(self.topic, str(count))
+        timestamp = time.time()
+        frame = np.random.poisson(self.spots + 100.0).astype(np.uint16)
+        if self.ring is not None:
+            slot, sequence = self.ring.write(frame, timestamp)
+            payload = encode_frame(FRAME_SHARED, self.ring.dtype.str, *self.shape, slot, sequence, timestamp,
+                                   self.ring.name)
+        else:
+            payload = encode_frame(FRAME_INLINE, frame.dtype.str, *self.shape, 0, 0, timestamp, frame.data)
+        self.client.publish(frame_topic(self.topic), payload)
+
+        # Publish the total count as before
+        self.client.publish(self.topic, str(int(frame.sum(dtype=np.int64))), retain=True)
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
 
 
 class SimulatedWavemeter(InstrumentSimulator):
-    def __init__(self, client, channels=8):
+    def __init__(self, client, channels=8, batched=True):
         super().__init__(client)
         self.channels = channels
+        self.batched = batched  # One "[timestamp, ch1, ..., chN]" message per tick instead of N
         self.base_topic = "HFWM/8731"
         self.setpoints = {ch: 300.0 for ch in range(1, channels+1)}
 
     def tick(self):
         timestamp = time.time()
+        values = []
         for ch in range(1, self.channels + 1):
             # Simulate drifting around setpoint
             # Drift logic: random walk or just noise around setpoint
             noise = (random.random() - 0.5) * 0.0001
-            current_freq = self.setpoints[ch] + noise
+            values.append(self.setpoints[ch] + noise)
+
+        if self.batched:
+            # Format: "[timestamp, ch1, ch2, ...]" on HFWM/8731/frequency/all
+            payload = "[" + ", ".join([str(timestamp)] + [f"{v:.6f}" for v in values]) + "]"
+            self.client.publish(f"{self.base_topic}/frequency/all", payload, retain=True)
+            return
 
+        for ch, current_freq in enumerate(values, start=1):
             # Format: "[timestamp, value]"
             payload = f"[{timestamp}, {current_freq:.6f}]"
             topic = f"{self.base_topic}/frequency/{ch}"
-            self.client.publish(topic, payload)
+            self.client.publish(topic, payload, retain=True)
 
-    def on_message(self, topic: str, payload: str):
-        # Topic format: HFWM/8731/setpoint/{ch}
+    def on_message(self, topic: str, payload: bytes):
+        # Topic format: HFWM/8731/setpoint/{ch}, payload is the plain number
         if "setpoint" in topic:
             try:
                 parts = topic.split('/')
                 ch = int(parts[-1])
-                val = float(payload)
+                val = float(payload.decode())
                 self.setpoints[ch] = val
                 print(f"[FakeBackend] Wavemeter Ch{ch} setpoint -> {val}")
             except Exception as e:
@@ -71,34 +128,82 @@ class SimulatedPowerSupply(InstrumentSimulator):
         self.channels = channels
         self.voltages = {ch: 0.0 for ch in range(1, channels+1)}
         self.enabled = {ch: False for ch in range(1, channels+1)}
+        # Ramps run like in BackendPowerSupply, with the same runner
+        self.rates = {ch: 1.0 for ch in range(1, channels+1)}
+        self.steps = {ch: 0.1 for ch in range(1, channels+1)}
+        self.profiles = {ch: [] for ch in range(1, channels+1)}
+        self.ramps = RampRunner(self._ramp_step, threading.Lock(),
+                                done=lambda ch, completed: self.publish_state(self.topic_base),
+                                name=f"Sim PSU {self.topic_base}")
+        self.publish_state(self.topic_base, **{f"ch{ch}_enable": False for ch in self.enabled})
+
+    def _ramp_step(self, ch, volts):
+        self.voltages[ch] = volts
+        self.snapshot[f"ch{ch}_volt"] = volts
+
+    def close(self):
+        self.ramps.stop()
+
+    def tick(self):
+        # Measured V/I like BackendPowerSupply's telemetry: setpoint + noise, 10 mA load when on
+        readings = {}
+        for ch in range(1, self.channels + 1):
+            volts = self.voltages[ch] + random.gauss(0, 0.001) if self.enabled[ch] else 0.0
+            amps = 0.01 + random.gauss(0, 0.0001) if self.enabled[ch] else 0.0
+            target = self.ramps.target(ch)
+            readings[ch] = (volts, amps, self.voltages[ch], float('nan') if target is None else target)
+        self.client.publish(telemetry_topic(self.topic_base), POWER_SUPPLY.encode_telemetry(time.time(), readings),
+                            retain=True)
 
     def on_message(self, topic, payload):
         if topic != self.topic_base:
             return
 
-        # Payload format: "('set', ch, val)" or "('enable', ch, 0)"
-        # We need to parse this string tuple
+        # Payload: POWER_SUPPLY frame -> ('set', ch, val) or ('enable', ch, 0), or a batch
         try:
-            # Safe eval or regex
-            # payload is string like "('set', 1, 5.0)"
-            # Let's remove parens and split
-            content = payload.strip("()").replace("'", "").split(", ")
-            cmd = content[0]
-            ch = int(content[1])
-            val = float(content[2])
-
-            if cmd == "set":
-                self.voltages[ch] = val
-                print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Set {val}V")
-            elif cmd == "enable":
-                self.enabled[ch] = True
-                print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Enabled")
-            elif cmd == "disable":
-                self.enabled[ch] = False
-                print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Disabled")
-
+            for cmd, ch, val in POWER_SUPPLY.decode_batch(payload):
+                self.execute(cmd, ch, val)
         except Exception as e:
-            print(f"[FakeBackend] PSU Parse Error: {e} | Payload: {payload}")
+            print(f"[FakeBackend] PSU Parse Error: {e} | Payload: {payload!r}")
+            self.acknowledge(topic, POWER_SUPPLY, payload, str(e))
+            return
+        self.acknowledge(topic, POWER_SUPPLY, payload)
+
+    def execute(self, cmd, ch, val):
+        if cmd == "set":
+            self.ramps.cancel(ch)
+            self.voltages[ch] = val
+            print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Set {val}V")
+            self.publish_state(self.topic_base, **{f"ch{ch}_volt": val})
+        elif cmd == "enable":
+            self.enabled[ch] = True
+            print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Enabled")
+            self.publish_state(self.topic_base, **{f"ch{ch}_enable": True})
+        elif cmd == "disable":
+            self.ramps.cancel(ch)
+            self.enabled[ch] = False
+            print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Disabled")
+            self.publish_state(self.topic_base, **{f"ch{ch}_enable": False})
+        elif cmd == "watch":
+            pass  # Telemetry goes out at the global tick rate
+        elif cmd == "rate":
+            self.rates[ch] = val
+        elif cmd == "step":
+            self.steps[ch] = val
+        elif cmd == "ramp":
+            points = ramp_points(self.voltages[ch], val, self.rates[ch], self.steps[ch])
+            interval = abs(val - self.voltages[ch]) / len(points) / self.rates[ch]
+            print(f"[FakeBackend] PSU {self.topic_base} Ch{ch} Ramp to {val}V in {len(points)} steps")
+            self.ramps.start(ch, points, interval, delay=interval)
+            self.publish_state(self.topic_base, **{f"ch{ch}_ramp": val})
+        elif cmd == "point":
+            self.profiles[ch].append(val)
+        elif cmd == "profile":
+            points, self.profiles[ch] = self.profiles[ch], []
+            self.ramps.start(ch, points, val)
+        elif cmd == "stop":
+            for c in (self.voltages if ch == 0 else (ch,)):
+                self.ramps.cancel(c)
 
 
 class SimulatedAWG(InstrumentSimulator):
@@ -108,32 +213,72 @@ class SimulatedAWG(InstrumentSimulator):
         self.freq = 10.0
         self.ampl = 100.0
         self.output = False
+        self.publish_state(self.topic, output=self.output, frequency=self.freq, amplitude=self.ampl)
 
     def on_message(self, topic, payload):
+        if topic == arb_topic(self.topic):
+            self.on_arb(payload)
+            return
         if topic != self.topic:
             return
 
+        value = math.nan
         try:
-            # Payload: "('freq', 15.5)"
-            content = payload.strip("()").replace("'", "").split(", ")
-            cmd = content[0]
-            val = float(content[1])
-
-            if cmd == "freq":
-                self.freq = val
-                print(f"[FakeBackend] AWG Freq -> {val} MHz")
-            elif cmd == "ampl":
-                self.ampl = val
-                print(f"[FakeBackend] AWG Ampl -> {val} mV")
-            elif cmd == "enable":
-                self.output = True
-                print("[FakeBackend] AWG Output ON")
-            elif cmd == "disable":
-                self.output = False
-                print("[FakeBackend] AWG Output OFF")
-
+            # Payload: AWG frame -> ('freq', 15.5), or a batch
+            for cmd, val in AWG.decode_batch(payload):
+                result = self.execute(cmd, val)
+                if result is not None:
+                    value = result
         except Exception as e:
             print(f"[FakeBackend] AWG Parse Error: {e}")
+            self.acknowledge(topic, AWG, payload, str(e))
+            return
+        self.acknowledge(topic, AWG, payload, value=value)
+
+    def on_arb(self, payload):
+        try:
+            arb = decode_arb(payload)
+            points = np.frombuffer(arb.points, dtype='<f4')
+            if not 2 <= len(points) <= 8192:
+                raise ValueError(f"ARB waveforms have 2 to 8192 points, got {len(points)}")
+        except Exception as e:
+            print(f"[FakeBackend] AWG ARB Error: {e}")
+            self.acknowledge(self.topic, AWG, payload, str(e))
+            return
+        print(f"[FakeBackend] AWG ARB{arb.slot} <- {len(points)} points")
+        self.publish_state(self.topic, **{f"arb{arb.slot}_points": len(points)})
+        self.acknowledge(self.topic, AWG, payload)
+
+    def execute(self, cmd, val):
+        if cmd == "freq":
+            self.freq = val
+            print(f"[FakeBackend] AWG Freq -> {val} MHz")
+            self.publish_state(self.topic, frequency=val)
+        elif cmd == "ampl":
+            self.ampl = val
+            print(f"[FakeBackend] AWG Ampl -> {val} mV")
+            self.publish_state(self.topic, amplitude=val)
+        elif cmd == "enable":
+            self.output = True
+            print("[FakeBackend] AWG Output ON")
+            self.publish_state(self.topic, output=True)
+        elif cmd == "disable":
+            self.output = False
+            print("[FakeBackend] AWG Output OFF")
+            self.publish_state(self.topic, output=False)
+        elif cmd in ("sweep_start", "sweep_stop", "sweep_time"):
+            print(f"[FakeBackend] AWG {cmd} -> {val}")
+            self.publish_state(self.topic, **{cmd: val})
+        elif cmd == "sweep_mode":
+            self.publish_state(self.topic, sweep_log=bool(val))
+        elif cmd == "sweep":
+            print(f"[FakeBackend] AWG Sweep {'ON' if val else 'OFF'}")
+            self.publish_state(self.topic, sweep=bool(val))
+        elif cmd == "trigger":
+            started = time.time()
+            print("[FakeBackend] AWG Sweep triggered")
+            self.publish_state(self.topic, sweep_triggered=started)
+            return started
 
 
 class SimulatedShutter(InstrumentSimulator):
@@ -141,58 +286,123 @@ class SimulatedShutter(InstrumentSimulator):
         super().__init__(client)
         self.topic = "shutter/0000"
         self.state = "closed"
+        self.train = (1, None)  # (count, period ms) of the next pulse/arm
+        self.publish_state(self.topic, state=False, armed=False)
 
     def on_message(self, topic, payload):
         if topic != self.topic:
             return
 
         try:
-            content = payload.strip("()").replace("'", "").split(", ")
-            cmd = content[0]
-            val = float(content[1]) # Duration or dummy
-
-            if cmd == "open":
-                self.state = "open"
-                print("[FakeBackend] Shutter OPEN")
-            elif cmd == "close":
-                self.state = "closed"
-                print("[FakeBackend] Shutter CLOSED")
-            elif cmd == "pulse":
-                print(f"[FakeBackend] Shutter PULSE {val}ms")
-                # Could simulate async pulse but minimal for now
-
+            # Payload: SHUTTER frame -> ('pulse', ms), value is duration or dummy, or a batch
+            for cmd, val in SHUTTER.decode_batch(payload):
+                self.execute(cmd, val)
         except Exception as e:
             print(f"[FakeBackend] Shutter Parse Error: {e}")
+            self.acknowledge(topic, SHUTTER, payload, str(e))
+            return
+        self.acknowledge(topic, SHUTTER, payload)
+
+    def execute(self, cmd, val):
+        if cmd == "open":
+            self.state = "open"
+            print("[FakeBackend] Shutter OPEN")
+            self.publish_state(self.topic, state=True, armed=False)
+        elif cmd == "close":
+            self.state = "closed"
+            print("[FakeBackend] Shutter CLOSED")
+            self.publish_state(self.topic, state=False, armed=False)
+        elif cmd == "count":
+            self.train = (int(val), self.train[1])
+        elif cmd == "period":
+            self.train = (self.train[0], val)
+        elif cmd in ("pulse", "arm"):
+            (count, period), self.train = self.train, (1, None)
+            if count > 1 and (not period or period <= val):
+                raise ValueError(f"Pulse period ({period} ms) must be longer than the pulse ({val} ms)")
+            print(f"[FakeBackend] Shutter {cmd.upper()} {val}ms x {count}")
+            self.state = "closed"
+            self.publish_state(self.topic, state=False, armed=cmd == "arm")
+        elif cmd == "disarm":
+            print("[FakeBackend] Shutter DISARM")
+            self.publish_state(self.topic, armed=False)
+
+
+class SimulatedPatternGenerator(InstrumentSimulator):
+    def __init__(self, client):
+        super().__init__(client)
+        self.topic = "pattern/0000"
+        self.table = []
+        self.period = 0.0
+        self.staged = None
+        self.publish_state(self.topic, steps=0, repeats=0, armed=False)
+
+    def on_message(self, topic, payload):
+        if topic != self.topic:
+            return
+
+        try:
+            # Payload: a batch ('clear', 'pulse' x n, 'run'), or a lone 'run' / 'stop'
+            for cmd, line, a, b in PATTERN_GENERATOR.decode_batch(payload):
+                self.execute(cmd, line, a, b)
+        except Exception as e:
+            print(f"[FakeBackend] Pattern Parse Error: {e}")
+            self.acknowledge(topic, PATTERN_GENERATOR, payload, str(e))
+            return
+        self.acknowledge(topic, PATTERN_GENERATOR, payload)
+
+    def execute(self, cmd, line, a, b):
+        if cmd == "clear":
+            self.staged = []
+        elif cmd == "pulse":
+            if b <= a or a < 0:
+                raise ValueError(f"Line {line}: invalid pulse {a}..{b} ms")
+            self.staged = (self.staged or []) + [(line, a, b)]
+        elif cmd in ("run", "arm"):
+            if self.staged is not None:
+                self.table, self.staged = self.staged, None
+            if not self.table:
+                raise RuntimeError("No pattern loaded")
+            if b >= 0:
+                self.period = b  # Otherwise the period of the loaded table is kept
+            cycle = max(self.period, max(t_off for _, _, t_off in self.table))
+            print(f"[FakeBackend] Pattern {cmd.upper()} {len(self.table)} pulses, {cycle} ms x {int(a)}")
+            self.publish_state(self.topic, steps=len(self.table), repeats=int(a), armed=cmd == "arm")
+        elif cmd == "stop":
+            print("[FakeBackend] Pattern STOP")
+            self.publish_state(self.topic, repeats=0, armed=False)
 
 
 class FakeBackend:
-    def __init__(self):
-        # Create a client that connects to the Mock Broker (patched in sys.modules)
-        # We assume the environment is already patched or we are using mock directly.
-        # But 'import paho.mqtt.client' should return the mock class if patched.
-        self.client = mqtt.Client("FakeBackend")
+    def __init__(self, broker_address: str = "localhost", port: int = 1883):
+        # Create a client that connects to the Mock Broker (patched in sys.modules),
+        # or to a real broker such as tests/local_broker.py when paho is not patched.
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2, client_id="FakeBackend")
+        self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
 
-        # Connect to "localhost" (Mock ignores this)
-        self.client.connect("localhost")
-        self.running = False
-
         # Initialize Simulators
         self.simulators = []
+        # Command topic -> simulator, so a message only reaches the simulator it is for
+        self.router = TopicRouter()
+
+        # Connect to "localhost" (Mock ignores this)
+        self.client.connect(broker_address, port)
+        self.running = False
+        self._wake = threading.Event()
+        self._run_thread = None  # thread inside run(), joined by stop()
 
         # 1. Camera
-        self.simulators.append(SimulatedCamera(self.client))
+        self.add_simulator(SimulatedCamera(self.client))
 
         # 2. Wavemeter (Multi-channel)
         # Listens to HFWM/8731/setpoint/#
         wm = SimulatedWavemeter(self.client)
-        self.simulators.append(wm)
-        self.client.subscribe("HFWM/8731/setpoint/#")
+        self.add_simulator(wm, "HFWM/8731/setpoint/#")
 
         # 3. AWG
         awg = SimulatedAWG(self.client)
-        self.simulators.append(awg)
-        self.client.subscribe("TG2511A/0000")
+        self.add_simulator(awg, "TG2511A/0000", arb_topic("TG2511A/0000"))
 
         # 4. Power Supplies
         # Config matches powersupplylist.json created earlier
@@ -204,35 +414,71 @@ class FakeBackend:
         ]
         for pid, sn in psus:
             psu = SimulatedPowerSupply(self.client, pid, sn)
-            self.simulators.append(psu)
-            self.client.subscribe(f"{pid}/{sn}")
+            self.add_simulator(psu, f"{pid}/{sn}")
 
         # 5. Shutter
         shutter = SimulatedShutter(self.client)
-        self.simulators.append(shutter)
-        self.client.subscribe("shutter/0000")
+        self.add_simulator(shutter, "shutter/0000")
+
+        # 6. Pattern generator
+        self.add_simulator(SimulatedPatternGenerator(self.client), "pattern/0000")
+
+    def add_simulator(self, sim: InstrumentSimulator, *topic_filters: str):
+        """Registers a simulator and subscribes it to its command topics."""
+        self.simulators.append(sim)
+        for topic_filter in topic_filters:
+            if self.router.add(topic_filter, sim):
+                self.client.subscribe(topic_filter)
+
+    def on_connect(self, client, userdata, flags, rc, props=None):
+        # (Re)subscribe every command topic, also after a reconnect
+        for topic_filter in self.router.filters():
+            client.subscribe(topic_filter)
 
     def on_message(self, client, userdata, msg):
         topic = msg.topic
         payload = msg.payload
-        if isinstance(payload, bytes):
-            payload = payload.decode()
+        if isinstance(payload, str):
+            payload = payload.encode()
 
-        # Route to simulators
-        for sim in self.simulators:
+        # Route to the simulators subscribed to this topic
+        for sim in self.router.match(topic):
             sim.on_message(topic, payload)
 
     def run(self):
         self.running = True
+        self._run_thread = threading.current_thread()
         print(">> [FakeBackend] Started. Simulating devices...")
         self.client.loop_start()
 
         while self.running:
             for sim in self.simulators:
                 sim.tick()
-            time.sleep(1.0) # Global tick rate
+            self._wake.wait(1.0) # Global tick rate
 
     def stop(self):
         self.running = False
+        self._wake.set()
+        # Let the tick in progress finish before the simulators (camera frame ring) are closed
+        if self._run_thread is not None and self._run_thread is not threading.current_thread():
+            self._run_thread.join()
         self.client.loop_stop()
+        for sim in self.simulators:
+            sim.close()
         print(">> [FakeBackend] Stopped.")
+
+
+if __name__ == "__main__":
+    # Standalone simulator, e.g. against tests/local_broker.py:
+    #   python -m src.instruments.backend.fake_backend --broker localhost
+    import argparse
+    parser = argparse.ArgumentParser(description="Simulated CORTEX instruments.")
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+
+    backend = FakeBackend(args.broker, args.port)
+    try:
+        backend.run()
+    except KeyboardInterrupt:
+        backend.stop()
@@ -1,10 +1,12 @@
 # tg2511a_controller.py
 # Python class for controlling Tektronix TG2511A AWG via PyVISA
 
-import pyvisa
 import time
 import numpy as np
-from typing import Optional, Union
+from contextlib import contextmanager
+from typing import List, Optional, Union
+from src.instruments.backend.hardware.state_cache import StateCache
+from src.instruments.backend.hardware.visa_pool import get_session, release_session
 
 AWG_RESSOURCE = "TCPIP0::192.168.1.209::9221::SOCKET"
 
@@ -23,6 +25,16 @@ class TG2511A:
     
     # Modulation types
     MOD_TYPES = ['OFF', 'AM', 'FM', 'PM', 'FSK', 'SUM', 'BPSK', 'PWM']
+
+    # Longest ';'-joined message sent at once (longer batches are split)
+    MAX_MESSAGE_LENGTH = 256
+
+    # ARB memories: 14-bit DAC codes (sent as signed 16-bit words), 2 to 8192 points
+    ARB_DAC_MAX = 8191
+    ARB_MIN_POINTS = 2
+    ARB_MAX_POINTS = 8192
+    # Bytes per raw write of a binary block
+    ARB_CHUNK_SIZE = 4096
     
     def __init__(self, resource_string: str):
         """
@@ -34,98 +46,258 @@ class TG2511A:
                 - 'USB0::0x1234::0x5678::SN123456::INSTR' (USB)
                 - 'GPIB0::5::INSTR' (GPIB, default address is 5)
         """
-        self.rm = pyvisa.ResourceManager()
+        self._batch: Optional[List[str]] = None
+        # Configure for LAN socket communication if using TCPIP SOCKET
+        read_termination = '\n' if 'SOCKET' in resource_string else '\r\n'
+        # Shared, reconnecting session (see visa_pool.py), 5 second timeout
+        self.instr = get_session(resource_string, timeout=5000,
+                                 read_termination=read_termination, write_termination='\n')
+        # Last commanded settings: setters skip values the instrument already has
+        self.cache = StateCache(resource_string, generation=lambda: self.instr.generation)
         try:
-            self.instr = self.rm.open_resource(resource_string)
-            
-            # Configure for LAN socket communication if using TCPIP SOCKET
-            if 'SOCKET' in resource_string:
-                self.instr.read_termination = '\n'
-                self.instr.write_termination = '\n'
-            else:
-                self.instr.read_termination = '\r\n'
-                self.instr.write_termination = '\n'
-            
-            self.instr.timeout = 5000  # 5 second timeout
-            
             # Verify connection
             idn = self.query('*IDN?')
             print(f"Connected to: {idn}")
             
         except Exception as e:
             print(f"Error connecting to instrument: {e}")
+            release_session(self.instr)
             raise
     
     def write(self, command: str):
-        """Send command to instrument"""
-        self.instr.write(command)
+        """Send command to instrument, or buffer it while a batch() block is open"""
+        if self._batch is not None:
+            self._batch.append(command)
+        else:
+            self.instr.write(command)
+    
+    def _flush(self):
+        """Send the commands buffered by batch() so far (the batch stays open)"""
+        if self._batch:
+            pending, self._batch[:] = list(self._batch), []
+            for message in self._join(pending):
+                self.instr.write(message)
     
     def query(self, command: str) -> str:
-        """Send query and return response"""
+        """Send query and return response (commands buffered by batch() go out in the same message)"""
+        if self._batch:
+            pending, self._batch[:] = list(self._batch), []
+            *messages, last = self._join(pending + [command])
+            for message in messages:
+                self.instr.write(message)
+            return self.instr.query(last).strip()
         return self.instr.query(command).strip()
+
+    @contextmanager
+    def batch(self, sync: bool = False, check_errors: bool = False):
+        """
+        Sends all writes made inside the block as one ';'-joined message
+        (one socket round trip instead of one per setter):
+
+            with awg.batch(sync=True):
+                awg.set_frequency(1e6)
+                awg.set_amplitude(0.5)
+                awg.output_on()
+
+        Args:
+            sync: end the message with *OPC? and wait for it, so the block
+                  returns once the instrument has applied every setting
+            check_errors: read the error queue once after the batch and raise
+                          RuntimeError if it is not empty
+
+        Nothing is sent if the block raises. Nested blocks join the outer batch.
+        """
+        if self._batch is not None:
+            yield self  # Already batching: join the outer batch
+            return
+        self._batch = []
+        # Values cached inside the block are forgotten if it is not sent
+        with self.cache.transaction():
+            try:
+                yield self
+                commands = self._batch
+            finally:
+                self._batch = None
+
+            if commands:
+                if sync:
+                    # *OPC? is joined like any command, so the last message respects MAX_MESSAGE_LENGTH too
+                    *messages, last = self._join(commands + ["*OPC?"])
+                    for message in messages:
+                        self.instr.write(message)
+                    self.instr.query(last)
+                else:
+                    for message in self._join(commands):
+                        self.instr.write(message)
+        if check_errors:
+            errors = self.get_errors()
+            if errors:
+                raise RuntimeError(f"TG2511A reported: {'; '.join(errors)}")
+
+    def _join(self, commands: List[str]) -> List[str]:
+        """Groups commands into ';'-joined messages of at most MAX_MESSAGE_LENGTH characters."""
+        messages, current = [], ""
+        for command in commands:
+            if current and len(current) + 1 + len(command) > self.MAX_MESSAGE_LENGTH:
+                messages.append(current)
+                current = command
+            else:
+                current = f"{current};{command}" if current else command
+        messages.append(current)
+        return messages
     
+    def _write_setting(self, key: str, value, command: str, force: bool):
+        """Send command unless value is already the last one written for key (see state_cache.py)"""
+        if not self.cache.hit(key, value, force):
+            self.write(command)
+            self.cache.store(key, value)
+
     def close(self):
         """Close connection to instrument"""
-        self.instr.close()
-        self.rm.close()
+        release_session(self.instr)
     
     # Basic waveform control
     
-    def set_waveform(self, waveform: str):
+    # Setters skip values the instrument already has; force=True always writes. Output off is never skipped
+    
+    def set_waveform(self, waveform: str, force: bool = False):
         """Set output waveform type"""
         if waveform.upper() not in self.WAVEFORMS:
             raise ValueError(f"Invalid waveform. Must be one of {self.WAVEFORMS}")
-        self.write(f"WAVE {waveform.upper()}")
+        self._write_setting("waveform", waveform.upper(), f"WAVE {waveform.upper()}", force)
     
-    def set_frequency(self, freq_hz: float):
+    def set_frequency(self, freq_hz: float, force: bool = False):
         """Set output frequency in Hz (1µHz to 25MHz)"""
-        self.write(f"FREQ {freq_hz}")
+        self._write_setting("frequency", freq_hz, f"FREQ {freq_hz}", force)
     
-    def set_amplitude(self, amplitude_vpp: float):
+    def set_amplitude(self, amplitude_vpp: float, force: bool = False):
         """Set output amplitude in Vpp (0.01 to 10 Vpp into 50Ω)"""
-        self.write(f"AMPL {amplitude_vpp}")
+        self._write_setting("amplitude", amplitude_vpp, f"AMPL {amplitude_vpp}", force)
     
-    def set_offset(self, offset_v: float):
+    def set_offset(self, offset_v: float, force: bool = False):
         """Set DC offset in volts (±10V)"""
-        self.write(f"DCOFFS {offset_v}V")
+        self._write_setting("offset", offset_v, f"DCOFFS {offset_v}V", force)
     
-    def set_phase(self, phase_deg: float):
+    def set_phase(self, phase_deg: float, force: bool = False):
         """Set waveform phase (-360 to +360 degrees)"""
-        self.write(f"PHASE {phase_deg}DEG")
+        self._write_setting("phase", phase_deg, f"PHASE {phase_deg}DEG", force)
     
-    def output_on(self):
+    def output_on(self, force: bool = False):
         """Turn output ON"""
-        self.write("OUTPUT ON")
+        self._write_setting("output", True, "OUTPUT ON", force)
     
     def output_off(self):
-        """Turn output OFF"""
-        self.write("OUTPUT OFF")
+        """Turn output OFF (always written, never skipped by the cache)"""
+        self._write_setting("output", False, "OUTPUT OFF", force=True)
     
     # Sweep
     
-    def enable_sweep(self, enable: bool = True):
+    def enable_sweep(self, enable: bool = True, force: bool = False):
         """Enable/disable frequency sweep"""
-        self.write(f"SWP {'ON' if enable else 'OFF'}")
+        self._write_setting("sweep", enable, f"SWP {'ON' if enable else 'OFF'}", force)
     
-    def set_sweep_range(self, start_hz: float, stop_hz: float):
+    def set_sweep_range(self, start_hz: float, stop_hz: float, force: bool = False):
         """Set sweep start and stop frequencies"""
-        self.write(f"SWPFRQSTA {start_hz}HZ")
-        self.write(f"SWPFRQSTP {stop_hz}HZ")
+        self._write_setting("sweep_start", start_hz, f"SWPFRQSTA {start_hz}HZ", force)
+        self._write_setting("sweep_stop", stop_hz, f"SWPFRQSTP {stop_hz}HZ", force)
     
-    def set_sweep_time(self, time_sec: float):
+    def set_sweep_time(self, time_sec: float, force: bool = False):
         """Set sweep time (1ms to 500s)"""
-        self.write(f"SWPTIM {time_sec}S")
+        self._write_setting("sweep_time", time_sec, f"SWPTIM {time_sec}S", force)
     
-    def set_sweep_mode(self, mode: str):
+    def set_sweep_mode(self, mode: str, force: bool = False):
         """Set sweep mode: 'LINEAR' or 'LOG'"""
-        self.write(f"SWPTYP {mode.upper()}")
+        self._write_setting("sweep_mode", mode.upper(), f"SWPTYP {mode.upper()}", force)
     
-
+    def set_sweep_trigger(self, source: str, force: bool = False):
+        """Set sweep trigger source: 'INT', 'EXT' or 'MAN' (*TRG, see trigger_sweep)"""
+        self._write_setting("sweep_trigger", source.upper(), f"SWPTRGSRC {source.upper()}", force)
+    
+    def trigger_sweep(self) -> float:
+        """
+        Start one sweep (trigger source MAN). Returns the time.time() of the trigger,
+        the midpoint of the *TRG;*OPC? round trip
+        """
+        with self.instr.lock:
+            self._flush()  # Settings buffered by batch() must not delay the trigger
+            sent = time.time()
+            self.instr.query("*TRG;*OPC?", retry=False)  # A repeated query would sweep twice
+            return (sent + time.time()) / 2
+    
+    # Arbitrary waveforms
+    
+    @classmethod
+    def quantize_arb(cls, waveform, normalize: bool = False) -> np.ndarray:
+        """
+        DAC codes of a waveform given in units of full scale (-1..1, beyond is clipped).
+        Full scale is the amplitude set with set_amplitude while ARBn is the output waveform.
+        
+        Args:
+            normalize: scale the waveform so that its largest point is full scale
+        """
+        points = np.asarray(waveform, dtype=np.float64).ravel()
+        if not cls.ARB_MIN_POINTS <= len(points) <= cls.ARB_MAX_POINTS:
+            raise ValueError(f"ARB waveforms have {cls.ARB_MIN_POINTS} to {cls.ARB_MAX_POINTS} points, "
+                             f"got {len(points)}")
+        if not np.all(np.isfinite(points)):
+            raise ValueError("ARB waveform contains NaN or infinite points")
+        if normalize:
+            peak = np.max(np.abs(points))
+            if peak > 0:
+                points = points / peak
+        codes = np.rint(np.clip(points, -1.0, 1.0) * cls.ARB_DAC_MAX)
+        # Big-endian 16-bit words: the byte order of the ARBn block
+        return codes.astype('>i2')
+    
+    def upload_arb(self, slot: int, waveform, normalize: bool = False, verify: bool = True,
+                   force: bool = False) -> int:
+        """
+        Loads a waveform into ARB memory `slot` (1..4) as one IEEE 488.2 binary
+        block (2 bytes per point, sent in ARB_CHUNK_SIZE writes).
+        
+        Args:
+            waveform: points in units of full scale, see quantize_arb
+            verify: read the memory back and compare, then check the error queue
+        
+        Returns:
+            Number of points loaded. A waveform already in the slot is not sent again (force=True sends it).
+        """
+        if slot not in range(1, 5):
+            raise ValueError(f"Invalid ARB slot {slot}. Must be 1 to 4")
+        codes = self.quantize_arb(waveform, normalize)
+        data = codes.tobytes()
+        key = f"arb{slot}"
+        if self.cache.hit(key, data, force):
+            return len(codes)
+        
+        length = str(len(data))
+        header = f"ARB{slot} #{len(length)}{length}".encode('ascii')
+        view = memoryview(data)
+        chunks = [header] + [view[i:i + self.ARB_CHUNK_SIZE] for i in range(0, len(data), self.ARB_CHUNK_SIZE)]
+        chunks.append(b'\n')  # write_raw adds no termination
+        
+        with self.instr.lock:
+            self._flush()  # Commands buffered by batch() go first
+            # Invalid until verified: a failed or partial upload must never be a cache hit
+            self.cache.invalidate(key)
+            self.instr.write_chunks(chunks)
+            if verify:
+                readback = self.instr.query_binary_values(f"ARB{slot}?", datatype='h', is_big_endian=True,
+                                                          container=np.array)
+                if not np.array_equal(readback, codes):
+                    raise RuntimeError(f"ARB{slot} verification failed: read back {len(readback)} points, "
+                                       f"sent {len(codes)}")
+                errors = self.get_errors()
+                if errors:
+                    raise RuntimeError(f"TG2511A reported: {'; '.join(errors)}")
+            self.cache.store(key, data)
+        return len(codes)
     
     # System functions
     
     def reset(self):
         """Reset instrument to default state"""
+        self.cache.invalidate()  # Every setting is back at its default
         self.write("*RST")
         time.sleep(2)  # Wait for reset to complete
     
@@ -145,7 +317,10 @@ class TG2511A:
                 count += 1
         except Exception as e:
             errors.append(f"Communication error reading logs: {e}")
-            
+        
+        if errors:
+            # A rejected or clamped setting leaves the instrument elsewhere than the cache thinks
+            self.cache.invalidate()
         return errors
     
     def __enter__(self):
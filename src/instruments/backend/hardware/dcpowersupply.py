@@ -1,29 +1,82 @@
-import pyvisa
+from contextlib import contextmanager
+from src.instruments.backend.hardware.state_cache import StateCache
+from src.instruments.backend.hardware.visa_pool import get_session, is_timeout, release_session
 
 class PowerSupply:
     def __init__(self, ip: str):
         self.ip = ip
-        rm = pyvisa.ResourceManager()
-        # Add error handling for connection
+        self._batch = None
+        self._joined_queries = True  # Cleared if the instrument rejects ';'-joined queries (short reply or timeout)
+        # Shared, reconnecting session (see visa_pool.py): a dropped LAN link is reopened, not fatal
+        self.dev = get_session(f"TCPIP::{self.ip}::INSTR", timeout=3000)
+        # Last commanded voltage / output state per channel: repeated setpoints are not re-sent
+        self.cache = StateCache(self.dev.resource_string, generation=lambda: self.dev.generation)
         try:
-            self.dev = rm.open_resource(f"TCPIP::{self.ip}::INSTR")
-            self.dev.timeout = 3000  # ms
-            
             # Safe initialization
-            for ch in [1, 2, 3]:
-                self.disable(ch)
+            with self.batch():
+                for ch in [1, 2, 3]:
+                    self.disable(ch)
         except Exception as e:
             print(f"Failed to connect to Power Supply at {ip}: {e}")
+            release_session(self.dev)
             raise
 
-    def enable(self, channel: int):
-        self.dev.write(f":OUTP CH{channel}, ON")
+    def write(self, command: str):
+        """Sends a command, or buffers it while a batch() block is open."""
+        if self._batch is not None:
+            self._batch.append(command)
+        else:
+            self.dev.write(command)
+
+    @contextmanager
+    def batch(self):
+        """
+        Sends all writes made inside the block as one ';'-joined SCPI message
+        (one VISA round trip). Every command starts with ':' so each one is
+        parsed from the root of the command tree. Nothing is sent if the block raises.
+        """
+        if self._batch is not None:
+            yield self  # Already batching: join the outer batch
+            return
+        self._batch = []
+        # Values cached inside the block are forgotten if it is not sent
+        with self.cache.transaction():
+            try:
+                yield self
+                commands = self._batch
+            finally:
+                self._batch = None
+            if commands:
+                self.dev.write(";".join(commands))
+
+    def _write_setting(self, key, value, command: str, force: bool):
+        """Writes `command` unless `value` is already the last one written for `key` (see state_cache.py)."""
+        if not self.cache.hit(key, value, force):
+            self.write(command)
+            self.cache.store(key, value)
+
+    def enable(self, channel: int, force: bool = False):
+        self._write_setting(("output", channel), True, f":OUTP CH{channel}, ON", force)
 
     def disable(self, channel: int):
-        self.dev.write(f":OUTP CH{channel}, OFF")
+        # Always written: after a front-panel change or a lost write the cache may wrongly say "off"
+        self._write_setting(("output", channel), False, f":OUTP CH{channel}, OFF", force=True)
+
+    def set_voltage(self, channel: int, volts: float, force: bool = False):
+        self._write_setting(("volt", channel), volts, f":SOUR{channel}:VOLT {volts}", force)
 
-    def set_voltage(self, channel: int, volts: float):
-        self.dev.write(f":SOUR{channel}:VOLT {volts}")
+    def reset(self):
+        """Restores the instrument defaults (*RST); the cached settings no longer apply."""
+        self.cache.invalidate()
+        self.write("*RST")
+
+    def read_setpoint(self, channel: int) -> float:
+        """Last commanded voltage of `channel`: from the state cache, queried when unknown."""
+        volts = self.cache.get(("volt", channel))
+        if volts is None:
+            volts = float(self.dev.query(f":SOUR{channel}:VOLT?"))
+            self.cache.store(("volt", channel), volts)
+        return volts
 
     # --- FIX: Added 'channel' argument here ---
     def read_voltage(self, channel: int) -> float:
@@ -33,6 +86,34 @@ class PowerSupply:
     def read_current(self, channel: int) -> float:
         return float(self.dev.query(f":MEAS:CURR? CH{channel}"))
 
+    def read_all(self, channels) -> dict:
+        """
+        Measures voltage and current of every channel, in one VISA round trip
+        when the instrument accepts ';'-joined queries. Returns {channel: (volts, amps)}.
+        """
+        channels = list(channels)
+        if self._joined_queries:
+            try:
+                replies = self.dev.query(";".join(f":MEAS:ALL? CH{ch}" for ch in channels)).strip().split(";")
+            except Exception as e:
+                if not is_timeout(e):
+                    raise
+                self.dev.clear()  # A partial reply must not answer the next query
+                replies = []
+            if len(replies) != len(channels):
+                print(f"Power Supply at {self.ip} does not answer joined queries, querying channels one by one")
+                self._joined_queries = False
+        if not self._joined_queries:
+            replies = [self.dev.query(f":MEAS:ALL? CH{ch}") for ch in channels]
+
+        readings = {}
+        for ch, reply in zip(channels, replies):
+            # Reply: "volts,amps,watts"
+            volts, amps = reply.strip().split(",")[:2]
+            readings[ch] = (float(volts), float(amps))
+        return readings
+
     def close(self):
         if hasattr(self, 'dev'):
-            self.dev.close()
+            release_session(self.dev)
+            del self.dev
@@ -0,0 +1,154 @@
+"""
+Multi-line digital pattern generator on a DAQ port (one buffered nidaqmx task).
+
+An experimental cycle is a timing table of (line, t_on ms, t_off ms) pulses.
+compile_pattern() turns it into one uint32 port sample per sample-clock tick
+(bit n = line n); the samples are written to the device buffer once and the
+DAQ replays them with its own clock, N times or on every trigger edge, so a
+cycle costs one command instead of one MQTT round trip per edge.
+
+    generator = PatternGenerator("Dev1", lines=(0, 1, 2), sample_rate=100e3)
+    generator.load([(0, 0.0, 1.5), (1, 0.5, 2.0), (2, 1.0, 1.01)])
+    generator.run(repeats=10)   # returns at once, the DAQ plays 10 cycles
+    generator.run(repeats=10)   # same buffer, nothing is uploaded again
+
+Hardware-timed digital output needs the lines of port0 (PFI lines are static
+only on M and X-series). Retriggered patterns (arm) need an X-series device.
+"""
+from typing import Iterable, Optional, Sequence, Tuple
+
+import nidaqmx
+import numpy as np
+from nidaqmx.constants import AcquisitionType, Edge, LineGrouping, SampleTimingType
+from nidaqmx.stream_writers import DigitalSingleChannelWriter
+
+Step = Tuple[int, float, float]  # line, t_on ms, t_off ms
+
+
+def compile_pattern(table: Iterable[Step], lines: Sequence[int], sample_rate: float,
+                    period_ms: float = 0.0) -> np.ndarray:
+    """
+    Port samples of one cycle. The cycle lasts `period_ms`, or until the last
+    pulse ends, and always ends with every line low.
+    """
+    ticks_per_ms = sample_rate / 1000.0
+    edges = []
+    for line, t_on, t_off in table:
+        if line not in lines:
+            raise ValueError(f"Line {line} is not one of the generator lines {tuple(lines)}")
+        start, stop = round(t_on * ticks_per_ms), round(t_off * ticks_per_ms)
+        if t_on < 0 or stop <= start:
+            raise ValueError(f"Line {line}: pulse {t_on}..{t_off} ms is negative or shorter than one sample "
+                             f"({1 / ticks_per_ms:g} ms)")
+        edges.append((line, start, stop))
+
+    end = max((stop for _, _, stop in edges), default=0)
+    length = max(end + 1, round(period_ms * ticks_per_ms), 2)  # DAQmx buffers hold at least 2 samples
+    samples = np.zeros(length, np.uint32)
+    for line, start, stop in edges:
+        samples[start:stop] |= np.uint32(1 << line)
+    return samples
+
+
+class PatternGenerator:
+    def __init__(self, device="Dev1", port="port0", lines=(0, 1, 2, 3), sample_rate=100e3, trigger=None):
+        """
+        Args:
+            lines: line numbers of `port` driven by the patterns
+            sample_rate: sample clock in Hz; pulse edges are rounded to 1 / sample_rate
+            trigger: PFI line whose rising edges start armed patterns, e.g. "PFI0"
+        """
+        self.device = device
+        self.port = port
+        self.lines = tuple(lines)
+        self.sample_rate = sample_rate
+        self.trigger = trigger
+        self.task_name = "pattern_generator"
+
+        self.table = []
+        self.period_ms = 0.0
+        self.samples: Optional[np.ndarray] = None
+        self._buffer = None  # (repeats, triggered) the device buffer was written for, None: not uploaded
+
+        try:
+            self.task = nidaqmx.Task(self.task_name)
+            channels = ",".join(f"{device}/{port}/line{line}" for line in self.lines)
+            self.task.do_channels.add_do_chan(channels, line_grouping=LineGrouping.CHAN_FOR_ALL_LINES)
+            self.writer = DigitalSingleChannelWriter(self.task.out_stream)
+            self.writer.write_one_sample_port_uint32(0)
+        except nidaqmx.errors.DaqError as e:
+            print(f"DAQ Error: {e}")
+            raise
+
+    def load(self, table: Iterable[Step], period_ms: float = 0.0) -> bool:
+        """Compiles a timing table. Returns False if it gives the pattern already loaded (no upload needed)."""
+        table = [(int(line), float(t_on), float(t_off)) for line, t_on, t_off in table]
+        samples = compile_pattern(table, self.lines, self.sample_rate, period_ms)
+        if self.samples is not None and np.array_equal(samples, self.samples):
+            return False
+        self._finish()
+        self.task.stop()
+        self.table, self.period_ms, self.samples = table, period_ms, samples
+        self._buffer = None
+        return True
+
+    def run(self, repeats: int = 1):
+        """Plays the loaded pattern `repeats` times (0: continuously, until stop). Returns at once."""
+        self._start(int(repeats), triggered=False)
+
+    def arm(self, repeats: int = 1):
+        """Plays the pattern `repeats` times on every rising edge of `trigger`, until stop."""
+        if self.trigger is None:
+            raise RuntimeError("Triggered patterns need a trigger line")
+        if repeats < 1:
+            raise ValueError("Triggered patterns play a finite number of cycles")
+        self._start(int(repeats), triggered=True)
+
+    def stop(self):
+        """Aborts the pattern and sets every line low."""
+        self.task.stop()
+        self.task.timing.samp_timing_type = SampleTimingType.ON_DEMAND
+        self.writer.write_one_sample_port_uint32(0)
+        self._buffer = None
+
+    def _finish(self):
+        """Waits for a finite run still playing: patterns never cut each other off."""
+        if self._buffer is not None and self._buffer[0] > 0 and not self._buffer[1]:
+            self.task.wait_until_done(timeout=self._buffer[0] * len(self.samples) / self.sample_rate + 1.0)
+
+    def _start(self, repeats: int, triggered: bool):
+        if self.samples is None:
+            raise RuntimeError("No pattern loaded")
+        self._finish()
+        self.task.stop()
+        if self._buffer != (repeats, triggered):
+            self._upload(repeats, triggered)
+        # Otherwise the device buffer still holds the pattern: restarting regenerates it
+        self.task.start()
+
+    def _upload(self, repeats: int, triggered: bool):
+        length = len(self.samples)
+        if repeats == 0:
+            self.task.timing.cfg_samp_clk_timing(self.sample_rate, sample_mode=AcquisitionType.CONTINUOUS,
+                                                 samps_per_chan=length)
+        else:
+            self.task.timing.cfg_samp_clk_timing(self.sample_rate, sample_mode=AcquisitionType.FINITE,
+                                                 samps_per_chan=length * repeats)
+        # One cycle in the buffer, regenerated `repeats` times
+        self.task.out_stream.output_buf_size = length
+
+        start_trigger = self.task.triggers.start_trigger
+        if triggered:
+            start_trigger.cfg_dig_edge_start_trig(f"/{self.device}/{self.trigger}", Edge.RISING)
+            start_trigger.retriggerable = True
+        else:
+            if start_trigger.retriggerable:
+                start_trigger.retriggerable = False
+            start_trigger.disable_start_trig()
+
+        self.writer.write_many_sample_port_uint32(self.samples)
+        self._buffer = (repeats, triggered)
+
+    def cleanup(self):
+        self.stop()
+        self.task.close()
@@ -1,12 +1,36 @@
 import time
 import nidaqmx
+from nidaqmx.constants import AcquisitionType, Edge, Level, TaskMode
 
 class Shutter:
-    def __init__(self, device="Dev1", channel="PFI2"):
+    """
+    Shutter on a DAQ line. open/close write the line as a static digital output.
+
+    With a `counter` (e.g. "ctr0") pulses are timed by the DAQ: a counter output
+    task drives the same PFI line, so the pulse width does not depend on the
+    GIL or the OS scheduler (timebase ticks, 10 ns on X-series) and pulse()
+    returns as soon as the pulse is started. Without one, pulses fall back to
+    time.sleep on the calling thread.
+
+    The line belongs to one task at a time: open/close abort running pulses,
+    and a pulse that starts while the shutter is open closes it first (the
+    counter idles low).
+    """
+
+    def __init__(self, device="Dev1", channel="PFI2", counter=None, trigger=None):
+        """
+        Args:
+            counter: counter that times pulses in hardware, routed to `channel`; None for software pulses
+            trigger: PFI line whose rising edges fire the pulses of arm(), e.g. "PFI0"
+        """
         self.device = device
         self.channel = channel
+        self.counter = counter
+        self.trigger = trigger
         self.task_name = "shutter_red"
-        
+        self.pulse_task = None
+        self._pulse_config = None  # (high s, low s, count, triggered) of pulse_task
+
         # Use try/except to handle case where task name already exists
         try:
             self.task = nidaqmx.Task(self.task_name)
@@ -17,27 +41,107 @@ class Shutter:
             raise
 
     def open_shutter(self):
+        self._stop_pulses()
         self.task.write(True)
 
     def close_shutter(self):
+        self._stop_pulses()
         self.task.write(False)
-    
-    def pulse(self, ms):
-        # --- FIX: specific method names used ---
-        self.open_shutter()
-        time.sleep(ms / 1000.0)
-        self.close_shutter()
+
+    def pulse(self, ms, count=1, period_ms=None):
+        """Opens the shutter for `ms`, `count` times, one pulse every `period_ms` (duty = ms / period_ms)."""
+        high, low, count = self._timing(ms, count, period_ms)
+        if self.counter is None:
+            for i in range(count):
+                self.task.write(True)
+                time.sleep(high)
+                self.task.write(False)
+                if i < count - 1:
+                    time.sleep(low)
+            return
+        # A train still running finishes first: pulses never overlap
+        self._start_pulses(high, low, count, triggered=False)
+
+    def arm(self, ms, count=1, period_ms=None):
+        """Fires the pulse (train) on every rising edge of `trigger`, until disarm(), open or close."""
+        if self.counter is None or self.trigger is None:
+            raise RuntimeError("Triggered pulses need a counter and a trigger line")
+        high, low, count = self._timing(ms, count, period_ms)
+        self._start_pulses(high, low, count, triggered=True)
+
+    def disarm(self):
+        self._stop_pulses()
+
+    @staticmethod
+    def _timing(ms, count, period_ms):
+        """(high s, low s, count) of a pulse train."""
+        count = int(count)
+        if ms <= 0 or count < 1:
+            raise ValueError(f"Invalid pulse: {ms} ms x {count}")
+        if count == 1:
+            return ms / 1000.0, ms / 1000.0, 1  # Low time unused by a single pulse
+        if not period_ms or period_ms <= ms:
+            raise ValueError(f"Pulse period ({period_ms} ms) must be longer than the pulse ({ms} ms)")
+        return ms / 1000.0, (period_ms - ms) / 1000.0, count
+
+    def _start_pulses(self, high, low, count, triggered):
+        config = (high, low, count, triggered)
+        if self.pulse_task is not None:
+            previous = self._pulse_config
+            if not previous[3]:
+                self.pulse_task.wait_until_done(timeout=previous[2] * (previous[0] + previous[1]) + 1.0)
+            self.pulse_task.stop()
+        if config != self._pulse_config:
+            # Same pulse again (the usual case) only restarts the task
+            self._close_pulse_task()
+            self.pulse_task = self._create_pulse_task(high, low, count, triggered)
+            self._pulse_config = config
+        # The static output must release the line before the counter can drive it
+        self.task.control(TaskMode.TASK_UNRESERVE)
+        self.pulse_task.start()
+
+    def _create_pulse_task(self, high, low, count, triggered):
+        task = nidaqmx.Task(f"{self.task_name}_pulse")
+        try:
+            channel = task.co_channels.add_co_pulse_chan_time(
+                f"{self.device}/{self.counter}", idle_state=Level.LOW, low_time=low, high_time=high)
+            channel.co_pulse_term = f"/{self.device}/{self.channel}"
+            if count > 1:
+                task.timing.cfg_implicit_timing(sample_mode=AcquisitionType.FINITE, samps_per_chan=count)
+            if triggered:
+                # Retriggerable trains need an X-series counter, M-series retrigger single pulses only
+                task.triggers.start_trigger.cfg_dig_edge_start_trig(f"/{self.device}/{self.trigger}", Edge.RISING)
+                task.triggers.start_trigger.retriggerable = True
+        except nidaqmx.errors.DaqError:
+            task.close()
+            raise
+        return task
+
+    def _stop_pulses(self):
+        """Aborts running or armed pulses and gives the line back to the static output."""
+        if self.pulse_task is not None:
+            self.pulse_task.stop()
+            self.pulse_task.control(TaskMode.TASK_UNRESERVE)
+
+    def _close_pulse_task(self):
+        if self.pulse_task is not None:
+            self.pulse_task.close()
+            self.pulse_task = None
+            self._pulse_config = None
 
     def cleanup(self):
+        self._stop_pulses()
+        self._close_pulse_task()
         self.task.stop()
         self.task.close()
 
 if __name__ == "__main__":
     # Wrap in try/finally to ensure cleanup happens even if pulse crashes
     try:
-        shutter = Shutter(device="Dev1", channel="PFI2")
+        shutter = Shutter(device="Dev1", channel="PFI2", counter="ctr0")
         print("Opening shutter for 1 second...")
         shutter.pulse(1000)
+        shutter.pulse_task.wait_until_done(timeout=2.0)
     finally:
         # Check if shutter exists before cleaning up
         if 'shutter' in locals():
@@ -0,0 +1,104 @@
+"""
+Write-through cache of the settings last commanded to an instrument.
+
+A driver setter asks the cache before writing: if the instrument was already
+given that exact value, the write is skipped (a hit), otherwise it is sent and
+the new value stored (a miss). A scan revisiting a point or a GUI re-sending
+the same setpoint then costs a dict lookup instead of a VISA round trip.
+
+    if not self.cache.hit("freq", freq_hz, force):
+        self.write(f"FREQ {freq_hz}")
+        self.cache.store("freq", freq_hz)
+
+The cache only knows what this driver wrote, so it is forgotten whenever the
+instrument may have changed on its own:
+
+    invalidate()     explicitly, e.g. after *RST or errors in the error queue
+    generation       a counter that changes when the connection is lost
+                     (VisaSession.generation): a power-cycled instrument is
+                     back at its defaults
+    transaction()    values stored inside a batch that fails or is never sent
+
+force=True in the driver setters always writes (e.g. after changing the
+instrument from its front panel). Turning an output off is always written:
+a stale "off" must never swallow it. Hits and misses are counted per driver in
+cortex_driver_cache_total.
+"""
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+from src.instruments.metrics import registry
+
+_lookups = registry.counter("cortex_driver_cache_total",
+                            "Setter calls answered from the driver state cache (hit) or written (miss)",
+                            ("driver", "result"))
+
+
+class StateCache:
+    def __init__(self, name: str, generation: Optional[Callable[[], int]] = None):
+        """
+        Args:
+            name: driver label for the metrics, e.g. the resource string
+            generation: returns a number that changes when the cached state can no longer be trusted
+        """
+        self.name = name
+        self.values: Dict[Hashable, Any] = {}
+        self.hits = 0
+        self.misses = 0
+        self._generation = generation
+        self._seen_generation = generation() if generation is not None else None
+        self._pending: Optional[Set[Hashable]] = None
+        self._hit_counter = _lookups.labels(name, "hit")
+        self._miss_counter = _lookups.labels(name, "miss")
+
+    def _check_generation(self):
+        if self._generation is not None:
+            generation = self._generation()
+            if generation != self._seen_generation:
+                self._seen_generation = generation
+                self.values.clear()
+
+    def hit(self, key: Hashable, value: Any, force: bool = False) -> bool:
+        """True if `value` is already what the instrument was told for `key` (skip the write)."""
+        self._check_generation()
+        if not force and key in self.values and self.values[key] == value:
+            self.hits += 1
+            self._hit_counter.inc()
+            return True
+        self.misses += 1
+        self._miss_counter.inc()
+        return False
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Last value written for `key` (not counted as a hit or miss)."""
+        self._check_generation()
+        return self.values.get(key, default)
+
+    def store(self, key: Hashable, value: Any):
+        """Records a value just written (or buffered in a batch) for `key`."""
+        self.values[key] = value
+        if self._pending is not None:
+            self._pending.add(key)
+
+    def invalidate(self, *keys: Hashable):
+        """Forgets `keys`, or everything when called without arguments."""
+        if not keys:
+            self.values.clear()
+            return
+        for key in keys:
+            self.values.pop(key, None)
+
+    @contextmanager
+    def transaction(self):
+        """Values stored inside the block are forgotten if it raises (nested blocks join the outer one)."""
+        if self._pending is not None:
+            yield
+            return
+        self._pending = set()
+        try:
+            yield
+        except BaseException:
+            self.invalidate(*self._pending)
+            raise
+        finally:
+            self._pending = None
@@ -0,0 +1,289 @@
+"""
+Shared pyvisa ResourceManager and reconnecting session pool for the hardware drivers.
+
+Every driver of a process (PowerSupply, TG2511A, ...) gets its session from
+here instead of creating its own ResourceManager:
+
+    session = get_session("TCPIP::192.168.1.10::INSTR", timeout=3000)
+    session.write(":OUTP CH1, ON")
+    session.query("*IDN?")
+    release_session(session)
+
+A VisaSession has the write/query interface of a pyvisa resource and:
+
+    lazy open       the resource is opened on first use, not by get_session()
+    locking         every call holds the session's RLock; `with session.lock:`
+                    keeps a write/read sequence together
+    reconnect       a VISA or socket error closes the resource and the call is
+                    retried once on a fresh one; if reopening fails, calls fail
+                    fast with ConnectionError until the next attempt, with an
+                    exponential backoff (initial_backoff doubling up to max_backoff).
+                    A timeout (VI_ERROR_TMO) is an ordinary error: the instrument
+                    is slow or rejected the command, the connection is kept and
+                    nothing is retried
+    health checks   a monitor thread sends `health_query` to sessions idle for
+                    `health_interval` seconds, and reopens broken ones in the
+                    background, so a dropped Rigol is back before the next command
+
+Sessions are shared per resource string and reference counted: the resource is
+closed when the last driver releases it.
+"""
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence
+
+import pyvisa
+from pyvisa.constants import StatusCode
+
+# Errors after which the resource is considered dead and reopened (except timeouts, see is_timeout)
+CONNECTION_ERRORS = (pyvisa.errors.VisaIOError, pyvisa.errors.InvalidSession, OSError)
+
+
+def is_timeout(error: Exception) -> bool:
+    """A VISA timeout: the instrument did not answer in time, the link itself is fine."""
+    return (isinstance(error, pyvisa.errors.VisaIOError)
+            and getattr(error, 'error_code', None) == StatusCode.error_timeout)
+
+_resource_manager: Optional[pyvisa.ResourceManager] = None
+_resource_manager_lock = threading.Lock()
+
+
+def resource_manager() -> pyvisa.ResourceManager:
+    """The process-wide ResourceManager (created on first use)."""
+    global _resource_manager
+    with _resource_manager_lock:
+        if _resource_manager is None:
+            _resource_manager = pyvisa.ResourceManager()
+        return _resource_manager
+
+
+class VisaSession:
+    def __init__(self, resource_string: str, timeout: int = 5000, read_termination: Optional[str] = None,
+                 write_termination: Optional[str] = None, health_query: Optional[str] = "*IDN?",
+                 health_interval: float = 10.0, initial_backoff: float = 0.5, max_backoff: float = 30.0,
+                 on_reconnect: Optional[Callable[["VisaSession"], None]] = None):
+        """
+        Args:
+            timeout: VISA timeout in ms
+            health_query: query sent by the monitor to idle sessions (None: no health check)
+            on_reconnect: called with the session (lock held) after the resource was reopened
+        """
+        self.resource_string = resource_string
+        self.timeout = timeout
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        self.health_query = health_query
+        self.health_interval = health_interval
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.on_reconnect = on_reconnect
+
+        self.lock = threading.RLock()
+        self.users = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.last_error = ''
+        self.generation = 0  # Incremented whenever the connection is lost (see state_cache.py)
+
+        self._resource = None
+        self._opened_once = False
+        self._backoff = initial_backoff
+        self._next_attempt = 0.0
+        self._last_used = time.monotonic()
+        self._closed = False
+
+    # --- Connection ---
+
+    @property
+    def connected(self) -> bool:
+        return self._resource is not None
+
+    def open(self):
+        """Opens the resource now (otherwise done by the first call)."""
+        with self.lock:
+            self._resource_or_raise()
+
+    def _resource_or_raise(self):
+        """The open resource; reopens it if the backoff allows, else raises ConnectionError."""
+        if self._resource is not None:
+            return self._resource
+        if self._closed:
+            raise ConnectionError(f"{self.resource_string}: session closed")
+        now = time.monotonic()
+        if now < self._next_attempt:
+            raise ConnectionError(f"{self.resource_string} unreachable ({self.last_error}), "
+                                  f"retrying in {self._next_attempt - now:.1f}s")
+        try:
+            resource = resource_manager().open_resource(self.resource_string)
+            resource.timeout = self.timeout
+            if self.read_termination is not None:
+                resource.read_termination = self.read_termination
+            if self.write_termination is not None:
+                resource.write_termination = self.write_termination
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e) or type(e).__name__
+            self._next_attempt = now + self._backoff
+            print(f"[VISA] {self.resource_string}: open failed ({self.last_error}), "
+                  f"next attempt in {self._backoff:.1f}s")
+            self._backoff = min(self._backoff * 2, self.max_backoff)
+            raise ConnectionError(f"{self.resource_string}: {self.last_error}") from e
+
+        self._resource = resource
+        self._backoff = self.initial_backoff
+        self._next_attempt = 0.0
+        if self._opened_once:
+            self.reconnects += 1
+            print(f"[VISA] {self.resource_string}: reconnected")
+            if self.on_reconnect is not None:
+                self.on_reconnect(self)
+        self._opened_once = True
+        return resource
+
+    def _drop(self, error: Exception):
+        """Closes a resource that failed; the next call reopens it."""
+        self.last_error = str(error) or type(error).__name__
+        print(f"[VISA] {self.resource_string}: connection lost ({self.last_error})")
+        self.generation += 1
+        resource, self._resource = self._resource, None
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception:
+                pass
+
+    def _call(self, operation: Callable, retry: bool = True):
+        with self.lock:
+            self._last_used = time.monotonic()
+            # One retry on a fresh resource: setpoints and plain queries are safe to repeat
+            for attempt in range(2 if retry else 1):
+                resource = self._resource_or_raise()
+                try:
+                    return operation(resource)
+                except CONNECTION_ERRORS as e:
+                    if is_timeout(e):
+                        raise
+                    self._drop(e)
+                    if attempt or not retry:
+                        raise
+
+    # --- pyvisa resource interface ---
+
+    def write(self, command: str):
+        return self._call(lambda resource: resource.write(command))
+
+    def query(self, command: str, retry: bool = True) -> str:
+        """retry=False for queries with a side effect, e.g. "*TRG;*OPC?": a retry would repeat it."""
+        return self._call(lambda resource: resource.query(command), retry=retry)
+
+    # A bare read cannot be repeated: the reply belonged to the old connection
+    def read(self) -> str:
+        return self._call(lambda resource: resource.read(), retry=False)
+
+    def write_raw(self, message: bytes):
+        return self._call(lambda resource: resource.write_raw(message))
+
+    def read_raw(self) -> bytes:
+        return self._call(lambda resource: resource.read_raw(), retry=False)
+
+    def clear(self):
+        """Device clear: discards a late reply still on its way, e.g. after a timeout."""
+        return self._call(lambda resource: resource.clear())
+
+    def write_chunks(self, chunks: Sequence[bytes]):
+        """Writes one message in several raw writes. A retry resends the whole message, never a tail."""
+        def write_all(resource):
+            for chunk in chunks:
+                resource.write_raw(chunk)
+        return self._call(write_all)
+
+    def query_binary_values(self, command: str, **options):
+        """pyvisa query_binary_values (IEEE 488.2 block reply), e.g. datatype='h', is_big_endian=True."""
+        return self._call(lambda resource: resource.query_binary_values(command, **options))
+
+    # --- Health ---
+
+    def check(self) -> bool:
+        """Sends the health query (or reopens a broken session). Returns True if the instrument answers."""
+        with self.lock:
+            try:
+                resource = self._resource_or_raise()
+            except ConnectionError:
+                return False
+            try:
+                if self.health_query:
+                    resource.query(self.health_query)
+            except CONNECTION_ERRORS as e:
+                if not is_timeout(e):
+                    self._drop(e)
+                return False
+            self._last_used = time.monotonic()
+            return True
+
+    def _needs_check(self, now: float) -> bool:
+        if self._closed or not self._opened_once:
+            return False
+        if self._resource is None:
+            return now >= self._next_attempt
+        return self.health_query is not None and now - self._last_used >= self.health_interval
+
+    def close(self):
+        """Closes the resource for good (done by release_session for the last user)."""
+        with self.lock:
+            self._closed = True
+            resource, self._resource = self._resource, None
+        if resource is not None:
+            try:
+                resource.close()
+            except Exception as e:
+                print(f"[VISA] {self.resource_string}: error while closing: {e}")
+
+
+# ==============================================================================
+#   POOL (one session per resource string) AND HEALTH MONITOR
+# ==============================================================================
+
+_sessions: Dict[str, VisaSession] = {}
+_pool_lock = threading.Lock()
+_monitor: Optional[threading.Thread] = None
+MONITOR_INTERVAL = 1.0
+
+
+def get_session(resource_string: str, **options) -> VisaSession:
+    """The shared session for `resource_string`; options apply when it is created."""
+    global _monitor
+    with _pool_lock:
+        session = _sessions.get(resource_string)
+        if session is None:
+            session = _sessions[resource_string] = VisaSession(resource_string, **options)
+        session.users += 1
+        if _monitor is None:
+            _monitor = threading.Thread(target=_monitor_sessions, name="visa-health", daemon=True)
+            _monitor.start()
+    return session
+
+
+def release_session(session: VisaSession):
+    """Drops one user; the resource is closed when nobody uses it anymore."""
+    with _pool_lock:
+        session.users -= 1
+        if session.users > 0:
+            return
+        if _sessions.get(session.resource_string) is session:
+            del _sessions[session.resource_string]
+    session.close()
+
+
+def _monitor_sessions():
+    while True:
+        time.sleep(MONITOR_INTERVAL)
+        now = time.monotonic()
+        with _pool_lock:
+            sessions = [session for session in _sessions.values() if session._needs_check(now)]
+        for session in sessions:
+            # Never wait behind a command: a busy session is healthy enough
+            if session.lock.acquire(blocking=False):
+                try:
+                    session.check()
+                finally:
+                    session.lock.release()
@@ -0,0 +1,228 @@
+"""
+MQTT side shared by all instrument backends (BackendAWG, BackendPowerSupply, BackendShutter,
+BackendPatternGenerator).
+
+A backend inherits from its hardware driver and from MqttBackend, sets
+`schema` (see codec.py) and `label`, and implements execute(mode, *fields).
+MqttBackend decodes incoming frames on the network thread and hands them to
+the device's CommandQueue; its worker runs them under the device lock and
+answers every command that carries a correlation id with an ack (or error)
+on ack_topic(topic), stamped with receive, hardware-start and hardware-done times.
+Queue metrics are published as JSON on "<topic>/stats". Backends with
+readback set `telemetry` (see telemetry.py), which runs while MQTT is open and
+publishes on telemetry_topic(topic) (retained, so new readers get the last one).
+
+A number returned by execute() goes back in the ack (Ack.value), e.g. the
+time at which the AWG 'trigger' started the sweep.
+
+execute() records what it changed with update_state(); after each command the
+snapshot is published retained on state_topic(topic), so a GUI starting later
+is populated at once without querying the instruments.
+
+Backends opened on the same broker share one MqttConnection (see
+mqtt_connection.py), so a host process running all devices keeps one socket.
+"""
+import json
+import math
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Tuple
+
+from src.instruments.codec import DeviceSchema, ack_topic, read_correlation_id, state_topic, telemetry_topic
+from src.instruments.metrics import registry
+from src.instruments.mqtt_connection import DEFAULT_BROKER, acquire_connection, release_connection
+from src.instruments.backend.command_queue import CommandQueue, COALESCE
+from src.instruments.backend.telemetry import TelemetryPoller
+
+_commands = registry.counter("cortex_backend_commands_total",
+                             "Commands handled, by outcome (ok, error, discarded)", ("device", "status"))
+_queue_depth = registry.gauge("cortex_backend_queue_depth", "Commands waiting for the hardware", ("device",))
+_queue_wait_seconds = registry.histogram("cortex_backend_queue_wait_seconds",
+                                         "Time from MQTT receive to hardware start", ("device",))
+_hardware_seconds = registry.histogram("cortex_backend_hardware_seconds",
+                                       "Duration of the instrument calls (VISA / DAQ) of one command or batch",
+                                       ("device",))
+
+
+class _Job:
+    """Decoded frame waiting in the queue. Coalesced jobs collect the ids they replaced."""
+    __slots__ = ("commands", "correlation_ids", "received")
+
+    def __init__(self, commands, correlation_id: int, received: float):
+        self.commands = commands
+        self.correlation_ids: List[int] = [correlation_id] if correlation_id else []
+        self.received = received
+
+    def merge(self, newer: "_Job") -> "_Job":
+        newer.correlation_ids = self.correlation_ids + newer.correlation_ids
+        newer.received = self.received
+        return newer
+
+
+class MqttBackend:
+    schema: DeviceSchema = None
+    label = "Backend"
+    # Single commands of these modes are setpoints: a queued one is replaced by a
+    # newer one with the same leading fields, e.g. ('set', channel)
+    coalesce_modes: Tuple[str, ...] = ()
+    stats_interval = 1.0
+
+    def __init__(self, mqtt_topic: str, queue_size: int = 64, queue_policy: str = COALESCE):
+        self.mqtt_path = mqtt_topic
+        self.reply_topic = ack_topic(mqtt_topic)
+        self.stats_topic = mqtt_topic + "/stats"
+        self.telemetry_topic = telemetry_topic(mqtt_topic)
+        self.telemetry: Optional[TelemetryPoller] = None
+        self.state_topic = state_topic(mqtt_topic)
+        self.state: Dict[str, object] = {}
+        self._state_dirty = False
+        # Held for a whole command or batch, so two operators never interleave
+        self._lock = threading.Lock()
+        self._last_stats = 0.0
+
+        self.queue = CommandQueue(self._run_job, name=f"{self.label} {mqtt_topic}",
+                                  maxsize=queue_size, policy=queue_policy,
+                                  on_discard=self._discard_job, merge=_Job.merge)
+        _queue_depth.labels(mqtt_topic).set_function(lambda: self.queue.depth)
+
+        self.connection = None
+
+    def open_mqtt(self, broker_address: str = DEFAULT_BROKER):
+        # Named open_mqtt to avoid confusion with hardware open() methods
+        self.connection = acquire_connection(broker_address)
+        self.connection.subscribe(self.mqtt_path, self.on_message)
+        print(f'{self.label} subscribed to {self.mqtt_path}')
+        self.publish_state()
+        if self.telemetry is not None:
+            self.telemetry.start()
+
+    def close_mqtt(self):
+        """Stops listening, finishes the queued commands, then releases the connection."""
+        if self.connection is None:
+            return
+        if self.telemetry is not None:
+            self.telemetry.stop()
+        self.connection.unsubscribe(self.mqtt_path, self.on_message)
+        self.queue.stop()
+        _queue_depth.remove(self.mqtt_path)  # The gauge function holds a reference to this backend
+        release_connection(self.connection)
+        self.connection = None
+
+    def close_hardware(self):
+        """Releases the instrument. Override in backends whose driver holds a session."""
+        pass
+
+    def shutdown(self):
+        self.close_mqtt()
+        self.close_hardware()
+
+    def on_message(self, client, userdata, message):
+        # Network thread: decode and enqueue only, the hardware is driven by the queue worker
+        received = time.time()
+        payload = message.payload
+        correlation_id = read_correlation_id(payload)
+
+        try:
+            # Expected frame: one command of self.schema, or a batch envelope of them
+            commands = self.schema.decode_batch(payload)
+        except ValueError as e:
+            print(f"{self.label} Error: Wrong payload format: {payload!r} | {e}")
+            self.publish_ack(correlation_id, received, received, received, f"Wrong payload format: {e}")
+            return
+        self.enqueue(commands, correlation_id, received)
+
+    def enqueue(self, commands, correlation_id: int, received: float):
+        """Hands decoded commands to the queue worker (also for messages of backend-specific topics)."""
+        job = _Job(commands, correlation_id, received)
+        if not self.queue.put(job, self.coalesce_key(commands)):
+            print(f"{self.label} {self.mqtt_path}: command queue full, command rejected")
+            self._discard_job(job, "rejected: queue full")
+
+    def coalesce_key(self, commands):
+        """Queue key of a frame, or None when it must run in order (batches, enable, ...)."""
+        if len(commands) == 1 and commands[0][0] in self.coalesce_modes:
+            return commands[0][:-1]
+        return None
+
+    def _run_job(self, job: _Job):
+        started = job.received
+        error = ''
+        value = math.nan
+        try:
+            started, done, value = self.execute_batch(job.commands)
+            if len(job.commands) > 1:
+                print(f"{self.label} {self.mqtt_path}: batch of {len(job.commands)} commands done")
+        except Exception as e:
+            print(f"{self.label} Hardware Error: {e}")
+            error = str(e) or type(e).__name__
+            done = time.time()
+        _queue_wait_seconds.labels(self.mqtt_path).observe(max(0.0, started - job.received))
+        _hardware_seconds.labels(self.mqtt_path).observe(max(0.0, done - started))
+        _commands.labels(self.mqtt_path, "error" if error else "ok").inc(len(job.commands))
+
+        for correlation_id in job.correlation_ids:
+            self.publish_ack(correlation_id, job.received, started, done, error, value)
+        if self._state_dirty:
+            self.publish_state()
+
+        if done - self._last_stats >= self.stats_interval:
+            self._last_stats = done
+            self.publish_stats()
+
+    def _discard_job(self, job: _Job, reason: str):
+        _commands.labels(self.mqtt_path, "discarded").inc(len(job.commands))
+        now = time.time()
+        for correlation_id in job.correlation_ids:
+            self.publish_ack(correlation_id, job.received, now, now, reason)
+
+    def publish_stats(self):
+        self.connection.publish(self.stats_topic, json.dumps(self.queue.stats()))
+
+    def execute_batch(self, commands) -> Tuple[float, float, float]:
+        """
+        Runs commands as one unit: one lock acquisition and, if the hardware
+        supports it, one instrument write (see hardware_batch).
+        Returns the (start, done) timestamps of the hardware access and the
+        value returned by the last command that returned one (NaN if none).
+        """
+        value = math.nan
+        with self._lock:
+            started = time.time()
+            with self.hardware_batch(commands):
+                for command in commands:
+                    result = self.execute(*command)
+                    if result is not None:
+                        value = result
+            return started, time.time(), value
+
+    def hardware_batch(self, commands):
+        """Context grouping the instrument writes of `commands`. Override when the driver can concatenate them."""
+        return nullcontext()
+
+    def execute(self, mode: str, *fields) -> Optional[float]:
+        """Runs one command. A returned number is sent back in the ack (Ack.value)."""
+        raise NotImplementedError
+
+    def update_state(self, **values):
+        """Records settings for the next state snapshot (names as in the GUI plugin)."""
+        self.state.update(values)
+        self._state_dirty = True
+
+    def publish_state(self):
+        self._state_dirty = False
+        # A copy: ramps (see ramp.py) update the state from their own thread
+        snapshot = {"timestamp": time.time(), "values": dict(self.state)}
+        # QoS 1: paho keeps it through a broker disconnect, so the last state is never lost
+        self.connection.publish(self.state_topic, json.dumps(snapshot), qos=1, retain=True)
+
+    def publish_telemetry(self, timestamp: float, readings: Dict[int, tuple]):
+        self.connection.publish(self.telemetry_topic, self.schema.encode_telemetry(timestamp, readings),
+                                retain=True)
+
+    def publish_ack(self, correlation_id: int, received: float, started: float, done: float, error: str = '',
+                    value: float = math.nan):
+        if not correlation_id:
+            return  # Sender did not ask for an acknowledgment
+        self.connection.publish(self.reply_topic,
+                            self.schema.encode_ack(correlation_id, received, started, done, error, value))
@@ -0,0 +1,143 @@
+"""
+Setpoint ramps and profiles executed inside a backend (e.g. BackendPowerSupply).
+
+A ramp is a list of points written to one channel at a fixed interval:
+
+    ramp_points(start, target, rate, step)   linear ramp in steps of at most `step`,
+                                             one step every step / rate seconds
+    profile                                  any point list, one point every `dwell` seconds
+
+One RampRunner thread serves every channel of a device. Each point is written
+with the device lock held, so ramp steps interleave with commands but never
+run in the middle of one. Points are due on an absolute timeline, so a slow
+write does not stretch the ramp. start() replaces the ramp of the channel,
+cancel() leaves the channel at the last point written, and a failing write
+cancels that channel's ramp.
+
+The whole ramp runs in the backend: a dropped MQTT link neither stops it nor
+leaves it half sent.
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+def ramp_points(start: float, target: float, rate: float, step: float) -> List[float]:
+    """Points of a linear ramp from `start` (excluded) to `target` (included), in steps of at most `step`."""
+    if rate <= 0 or step <= 0:
+        raise ValueError(f"Ramp rate ({rate}) and step ({step}) must be positive")
+    distance = target - start
+    count = max(1, math.ceil(abs(distance) / step - 1e-9))
+    return [start + distance * i / count for i in range(1, count + 1)]
+
+
+class _Ramp:
+    __slots__ = ("channel", "points", "interval", "start", "index")
+
+    def __init__(self, channel: int, points: Sequence[float], interval: float, start: float):
+        self.channel = channel
+        self.points = list(points)
+        self.interval = interval
+        self.start = start
+        self.index = 0
+
+    @property
+    def due(self) -> float:
+        return self.start + self.index * self.interval
+
+
+class RampRunner:
+    def __init__(self, apply: Callable[[int, float], None], lock: threading.Lock,
+                 done: Optional[Callable[[int, bool], None]] = None, name: str = "ramps"):
+        """
+        Args:
+            apply: writes one point, apply(channel, value), called with `lock` held
+            done: called with (channel, completed) when a ramp ends, fails or is cancelled (lock released)
+            lock: device lock shared with command execution
+        """
+        self.apply = apply
+        self.lock = lock
+        self.done = done
+        self.name = name
+
+        self.steps = 0
+        self.errors = 0
+
+        self._ramps: Dict[int, _Ramp] = {}
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, channel: int, points: Sequence[float], interval: float, delay: float = 0.0):
+        """Writes `points` to `channel`, the first after `delay` s, then one every `interval` s."""
+        if not points:
+            raise ValueError("A ramp needs at least one point")
+        with self._cond:
+            self._ramps[channel] = _Ramp(channel, points, interval, time.monotonic() + delay)
+            if not self._running:
+                self._running = True
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-ramps", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self, channel: int) -> bool:
+        """Stops the ramp of `channel` where it is. Returns True if one was running."""
+        with self._cond:
+            cancelled = self._ramps.pop(channel, None) is not None
+        if cancelled and self.done is not None:
+            self.done(channel, False)
+        return cancelled
+
+    def target(self, channel: int) -> Optional[float]:
+        """Final point of the running ramp of `channel`, None when idle."""
+        with self._cond:
+            ramp = self._ramps.get(channel)
+            return ramp.points[-1] if ramp is not None else None
+
+    def stop(self):
+        """Cancels every ramp and ends the thread."""
+        with self._cond:
+            self._ramps.clear()
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                if not self._ramps:
+                    self._cond.wait()
+                    continue
+                ramp = min(self._ramps.values(), key=lambda r: r.due)
+                delay = ramp.due - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)  # Woken early by start/cancel/stop
+                    continue
+
+            error = None
+            with self.lock:
+                with self._cond:
+                    if self._ramps.get(ramp.channel) is not ramp:
+                        continue  # Replaced or cancelled while waiting for the lock
+                try:
+                    self.apply(ramp.channel, ramp.points[ramp.index])
+                    self.steps += 1
+                except Exception as e:
+                    self.errors += 1
+                    error = e
+                    print(f"[{self.name}] Ramp of channel {ramp.channel} stopped: {e}")
+
+            with self._cond:
+                finished = False
+                if self._ramps.get(ramp.channel) is ramp:
+                    ramp.index += 1
+                    if error is not None or ramp.index == len(ramp.points):
+                        del self._ramps[ramp.channel]
+                        finished = True
+            if finished and self.done is not None:
+                self.done(ramp.channel, error is None)
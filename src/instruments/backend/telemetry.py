@@ -0,0 +1,123 @@
+"""
+Adaptive telemetry poller for backends with readback (e.g. BackendPowerSupply).
+
+Runs on its own thread and calls `read()` every `period` seconds:
+
+    idle_interval     nobody is watching: slow heartbeat so readers still see values
+    watch(period)     a frontend asked for faster updates (e.g. during a scan); the
+                      request is a lease valid for TELEMETRY_LEASE seconds and is
+                      renewed by the frontend while it listens; the fastest lease wins
+
+Polling never delays commands: a tick is skipped while the device lock is held
+or commands are waiting in the queue, and retried `min_interval` later.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.instruments.codec import TELEMETRY_LEASE
+from src.instruments.metrics import registry
+
+_read_seconds = registry.histogram("cortex_telemetry_read_seconds", "Duration of one telemetry readback", ("poller",))
+_skipped = registry.counter("cortex_telemetry_skipped_total", "Telemetry ticks skipped because the device was busy",
+                            ("poller",))
+
+
+class TelemetryPoller:
+    def __init__(self, read: Callable[[], Dict[int, tuple]], publish: Callable[[float, Dict[int, tuple]], None],
+                 lock: threading.Lock, busy: Optional[Callable[[], bool]] = None,
+                 idle_interval: float = 5.0, min_interval: float = 0.05, name: str = "telemetry"):
+        """
+        Args:
+            read: returns {channel: (values...)}, called with `lock` held
+            publish: called with (timestamp, readings) after the lock is released
+            lock: device lock shared with command execution
+            busy: returns True while commands are waiting (skip the tick)
+        """
+        self.read = read
+        self.publish = publish
+        self.lock = lock
+        self.busy = busy
+        self.idle_interval = idle_interval
+        self.min_interval = min_interval
+        self.name = name
+
+        self.polls = 0
+        self.skipped = 0
+        self.errors = 0
+
+        self._leases: List[Tuple[float, float]] = []  # (expiry, period)
+        self._leases_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def period(self) -> float:
+        now = time.monotonic()
+        with self._leases_lock:
+            self._leases = [lease for lease in self._leases if lease[0] > now]
+            periods = [period for _, period in self._leases]
+        return max(self.min_interval, min(periods, default=self.idle_interval))
+
+    def watch(self, period: float, duration: float = TELEMETRY_LEASE):
+        """Requests telemetry every `period` seconds for the next `duration` seconds."""
+        with self._leases_lock:
+            self._leases.append((time.monotonic() + duration, period))
+        self._wakeup.set()  # Apply a faster rate immediately
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while self._running:
+            self._wakeup.wait(max(0.0, next_poll - time.monotonic()))
+            if self._wakeup.is_set():
+                self._wakeup.clear()
+                next_poll = min(next_poll, time.monotonic() + self.period)
+                continue
+            if not self._running:
+                break
+
+            if not self.poll_once():
+                next_poll = time.monotonic() + self.min_interval  # Device busy, retry soon
+            else:
+                next_poll += self.period
+                next_poll = max(next_poll, time.monotonic())  # Do not catch up after a slow read
+
+    def poll_once(self) -> bool:
+        """Reads and publishes once. Returns False if the device was busy."""
+        if self.busy is not None and self.busy():
+            self.skipped += 1
+            _skipped.labels(self.name).inc()
+            return False
+        if not self.lock.acquire(blocking=False):
+            self.skipped += 1
+            _skipped.labels(self.name).inc()
+            return False
+        try:
+            timestamp = time.time()
+            with _read_seconds.labels(self.name).time():
+                readings = self.read()
+        except Exception as e:
+            self.errors += 1
+            print(f"[{self.name}] Telemetry read failed: {e}")
+            return True
+        finally:
+            self.lock.release()
+
+        self.polls += 1
+        self.publish(timestamp, readings)
+        return True
@@ -0,0 +1,386 @@
+"""
+Binary wire codec for instrument commands.
+
+Every command is one fixed-size, struct-packed frame (little endian):
+
+    version      uint8    WIRE_VERSION, bumped whenever a frame layout changes
+    device       uint8    DeviceSchema.device_id (guards against wrong topics)
+    opcode       uint8    index of the command in DeviceSchema.commands
+    correlation  uint32   id echoed in the acknowledgment (0 = no ack wanted)
+    body         fixed    DeviceSchema body fields, e.g. channel + value
+
+Frontends, backends and the fake backend simulators all go through the
+schemas below, so a decoded command is the same tuple the old string payloads
+produced, e.g. POWER_SUPPLY.decode(frame) -> ('set', 1, 5.0).
+
+A batch envelope carries several commands for one device that the backend
+executes as one unit. It uses the reserved opcode BATCH_OPCODE:
+
+    header       version, device, BATCH_OPCODE, correlation
+    count        uint16
+    entries      count x (opcode uint8 + body)
+
+Backends answer every frame with a correlation id on ack_topic(topic):
+
+    header       version, device, status (ACK_OK / ACK_ERROR), correlation
+    timestamps   3 x float64, time.time() at receive, hardware start, hardware done
+    value        float64  result of the command, NaN if none (e.g. the time of an AWG 'trigger')
+    error        utf-8 text, rest of the frame (empty when ok)
+
+Backends with readback publish telemetry on telemetry_topic(topic):
+
+    version      uint8
+    device       uint8
+    count        uint16   number of channels
+    timestamp    float64  time.time() of the measurement
+    entries      count x (channel uint8 + DeviceSchema.telemetry_fields as float64)
+
+Cameras publish frames on frame_topic(topic), either inline or as a
+reference into a shared-memory FrameRing on the same host (frame_ring.py):
+
+    version      uint8
+    kind         uint8    FRAME_INLINE / FRAME_SHARED
+    dtype        4s       NumPy dtype string, e.g. '<u2'
+    height       uint16
+    width        uint16
+    slot         uint16   FrameRing slot (0 for inline frames)
+    sequence     uint64   frame number
+    timestamp    float64  time.time() of the exposure
+    data         pixels in C order (FRAME_INLINE) or the utf-8 ring name (FRAME_SHARED)
+
+The AWG takes arbitrary waveforms on arb_topic(topic), samples as raw float32
+instead of one command per point:
+
+    header       version, device, ARB_OPCODE, correlation
+    slot         uint8    ARB memory (1..4 on the TG2511A)
+    count        uint32   number of points
+    points       count x float32, in units of full scale (-1..1)
+
+The upload is acknowledged on ack_topic(topic) like any command.
+
+Backends also publish a retained JSON snapshot of their last known settings
+on state_topic(topic): {"timestamp": time.time(), "values": {name: value}}.
+Value names are the GUI parameter names (e.g. "ch1_volt", "frequency").
+
+Usage:
+    frame = POWER_SUPPLY.encode('set', 1, 5.0, correlation_id=42)
+    mode, channel, value = POWER_SUPPLY.decode(frame)
+
+    frame = POWER_SUPPLY.encode_batch([('set', 1, 5.0), ('enable', 1, 0)])
+    commands = POWER_SUPPLY.decode_batch(frame)   # also accepts single frames
+"""
+import math
+import struct
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+WIRE_VERSION = 4
+HEADER_FORMAT = '<BBBI'
+BATCH_OPCODE = 0xFF
+ARB_OPCODE = 0xFE
+
+ACK_OK = 0
+ACK_ERROR = 1
+FRAME_INLINE = 0
+FRAME_SHARED = 1
+ACK_SUFFIX = "/ack"
+TELEMETRY_SUFFIX = "/telemetry"
+STATE_SUFFIX = "/state"
+FRAME_SUFFIX = "/frame"
+ARB_SUFFIX = "/arb"
+# One subscription receives the snapshots of every "<id>/<serial>" device
+STATE_FILTER = "+/+" + STATE_SUFFIX
+# Seconds a 'watch' request keeps fast telemetry going; frontends renew it while they listen
+TELEMETRY_LEASE = 10.0
+
+_HEADER = struct.Struct(HEADER_FORMAT)
+_BATCH_HEADER = struct.Struct(HEADER_FORMAT + 'H')
+_ACK = struct.Struct(HEADER_FORMAT + 'dddd')
+_TELEMETRY_HEADER = struct.Struct('<BBHd')
+_FRAME_HEADER = struct.Struct('<BB4sHHHQd')
+_ARB_HEADER = struct.Struct(HEADER_FORMAT + 'BI')
+_ARB_POINT = struct.Struct('<f')
+
+
+class CodecError(ValueError):
+    """Raised for frames that do not match the expected schema."""
+    pass
+
+
+class Ack(NamedTuple):
+    """Backend acknowledgment. `sent` and `acked` are filled in by the frontend."""
+    correlation_id: int
+    ok: bool
+    received: float
+    started: float
+    done: float
+    error: str = ''
+    sent: float = 0.0
+    acked: float = 0.0
+    value: float = math.nan  # Result returned by the command, see MqttBackend.execute
+
+    @property
+    def hardware_time(self) -> float:
+        """Seconds spent in the instrument call(s)."""
+        return self.done - self.started
+
+    @property
+    def latency(self) -> float:
+        """Seconds from frontend send to ack reception (0 if unknown)."""
+        return self.acked - self.sent if self.sent else 0.0
+
+
+class Frame(NamedTuple):
+    """Decoded frame message. `data` is a view into the payload (pixels or ring name)."""
+    kind: int
+    dtype: str
+    height: int
+    width: int
+    slot: int
+    sequence: int
+    timestamp: float
+    data: memoryview
+
+    @property
+    def ring(self) -> str:
+        return bytes(self.data).decode('utf-8') if self.kind == FRAME_SHARED else ''
+
+
+class ArbWaveform(NamedTuple):
+    """Decoded arbitrary waveform upload. `points` is a view of little-endian float32 samples."""
+    correlation_id: int
+    slot: int
+    points: memoryview
+
+
+def ack_topic(topic: str) -> str:
+    """Reply topic for commands sent to `topic`."""
+    return topic + ACK_SUFFIX
+
+
+def telemetry_topic(topic: str) -> str:
+    """Topic on which the backend of `topic` publishes its measurements."""
+    return topic + TELEMETRY_SUFFIX
+
+
+def state_topic(topic: str) -> str:
+    """Retained topic holding the last known state of the device on `topic`."""
+    return topic + STATE_SUFFIX
+
+
+def frame_topic(topic: str) -> str:
+    """Topic on which the camera backend of `topic` publishes its frames."""
+    return topic + FRAME_SUFFIX
+
+
+def arb_topic(topic: str) -> str:
+    """Topic on which the AWG backend of `topic` takes arbitrary waveforms."""
+    return topic + ARB_SUFFIX
+
+
+def encode_frame(kind: int, dtype: str, height: int, width: int, slot: int, sequence: int,
+                 timestamp: float, data: bytes) -> bytes:
+    """Packs a frame message. `data` is the pixel buffer or the ring name (see Frame)."""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        header = _FRAME_HEADER.pack(WIRE_VERSION, kind, dtype.encode(), height, width, slot, sequence, timestamp)
+    except struct.error as e:
+        raise CodecError(f"Bad frame header {dtype} {height}x{width} | {e}")
+    return b''.join((header, data))
+
+
+def decode_frame(payload: bytes) -> Frame:
+    if len(payload) < _FRAME_HEADER.size:
+        raise CodecError(f"Frame message must be at least {_FRAME_HEADER.size} bytes, got {len(payload)}")
+    version, kind, dtype, height, width, slot, sequence, timestamp = _FRAME_HEADER.unpack_from(payload)
+    if version != WIRE_VERSION:
+        raise CodecError(f"Unsupported wire version {version} (expected {WIRE_VERSION})")
+    if kind not in (FRAME_INLINE, FRAME_SHARED):
+        raise CodecError(f"Unknown frame kind {kind}")
+    dtype = dtype.rstrip(b'\0').decode()
+    return Frame(kind, dtype, height, width, slot, sequence, timestamp, memoryview(payload)[_FRAME_HEADER.size:])
+
+
+def read_correlation_id(payload: bytes) -> int:
+    """Correlation id of any command or batch frame (0 if the frame is too short)."""
+    if len(payload) < _HEADER.size:
+        return 0
+    return _HEADER.unpack_from(payload)[3]
+
+
+class DeviceSchema:
+    """Fixed frame layout for the commands of one device type."""
+
+    def __init__(self, name: str, device_id: int, commands: Iterable[str], body_format: str,
+                 telemetry_fields: Iterable[str] = ()):
+        self.name = name
+        self.device_id = device_id
+        self.commands: Tuple[str, ...] = tuple(commands)
+        self.opcodes: Dict[str, int] = {cmd: i for i, cmd in enumerate(self.commands)}
+        # Header and body are packed in one call (no intermediate buffers)
+        self.frame = struct.Struct(HEADER_FORMAT + body_format)
+        self.size = self.frame.size
+        # One batch entry: opcode + body
+        self.entry = struct.Struct('<B' + body_format)
+        # One telemetry entry: channel + one float64 per field
+        self.telemetry_fields: Tuple[str, ...] = tuple(telemetry_fields)
+        self.telemetry_entry = struct.Struct('<B' + 'd' * len(self.telemetry_fields))
+
+    def encode(self, command: str, *fields, correlation_id: int = 0) -> bytes:
+        """Packs one command into a frame."""
+        opcode = self.opcodes.get(command)
+        if opcode is None:
+            raise CodecError(f"Unknown {self.name} command: {command!r}")
+        try:
+            return self.frame.pack(WIRE_VERSION, self.device_id, opcode, correlation_id, *fields)
+        except struct.error as e:
+            raise CodecError(f"Bad fields for {self.name} '{command}': {fields} | {e}")
+
+    def decode(self, payload: bytes) -> tuple:
+        """Unpacks a frame into (command, *fields)."""
+        if len(payload) != self.size:
+            raise CodecError(f"{self.name} frame must be {self.size} bytes, got {len(payload)}")
+        values = self.frame.unpack(payload)
+        self._check_header(values[0], values[1])
+        try:
+            command = self.commands[values[2]]
+        except IndexError:
+            raise CodecError(f"Unknown {self.name} opcode {values[2]}")
+        return (command,) + values[4:]
+
+    def encode_batch(self, commands: Iterable[tuple], correlation_id: int = 0) -> bytes:
+        """Packs several (command, *fields) tuples into one batch envelope."""
+        commands = list(commands)
+        parts = [_BATCH_HEADER.pack(WIRE_VERSION, self.device_id, BATCH_OPCODE, correlation_id, len(commands))]
+        for command, *fields in commands:
+            opcode = self.opcodes.get(command)
+            if opcode is None:
+                raise CodecError(f"Unknown {self.name} command: {command!r}")
+            try:
+                parts.append(self.entry.pack(opcode, *fields))
+            except struct.error as e:
+                raise CodecError(f"Bad fields for {self.name} '{command}': {fields} | {e}")
+        return b''.join(parts)
+
+    def decode_batch(self, payload: bytes) -> List[tuple]:
+        """Unpacks a batch envelope into a list of commands. A single frame gives a list of one."""
+        if len(payload) < 3 or payload[2] != BATCH_OPCODE:
+            return [self.decode(payload)]
+        if len(payload) < _BATCH_HEADER.size:
+            raise CodecError(f"Truncated {self.name} batch header")
+
+        version, device_id, _, _, count = _BATCH_HEADER.unpack_from(payload)
+        self._check_header(version, device_id)
+        if len(payload) != _BATCH_HEADER.size + count * self.entry.size:
+            raise CodecError(f"{self.name} batch of {count} has wrong length {len(payload)}")
+
+        commands = []
+        for values in self.entry.iter_unpack(memoryview(payload)[_BATCH_HEADER.size:]):
+            try:
+                command = self.commands[values[0]]
+            except IndexError:
+                raise CodecError(f"Unknown {self.name} opcode {values[0]}")
+            commands.append((command,) + values[1:])
+        return commands
+
+    def encode_ack(self, correlation_id: int, received: float, started: float, done: float,
+                   error: str = '', value: float = math.nan) -> bytes:
+        status = ACK_ERROR if error else ACK_OK
+        frame = _ACK.pack(WIRE_VERSION, self.device_id, status, correlation_id, received, started, done, value)
+        return frame + error.encode('utf-8') if error else frame
+
+    def decode_ack(self, payload: bytes) -> Ack:
+        if len(payload) < _ACK.size:
+            raise CodecError(f"{self.name} ack must be at least {_ACK.size} bytes, got {len(payload)}")
+        version, device_id, status, correlation_id, received, started, done, value = _ACK.unpack_from(payload)
+        self._check_header(version, device_id)
+        error = bytes(payload[_ACK.size:]).decode('utf-8', errors='replace')
+        return Ack(correlation_id, status == ACK_OK, received, started, done, error, value=value)
+
+    def encode_telemetry(self, timestamp: float, readings: Dict[int, tuple]) -> bytes:
+        """Packs {channel: (field values...)} measured at `timestamp`."""
+        parts = [_TELEMETRY_HEADER.pack(WIRE_VERSION, self.device_id, len(readings), timestamp)]
+        try:
+            for channel, values in readings.items():
+                parts.append(self.telemetry_entry.pack(channel, *values))
+        except struct.error as e:
+            raise CodecError(f"Bad {self.name} telemetry {readings} | {e}")
+        return b''.join(parts)
+
+    def decode_telemetry(self, payload: bytes) -> Tuple[float, Dict[int, tuple]]:
+        """Unpacks a telemetry frame into (timestamp, {channel: (field values...)})."""
+        if len(payload) < _TELEMETRY_HEADER.size:
+            raise CodecError(f"Truncated {self.name} telemetry header")
+        version, device_id, count, timestamp = _TELEMETRY_HEADER.unpack_from(payload)
+        self._check_header(version, device_id)
+        if len(payload) != _TELEMETRY_HEADER.size + count * self.telemetry_entry.size:
+            raise CodecError(f"{self.name} telemetry of {count} has wrong length {len(payload)}")
+        readings = {values[0]: values[1:] for values in
+                    self.telemetry_entry.iter_unpack(memoryview(payload)[_TELEMETRY_HEADER.size:])}
+        return timestamp, readings
+
+    def _check_header(self, version: int, device_id: int):
+        if version != WIRE_VERSION:
+            raise CodecError(f"Unsupported wire version {version} (expected {WIRE_VERSION})")
+        if device_id != self.device_id:
+            raise CodecError(f"Frame for device type {device_id} sent to {self.name}")
+
+
+# ==============================================================================
+#   DEVICE SCHEMAS
+#   (Append new commands at the end: the opcode is the position in the tuple)
+# ==============================================================================
+
+# ('freq', MHz) / ('ampl', mV) / ('enable', 0) / ('disable', 0)
+# ('sweep_start', MHz) / ('sweep_stop', MHz) / ('sweep_time', s) / ('sweep_mode', 0 linear or 1 log)
+# ('sweep', 1 on or 0 off) -> the sweep waits for ('trigger', 0), which starts one sweep
+#                             (Ack.value: time.time() of the trigger)
+# Arbitrary waveforms go on arb_topic(topic), see encode_arb
+AWG = DeviceSchema("awg", 1, ("enable", "disable", "freq", "ampl", "sweep_start", "sweep_stop", "sweep_time",
+                              "sweep_mode", "sweep", "trigger"), "d")
+
+# ('set', channel, volts) / ('enable', channel, 0) / ('disable', channel, 0)
+# ('watch', 0, period s) -> telemetry every `period` for TELEMETRY_LEASE seconds
+# ('rate', channel, V/s) / ('step', channel, V) -> ramp settings of the channel (kept)
+# ('ramp', channel, volts) -> ramps from the present setpoint in the backend; a later 'set' cancels it
+# ('point', channel, volts) x n + ('profile', channel, dwell s) -> plays the points / ('stop', channel or 0, 0)
+# Telemetry: {channel: (volts, amps, setpoint, ramp target or NaN)}
+POWER_SUPPLY = DeviceSchema("powersupply", 2,
+                            ("set", "enable", "disable", "watch", "rate", "step", "ramp", "point", "profile", "stop"),
+                            "Bd", telemetry_fields=("volts", "amps", "setpoint", "target"))
+
+# ('open', 0) / ('close', 0) / ('pulse', ms)
+# ('count', n) / ('period', ms) -> train of the next 'pulse' or 'arm' (sent in one batch with it)
+# ('arm', ms) -> pulse (train) on every external trigger edge / ('disarm', 0)
+SHUTTER = DeviceSchema("shutter", 3, ("open", "close", "pulse", "count", "period", "arm", "disarm"), "d")
+
+# ('clear', 0, 0, 0) / ('pulse', line, t_on ms, t_off ms) -> timing table of the next 'run' or 'arm'
+# ('run', 0, repeats, period ms) -> plays the table (0 repeats: continuously; 0 period: until the last pulse ends;
+#                                   period < 0: keep the period of the loaded table)
+# ('arm', 0, repeats, period ms) -> plays it on every trigger edge / ('stop', 0, 0, 0)
+PATTERN_GENERATOR = DeviceSchema("pattern", 4, ("clear", "pulse", "run", "arm", "stop"), "Bdd")
+
+
+def encode_arb(slot: int, points, correlation_id: int = 0) -> bytes:
+    """Packs an arbitrary waveform upload. `points` is a buffer of little-endian float32, e.g. a '<f4' array."""
+    points = memoryview(points).cast('B')
+    if len(points) % _ARB_POINT.size:
+        raise CodecError(f"ARB points must be float32, got {len(points)} bytes")
+    try:
+        header = _ARB_HEADER.pack(WIRE_VERSION, AWG.device_id, ARB_OPCODE, correlation_id, slot,
+                                  len(points) // _ARB_POINT.size)
+    except struct.error as e:
+        raise CodecError(f"Bad ARB header for slot {slot} | {e}")
+    return b''.join((header, points))
+
+
+def decode_arb(payload: bytes) -> ArbWaveform:
+    if len(payload) < _ARB_HEADER.size:
+        raise CodecError(f"ARB message must be at least {_ARB_HEADER.size} bytes, got {len(payload)}")
+    version, device_id, opcode, correlation_id, slot, count = _ARB_HEADER.unpack_from(payload)
+    AWG._check_header(version, device_id)
+    if opcode != ARB_OPCODE:
+        raise CodecError(f"Not an ARB message (opcode {opcode})")
+    if len(payload) != _ARB_HEADER.size + count * _ARB_POINT.size:
+        raise CodecError(f"ARB message of {count} points has wrong length {len(payload)}")
+    return ArbWaveform(correlation_id, slot, memoryview(payload)[_ARB_HEADER.size:])
@@ -0,0 +1,152 @@
+"""
+Ring buffer of camera frames in shared memory, for a backend and GUI on the same host.
+
+The backend writes each frame into the next slot and publishes only a small
+reference (ring name, slot, sequence, see codec.encode_frame) over MQTT; the
+frontend maps the same memory and gets a NumPy view of the frame without any
+copy or serialization.
+
+Layout of the shared block:
+
+    header       magic, layout version, slots, height, width, dtype ('<u2', ...)
+    sequences    slots x uint64   frame number held by the slot, 0 while it is written
+    timestamps   slots x float64  time.time() of each frame
+    frames       slots x height x width pixels, each slot 64-byte aligned
+
+A reader holds a view only while the writer has not come back around to the
+slot: check valid(slot, sequence) after using the data, and drop the result
+otherwise. With `slots` frames of headroom this only happens to a reader that
+is `slots` frames late. Backends name their ring per run (e.g. with the pid),
+so a frontend still mapping the ring of a previous run notices the new name.
+
+    # Backend
+    ring = FrameRing.create(f"cortex_hamamatsu_{os.getpid()}", (512, 512), "uint16")
+    slot, view = ring.begin_write(); camera.read_into(view); sequence = ring.commit(slot)
+
+    # Frontend, from a decoded frame message (codec.decode_frame)
+    ring = FrameRing.attach(message.ring)
+    frame = ring.frame(message.slot, message.sequence)   # ndarray view or None if overwritten
+"""
+import os
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+_MAGIC = b"CXFR"
+_LAYOUT_VERSION = 1
+_HEADER = struct.Struct('<4sHHII8s')
+_ALIGN = 64
+_created = set()  # Rings created by this process (the mock setup runs backend and GUI together)
+
+
+def _aligned(size: int) -> int:
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+class FrameRing:
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool):
+        self.shm = shm
+        self.owner = owner
+        magic, version, slots, height, width, dtype = _HEADER.unpack_from(shm.buf)
+        if magic != _MAGIC or version != _LAYOUT_VERSION:
+            shm.close()
+            raise ValueError(f"Shared memory {shm.name!r} is not a frame ring (layout {version})")
+
+        self.name = shm.name
+        self.slots = slots
+        self.shape: Tuple[int, int] = (height, width)
+        self.dtype = np.dtype(dtype.rstrip(b'\0').decode())
+
+        offset = _aligned(_HEADER.size)
+        self.sequences = np.ndarray((slots,), np.uint64, shm.buf, offset)
+        offset = _aligned(offset + self.sequences.nbytes)
+        self.timestamps = np.ndarray((slots,), np.float64, shm.buf, offset)
+        offset = _aligned(offset + self.timestamps.nbytes)
+        self.slot_bytes = _aligned(height * width * self.dtype.itemsize)
+        self._frames_offset = offset
+        self._next = int(self.sequences.max()) + 1  # Frame number of the next write
+
+    @classmethod
+    def create(cls, name: str, shape: Tuple[int, int], dtype="uint16", slots: int = 8) -> "FrameRing":
+        """Allocates a new ring (backend side). Replaces a stale ring of the same name."""
+        height, width = shape
+        dtype = np.dtype(dtype)
+        slot_bytes = _aligned(height * width * dtype.itemsize)
+        size = _aligned(_HEADER.size) + 2 * _aligned(slots * 8) + slots * slot_bytes
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            # Left over by a backend that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, _LAYOUT_VERSION, slots, height, width, dtype.str.encode())
+        _created.add(shm.name)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> "FrameRing":
+        """Maps an existing ring (frontend side)."""
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)  # Python >= 3.13
+        except TypeError:
+            shm = shared_memory.SharedMemory(name)
+            # Otherwise the resource tracker unlinks the backend's ring when this process exits
+            if os.name == "posix" and shm.name not in _created:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, owner=False)
+
+    def view(self, slot: int) -> np.ndarray:
+        """The frame memory of `slot` as a (height, width) array. No copy."""
+        offset = self._frames_offset + slot * self.slot_bytes
+        return np.ndarray(self.shape, self.dtype, self.shm.buf, offset)
+
+    # --- Writer ---
+
+    def begin_write(self) -> Tuple[int, np.ndarray]:
+        """Claims the next slot; fill the returned view, then commit(slot)."""
+        slot = self._next % self.slots
+        self.sequences[slot] = 0  # Readers of the previous frame in this slot see it is gone
+        return slot, self.view(slot)
+
+    def commit(self, slot: int, timestamp: float = 0.0) -> int:
+        """Publishes the frame written in `slot`. Returns its sequence number."""
+        sequence = self._next
+        self._next += 1
+        self.timestamps[slot] = timestamp
+        self.sequences[slot] = sequence
+        return sequence
+
+    def write(self, frame: np.ndarray, timestamp: float = 0.0) -> Tuple[int, int]:
+        """Copies `frame` into the next slot. Returns (slot, sequence)."""
+        slot, view = self.begin_write()
+        view[...] = frame
+        return slot, self.commit(slot, timestamp)
+
+    # --- Reader ---
+
+    def valid(self, slot: int, sequence: int) -> bool:
+        """True while `slot` still holds frame `sequence`."""
+        return int(self.sequences[slot]) == sequence
+
+    def frame(self, slot: int, sequence: int) -> Optional[np.ndarray]:
+        """Zero-copy view of frame `sequence`, or None if it was already overwritten."""
+        if not 0 <= slot < self.slots or not self.valid(slot, sequence):
+            return None
+        return self.view(slot)
+
+    def close(self):
+        # Views into the buffer must be gone before the mapping can close
+        self.sequences = self.timestamps = None
+        try:
+            self.shm.close()
+        except BufferError:
+            print(f"[FrameRing] {self.name}: frame views still in use, mapping left open")
+            return
+        if self.owner:
+            _created.discard(self.name)
+            self.shm.unlink()
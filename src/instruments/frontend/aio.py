@@ -0,0 +1,148 @@
+"""
+asyncio flavor of the frontend drivers for scripted control.
+
+Each call is awaited until the backend acknowledges it (see remote_device.py),
+so many instruments can be driven concurrently from one event loop:
+
+    async with AsyncRemoteAWG("TG2511A/0000") as awg, \\
+               AsyncRemotePowerSupply("RIGOLPS/0000") as psu:
+        await asyncio.gather(awg.set_frequency(15.5), psu.set_voltage(1, 5.0))
+
+The broker comes from broker_address, or CORTEX_MQTT_BROKER by default.
+Awaited calls cannot pile up behind the backend, so the coalescing outbox is
+off by default (flush_interval=0): every command goes out immediately.
+Errors reported by the backend raise CommandError; missing acks raise TimeoutError
+after the driver's ack_timeout. Cancelling an awaiting task (e.g. asyncio.wait_for)
+stops waiting for the ack; the command itself may still run in the backend.
+"""
+import asyncio
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+
+from src.instruments.codec import Ack
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.frontend.remote_device import RemoteDevice
+from src.instruments.frontend.frontend_awg import RemoteAWG
+from src.instruments.frontend.frontend_powersupply import RemotePowerSupply
+from src.instruments.frontend.frontend_shutter import RemoteShutter
+
+
+class AsyncRemoteDevice:
+    """Wraps a RemoteDevice; `driver` stays available for plain synchronous calls."""
+
+    def __init__(self, driver: RemoteDevice):
+        self.driver = driver
+        self.topic = driver.topic
+
+    async def _wait(self, future: Future) -> Ack:
+        return await asyncio.wrap_future(future)
+
+    @asynccontextmanager
+    async def batch(self):
+        """
+        Queue commands on the yielded synchronous driver; the batch is sent on exit
+        and awaited as one unit:
+
+            async with psu.batch() as b:
+                b.set_voltage(1, 5.0)
+                b.enable(1)
+        """
+        with self.driver.batch() as done:
+            yield self.driver
+        if not done.cancelled():  # Cancelled = empty batch, nothing was sent
+            await self._wait(done)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.driver.close()
+
+
+class AsyncRemoteAWG(AsyncRemoteDevice):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER, flush_interval: float = 0):
+        super().__init__(RemoteAWG(mqtt_topic, broker_address, flush_interval))
+
+    async def set_frequency(self, mhz: float) -> Ack:
+        """Sets frequency in MHz."""
+        return await self._wait(self.driver.set_frequency(mhz))
+
+    async def set_amplitude(self, mv: float) -> Ack:
+        """Sets amplitude in mV."""
+        return await self._wait(self.driver.set_amplitude(mv))
+
+    async def enable(self) -> Ack:
+        return await self._wait(self.driver.enable())
+
+    async def disable(self) -> Ack:
+        return await self._wait(self.driver.disable())
+
+    async def configure_sweep(self, start_mhz: float, stop_mhz: float, sweep_time: float, log: bool = False) -> Ack:
+        return await self._wait(self.driver.configure_sweep(start_mhz, stop_mhz, sweep_time, log))
+
+    async def trigger_sweep(self) -> Ack:
+        return await self._wait(self.driver.trigger_sweep())
+
+    async def upload_arb(self, slot: int, waveform, normalize: bool = False) -> Ack:
+        """Loads a waveform into ARB memory `slot`, see RemoteAWG.upload_arb."""
+        return await self._wait(self.driver.upload_arb(slot, waveform, normalize))
+
+
+class AsyncRemotePowerSupply(AsyncRemoteDevice):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER, flush_interval: float = 0):
+        super().__init__(RemotePowerSupply(mqtt_topic, broker_address, flush_interval))
+
+    async def set_voltage(self, channel: int, volts: float) -> Ack:
+        return await self._wait(self.driver.set_voltage(channel, volts))
+
+    async def enable(self, channel: int) -> Ack:
+        return await self._wait(self.driver.enable(channel))
+
+    async def disable(self, channel: int) -> Ack:
+        return await self._wait(self.driver.disable(channel))
+
+    async def ramp(self, channel: int, volts: float, rate: Optional[float] = None,
+                   step: Optional[float] = None) -> Ack:
+        """Resolves once the backend has started the ramp, see RemotePowerSupply.ramp."""
+        return await self._wait(self.driver.ramp(channel, volts, rate, step))
+
+    async def profile(self, channel: int, points: Iterable[float], dwell: float) -> Ack:
+        return await self._wait(self.driver.profile(channel, points, dwell))
+
+    async def stop_ramp(self, channel: int = 0) -> Ack:
+        return await self._wait(self.driver.stop_ramp(channel))
+
+
+class AsyncRemoteShutter(AsyncRemoteDevice):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER):
+        super().__init__(RemoteShutter(mqtt_topic, broker_address))
+
+    async def open(self) -> Ack:
+        return await self._wait(self.driver.open())
+
+    async def close_shutter(self) -> Ack:
+        return await self._wait(self.driver.close_shutter())
+
+    async def pulse(self, duration_ms: float, count: int = 1, period_ms: float = 0) -> Ack:
+        """Resolves once the backend has started the pulse."""
+        return await self._wait(self.driver.pulse(duration_ms, count, period_ms))
+
+    async def arm(self, duration_ms: float, count: int = 1, period_ms: float = 0) -> Ack:
+        return await self._wait(self.driver.arm(duration_ms, count, period_ms))
+
+    async def disarm(self) -> Ack:
+        return await self._wait(self.driver.disarm())
+
+
+if __name__ == "__main__":
+    async def main():
+        async with AsyncRemoteAWG("TG2511A/0000") as awg, AsyncRemotePowerSupply("RIGOLPS/0000") as psu:
+            acks = await asyncio.gather(awg.set_frequency(15.5), psu.set_voltage(1, 5.0), psu.enable(1))
+            for ack in acks:
+                print(f"id {ack.correlation_id}: round trip {ack.latency * 1e3:.1f} ms")
+
+    asyncio.run(main())
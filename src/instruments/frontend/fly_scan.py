@@ -0,0 +1,134 @@
+"""
+Fly scans: one hardware frequency sweep of the AWG instead of stepping it point by point.
+
+A stepped scan costs an MQTT round trip, a settling time and an acquisition
+per point. A fly scan starts the TG2511A sweep engine once and lets every
+sensor keep streaming; each sample is placed on the frequency axis from its
+own timestamp:
+
+    scan = FlyScan(awg, start_mhz=80.0, stop_mhz=120.0, sweep_time=2.0)
+    camera.rois_updated.connect(lambda t, sums: scan.add("roi1", t, sums["roi1"]))
+    wavemeter.reading_updated.connect(lambda ch, t, thz: scan.add(f"ch{ch}", t, thz))
+    scan.start()              # configures and triggers the sweep, records its start time
+    scan.wait()
+    freqs, counts = scan.spectrum("roi1", bins=200)
+
+The sweep start comes back in the ack of the trigger (Ack.value): the
+backend takes the midpoint of the *TRG;*OPC? round trip
+(TG2511A.trigger_sweep), so the start is known to about half a VISA round
+trip. Samples keep the time of the sensor that took them (camera exposure,
+wavemeter reading), so MQTT latency does not matter. The hosts of the AWG and
+sensor backends must share a clock (NTP): an offset of dt shifts the spectrum
+by dt * span / sweep_time.
+"""
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.instruments.codec import Ack
+from src.instruments.frontend.frontend_awg import RemoteAWG
+
+
+class FlyScan:
+    def __init__(self, awg: RemoteAWG, start_mhz: float, stop_mhz: float, sweep_time: float, log: bool = False):
+        """
+        Args:
+            sweep_time: duration of the sweep in s
+            log: logarithmic sweep (frequency grows geometrically with time)
+        """
+        if sweep_time <= 0:
+            raise ValueError(f"Sweep time must be positive, got {sweep_time}")
+        if log and (start_mhz <= 0 or stop_mhz <= 0):
+            raise ValueError("Logarithmic sweeps need positive frequencies")
+        self.awg = awg
+        self.start_mhz = start_mhz
+        self.stop_mhz = stop_mhz
+        self.sweep_time = sweep_time
+        self.log = log
+
+        self.started: Optional[float] = None  # time.time() of the sweep start
+
+        # name -> (timestamps, values), appended from the MQTT thread
+        self._samples: Dict[str, Tuple[List[float], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, timeout: float = 5.0) -> Ack:
+        """Sets up the sweep, then triggers it. Samples added before are discarded."""
+        self.awg.configure_sweep(self.start_mhz, self.stop_mhz, self.sweep_time, self.log).result(timeout)
+        with self._lock:
+            self._samples.clear()
+        ack = self.awg.trigger_sweep().result(timeout)
+        if math.isnan(ack.value):
+            raise RuntimeError(f"{self.awg.topic} did not report the sweep start")
+        self.started = ack.value
+        return ack
+
+    @property
+    def end(self) -> float:
+        """time.time() at which the sweep reaches stop_mhz."""
+        if self.started is None:
+            raise RuntimeError("Sweep not started")
+        return self.started + self.sweep_time
+
+    def wait(self, latency: float = 0.5):
+        """Returns once the sweep is over and the last samples had `latency` s to arrive."""
+        delay = self.end + latency - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    # --- Samples ---
+
+    def add(self, name: str, timestamp: float, value: float):
+        """Records one sensor sample (any thread), e.g. from MqttCamera.rois_updated."""
+        with self._lock:
+            timestamps, values = self._samples.setdefault(name, ([], []))
+            timestamps.append(timestamp)
+            values.append(value)
+
+    def names(self) -> List[str]:
+        with self._lock:
+            return list(self._samples)
+
+    def frequency_at(self, timestamps) -> np.ndarray:
+        """Sweep frequency in MHz at each time.time() in `timestamps`, NaN outside the sweep."""
+        if self.started is None:
+            raise RuntimeError("Sweep not started")
+        t = np.asarray(timestamps, dtype=np.float64) - self.started
+        if self.log:
+            return np.exp(np.interp(t, (0.0, self.sweep_time), np.log((self.start_mhz, self.stop_mhz)),
+                                    left=np.nan, right=np.nan))
+        return np.interp(t, (0.0, self.sweep_time), (self.start_mhz, self.stop_mhz), left=np.nan, right=np.nan)
+
+    def samples(self, name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(MHz, values) of the samples of `name` taken during the sweep, in sweep order."""
+        with self._lock:
+            timestamps, values = self._samples.get(name, ([], []))
+            timestamps, values = np.array(timestamps, dtype=np.float64), np.array(values, dtype=np.float64)
+        order = np.argsort(timestamps, kind='stable')
+        freqs, values = self.frequency_at(timestamps[order]), values[order]
+        inside = ~np.isnan(freqs)
+        return freqs[inside], values[inside]
+
+    def spectrum(self, name: str, bins: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (MHz, values) of `name` over the sweep. With `bins`, the samples are averaged
+        on a regular grid (geometric for log sweeps) and empty bins are NaN.
+        """
+        freqs, values = self.samples(name)
+        if bins is None:
+            return freqs, values
+        low, high = sorted((self.start_mhz, self.stop_mhz))
+        if self.log:
+            edges = np.geomspace(low, high, bins + 1)
+            centers = np.sqrt(edges[:-1] * edges[1:])
+        else:
+            edges = np.linspace(low, high, bins + 1)
+            centers = (edges[:-1] + edges[1:]) / 2
+        index = np.clip(np.searchsorted(edges, freqs, side='right') - 1, 0, bins - 1)
+        counts = np.bincount(index, minlength=bins)
+        sums = np.bincount(index, weights=values, minlength=bins)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return centers, np.where(counts > 0, sums / counts, np.nan)
@@ -1,46 +1,77 @@
-import paho.mqtt.client as mqtt
 import time
+import numpy as np
+from concurrent.futures import Future
+from src.instruments.codec import AWG, arb_topic, encode_arb
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.frontend.remote_device import RemoteDevice
 
-class RemoteAWG:
-    def __init__(self, mqtt_topic: str, broker_address="fys-s-dep-bkr01.fysad.fys.kuleuven.be"):
-        self.topic = mqtt_topic
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.connect(broker_address)
-        self.client.loop_start()
+class RemoteAWG(RemoteDevice):
+    schema = AWG
 
-    def set_frequency(self, mhz: float):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER, flush_interval: float = 0.05):
+        super().__init__(mqtt_topic, broker_address, flush_interval)
+
+    def set_frequency(self, mhz: float) -> Future:
         """Sets frequency in MHz."""
         # Backend expects: ('freq', value)
-        payload = f"('freq', {mhz})"
         print("FRONTEND AWG TRIGGERED frequency")
-        self.client.publish(self.topic, payload)
+        return self._send(('freq', mhz), coalesce_key='freq')
 
-    def set_amplitude(self, mv: float):
+    def set_amplitude(self, mv: float) -> Future:
         """Sets amplitude in mV."""
         # Backend expects: ('ampl', value)
-        payload = f"('ampl', {mv})"
-        self.client.publish(self.topic, payload)
+        return self._send(('ampl', mv), coalesce_key='ampl')
 
-    def enable(self):
+    def enable(self) -> Future:
         """Turns output ON."""
-        payload = "('enable', 0)"
         print("FRONTEND AWG TRIGGERED")
-        self.client.publish(self.topic, payload)
+        return self._send(('enable', 0))
 
-    def disable(self):
+    def disable(self) -> Future:
         """Turns output OFF."""
-        payload = "('disable', 0)"
-        self.client.publish(self.topic, payload)
+        return self._send(('disable', 0))
+
+    def configure_sweep(self, start_mhz: float, stop_mhz: float, sweep_time: float, log: bool = False) -> Future:
+        """Sets up a frequency sweep that waits for trigger_sweep (see fly_scan.py)."""
+        return self._send_all([('sweep_start', start_mhz), ('sweep_stop', stop_mhz), ('sweep_time', sweep_time),
+                               ('sweep_mode', 1 if log else 0), ('sweep', 1)])
+
+    def trigger_sweep(self) -> Future:
+        """Starts one sweep. The ack's value is the time.time() of the trigger."""
+        return self._send(('trigger', 0))
+
+    def disable_sweep(self) -> Future:
+        """Back to the fixed frequency."""
+        return self._send(('sweep', 0))
 
-    def close(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+    def upload_arb(self, slot: int, waveform, normalize: bool = False) -> Future:
+        """
+        Loads a waveform into ARB memory `slot` (1..4), points in units of full scale (-1..1).
+        Sent as raw float32 on the ARB topic and quantized by the backend; the future
+        resolves once the instrument memory was read back and verified.
+        """
+        if self._batch is not None:
+            raise RuntimeError("ARB uploads cannot be part of a batch")
+        points = np.asarray(waveform, dtype=np.float64).ravel()
+        if normalize:
+            peak = np.max(np.abs(points)) if len(points) else 0.0
+            if peak > 0:
+                points = points / peak
+        future = Future()
+        correlation_id = self._track(future)
+        payload = encode_arb(slot, points.astype('<f4'), correlation_id)
+        # A newer waveform for the same slot replaces one not sent yet
+        self._post(arb_topic(self.topic), payload, future, coalesce_key=('arb', slot))
+        return future
 
 # Usage Example
 if __name__ == "__main__":
     awg = RemoteAWG("TG2511A/0000")
-    awg.set_frequency(15.5) # 15.5 MHz
+    ack = awg.set_frequency(15.5).result(timeout=5) # 15.5 MHz, waits for the backend
+    print(f"Frequency set: hardware {ack.hardware_time * 1e3:.1f} ms, round trip {ack.latency * 1e3:.1f} ms")
     awg.set_amplitude(500)  # 500 mV
+    t = np.linspace(-1, 1, 4096)
+    awg.upload_arb(1, np.exp(-t ** 2 / 0.02)).result(timeout=5)  # Gaussian pulse into ARB1
     awg.enable()
     time.sleep(1)
     awg.close()
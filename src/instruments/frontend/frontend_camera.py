@@ -1,28 +1,74 @@
-from typing import Any
+import time
+from typing import Any, Dict, Optional, Tuple
+import numpy as np
 import paho.mqtt.client as mqtt
 from PyQt6.QtCore import QObject, pyqtSignal
+from src.instruments.codec import FRAME_SHARED, decode_frame, frame_topic
+from src.instruments.frame_ring import FrameRing
+from src.instruments.mqtt_connection import DEFAULT_BROKER, acquire_connection, release_connection
+
+Roi = Tuple[int, int, int, int]  # x, y, width, height in pixels
+
+
+def roi_sums(frame: np.ndarray, rois: Dict[str, Roi]) -> Dict[str, int]:
+    """Total counts in each region. Slicing is a view, so each sum reads only its ROI's pixels."""
+    return {name: int(frame[y:y + h, x:x + w].sum(dtype=np.int64)) for name, (x, y, w, h) in rois.items()}
+
+
+def downsample(frame: np.ndarray, factor: int) -> np.ndarray:
+    """Block sums of factor x factor pixels, scaled to uint8 for display."""
+    height, width = frame.shape[0] // factor * factor, frame.shape[1] // factor * factor
+    blocks = frame[:height, :width].reshape(height // factor, factor, width // factor, factor)
+    image = blocks.sum(axis=(1, 3), dtype=np.float32)
+    low, high = float(image.min()), float(image.max())
+    image -= low
+    image *= 255.0 / (high - low) if high > low else 0.0
+    return image.astype(np.uint8)
+
 
 class MqttCamera(QObject):
     count_updated = pyqtSignal(int)
+    rois_updated = pyqtSignal(float, object)  # timestamp, {roi name: counts}
+    image_updated = pyqtSignal(object)  # downsampled uint8 image
 
-    client = None
+    connection = None
     mqtt_path = ''
 
-    def __init__(self, resource_string: str):
+    def __init__(self, resource_string: str, broker_address=DEFAULT_BROKER,
+                 rois: Dict[str, Roi] = None, display_size: int = 128, display_interval: float = 0.1):
         super().__init__()
         self.mqtt_path = resource_string
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
+        self.frame_topic = frame_topic(resource_string)
+        self.broker_address = broker_address
+        self.rois: Dict[str, Roi] = dict(rois or {})
+        self.display_size = display_size  # Longest side of the live view, in pixels
+        self.display_interval = display_interval  # The live view is refreshed at most this often
+        self._rings: Dict[str, Optional[FrameRing]] = {}
+        self._last_display = 0.0
+        self.frames = 0
+        self.dropped = 0  # Shared frames overwritten before they were reduced
+        self.last_sums: Dict[str, int] = {}
 
     def open(self):
-        self.client.connect(host="fys-s-dep-bkr01.fysad.fys.kuleuven.be")
-        self.client.loop_start()
-
-    def on_connect(self, client: mqtt.Client, userdata, flags, rc, bla):
-        client.subscribe(self.mqtt_path)
+        self.connection = acquire_connection(self.broker_address)
+        self.connection.subscribe(self.mqtt_path, self.on_message)
+        self.connection.subscribe(self.frame_topic, self.on_frame)
         print('subscribed to ' + str(self.mqtt_path))
 
+    def close(self):
+        if self.connection:
+            self.connection.unsubscribe(self.mqtt_path, self.on_message)
+            self.connection.unsubscribe(self.frame_topic, self.on_frame)
+            release_connection(self.connection)
+            self.connection = None
+        for ring in self._rings.values():
+            if ring is not None:
+                ring.close()
+        self._rings.clear()
+
+    def set_rois(self, rois: Dict[str, Roi]):
+        self.rois = dict(rois)
+
     def on_message(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage):
         try:
             payload = message.payload.decode()
@@ -32,5 +78,57 @@ class MqttCamera(QObject):
         except Exception as e:
             print(f"Error parsing MQTT message for Camera: {e}")
 
+    def on_frame(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage):
+        """Reduces one frame on the MQTT thread; only the sums and a small image reach the GUI."""
+        try:
+            info = decode_frame(message.payload)
+            shape = (info.height, info.width)
+            if info.kind == FRAME_SHARED:
+                ring = self._ring(info.ring)
+                frame = ring.frame(info.slot, info.sequence) if ring else None
+            else:
+                ring = None
+                frame = np.frombuffer(info.data, info.dtype).reshape(shape)  # View of the payload
+            if frame is None or frame.shape != shape:
+                self.dropped += 1
+                return
+
+            sums = roi_sums(frame, self.rois)
+            now = time.monotonic()
+            image = None
+            if now - self._last_display >= self.display_interval:
+                self._last_display = now
+                image = downsample(frame, max(1, -(-max(shape) // self.display_size)))
+
+            # The backend may have reused the slot while we were reading it
+            if ring is not None and not ring.valid(info.slot, info.sequence):
+                self.dropped += 1
+                return
+        except Exception as e:
+            print(f"Error processing frame for Camera: {e}")
+            return
+
+        self.frames += 1
+        self.last_sums = sums
+        if sums:
+            self.rois_updated.emit(info.timestamp, sums)
+        if image is not None:
+            self.image_updated.emit(image)
+
+    def _ring(self, name: str) -> Optional[FrameRing]:
+        if name not in self._rings:
+            # A new name means the backend restarted with a new ring
+            for old in self._rings.values():
+                if old is not None:
+                    old.close()
+            self._rings.clear()
+            try:
+                self._rings[name] = FrameRing.attach(name)
+            except (FileNotFoundError, ValueError) as e:
+                # e.g. backend on another host: it must send inline frames instead
+                print(f"Camera frame ring {name!r} not available: {e}")
+                self._rings[name] = None
+        return self._rings[name]
+
     def getdata(self):
-        return 0
+        return sum(self.last_sums.values())
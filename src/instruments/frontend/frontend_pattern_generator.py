@@ -0,0 +1,54 @@
+from concurrent.futures import Future
+from typing import Iterable, Optional, Tuple
+from src.instruments.codec import PATTERN_GENERATOR
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.frontend.remote_device import RemoteDevice
+
+Step = Tuple[int, float, float]  # line, t_on ms, t_off ms
+
+class RemotePatternGenerator(RemoteDevice):
+    schema = PATTERN_GENERATOR
+
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER):
+        # Tables and runs are ordering sensitive: nothing to coalesce, send at once
+        super().__init__(mqtt_topic, broker_address, flush_interval=0)
+
+    def run(self, table: Optional[Iterable[Step]] = None, repeats: int = 1,
+            period_ms: Optional[float] = None) -> Future:
+        """
+        Plays a timing table `repeats` times (0: until stop) on the DAQ clock, one cycle
+        every `period_ms` (0 or None: until the last pulse ends). Without a table the one
+        already loaded is replayed, with its period unless `period_ms` is given (nothing
+        is uploaded).
+        """
+        return self._send_pattern('run', table, repeats, period_ms)
+
+    def arm(self, table: Optional[Iterable[Step]] = None, repeats: int = 1,
+            period_ms: Optional[float] = None) -> Future:
+        """Plays the table `repeats` times on every edge of the backend's trigger line, until stop."""
+        return self._send_pattern('arm', table, repeats, period_ms)
+
+    def stop(self) -> Future:
+        """Aborts the pattern; every line goes low."""
+        return self._send(('stop', 0, 0, 0))
+
+    def _send_pattern(self, mode: str, table, repeats: int, period_ms: Optional[float]) -> Future:
+        if table is None:
+            # -1: the backend keeps the period of the loaded table
+            return self._send((mode, 0, repeats, -1 if period_ms is None else period_ms))
+        if period_ms is None:
+            period_ms = 0
+        # The whole table and the run go out as one batch: one message per cycle
+        commands = [('clear', 0, 0, 0)]
+        commands += [('pulse', line, t_on, t_off) for line, t_on, t_off in table]
+        commands.append((mode, 0, repeats, period_ms))
+        return self._send_all(commands)
+
+
+if __name__ == "__main__":
+    generator = RemotePatternGenerator("pattern/0000")
+
+    # Cooling on line 0, repump on line 1, a 10 us ionisation gate on line 2
+    cycle = [(0, 0.0, 1.5), (1, 0.5, 2.0), (2, 1.0, 1.01)]
+    print(generator.run(cycle, repeats=100, period_ms=5.0).result(timeout=5))
+    generator.close()
@@ -1,39 +1,112 @@
-import paho.mqtt.client as mqtt
+import threading
 import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, Optional
+from src.instruments.codec import POWER_SUPPLY, TELEMETRY_LEASE, telemetry_topic
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.frontend.remote_device import RemoteDevice
 
-class RemotePowerSupply:
-    def __init__(self, mqtt_topic: str, broker_address="fys-s-dep-bkr01.fysad.fys.kuleuven.be"):
-        self.topic = mqtt_topic
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.connect(broker_address)
-        self.client.loop_start()
+class RemotePowerSupply(RemoteDevice):
+    schema = POWER_SUPPLY
 
-    def set_voltage(self, channel: int, volts: float):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER, flush_interval: float = 0.05):
+        super().__init__(mqtt_topic, broker_address, flush_interval)
+        self.telemetry_topic = telemetry_topic(mqtt_topic)
+        self._telemetry_callback: Optional[Callable[[float, Dict[int, tuple]], None]] = None
+        self._telemetry_period = 1.0
+        self._renew_timer: Optional[threading.Timer] = None
+
+    def set_voltage(self, channel: int, volts: float) -> Future:
         """Set voltage for a specific channel."""
         # Backend expects: ('set', channel, value)
-        payload = f"('set', {channel}, {volts})"
-        self.client.publish(self.topic, payload)
+        return self._send(('set', channel, volts), coalesce_key=('set', channel))
 
-    def enable(self, channel: int):
+    def enable(self, channel: int) -> Future:
         """Enable specific channel."""
         # Backend expects 3 items even for enable
-        payload = f"('enable', {channel}, 0)"
-        self.client.publish(self.topic, payload)
+        return self._send(('enable', channel, 0))
 
-    def disable(self, channel: int):
+    def disable(self, channel: int) -> Future:
         """Disable specific channel."""
-        payload = f"('disable', {channel}, 0)"
-        self.client.publish(self.topic, payload)
+        return self._send(('disable', channel, 0))
+
+    def ramp(self, channel: int, volts: float, rate: Optional[float] = None, step: Optional[float] = None) -> Future:
+        """
+        Ramps the channel to `volts` inside the backend, at `rate` V/s in steps of at
+        most `step` V (default: the channel's last rate/step). A later set_voltage or
+        ramp of the channel replaces it; the future resolves when the ramp has started.
+        """
+        settings = [(mode, channel, v) for mode, v in (('rate', rate), ('step', step)) if v is not None]
+        if not settings:
+            # Same key as set_voltage: the newest setpoint or ramp of the channel wins
+            return self._send(('ramp', channel, volts), coalesce_key=('set', channel))
+        return self._send_all(settings + [('ramp', channel, volts)])
+
+    def profile(self, channel: int, points: Iterable[float], dwell: float) -> Future:
+        """Writes the voltages `points` one after the other, every `dwell` s, inside the backend."""
+        return self._send_all([('point', channel, volts) for volts in points] + [('profile', channel, dwell)])
+
+    def stop_ramp(self, channel: int = 0) -> Future:
+        """Stops the ramp/profile of `channel` (0: all channels) at the present voltage."""
+        return self._send(('stop', channel, 0))
+
+    def watch(self, period: float) -> Future:
+        """Asks the backend for telemetry every `period` s for the next TELEMETRY_LEASE s."""
+        return self._send(('watch', 0, period))
+
+    # --- Telemetry ---
+
+    def subscribe_telemetry(self, callback: Callable[[float, Dict[int, tuple]], None], period: float = 1.0):
+        """
+        Calls callback(timestamp, {channel: (volts, amps, setpoint, ramp target)}) for every measurement
+        (on the MQTT network thread). The `period` lease is renewed until
+        unsubscribe_telemetry(); call again with a shorter period to speed up, e.g. during a scan.
+        """
+        if self._telemetry_callback is None:
+            self.connection.subscribe(self.telemetry_topic, self._on_telemetry)
+        self._telemetry_callback = callback
+        self._telemetry_period = period
+        self._renew_lease()
+
+    def unsubscribe_telemetry(self):
+        if self._telemetry_callback is None:
+            return
+        self._telemetry_callback = None  # The backend falls back to its idle rate when the lease ends
+        if self._renew_timer is not None:
+            self._renew_timer.cancel()
+            self._renew_timer = None
+        self.connection.unsubscribe(self.telemetry_topic, self._on_telemetry)
+
+    def _renew_lease(self):
+        if self._telemetry_callback is None:
+            return
+        if self._renew_timer is not None:
+            self._renew_timer.cancel()
+        self.watch(self._telemetry_period)
+        self._renew_timer = threading.Timer(TELEMETRY_LEASE / 2, self._renew_lease)
+        self._renew_timer.daemon = True
+        self._renew_timer.start()
+
+    def _on_telemetry(self, client, userdata, message):
+        try:
+            timestamp, readings = self.schema.decode_telemetry(message.payload)
+        except ValueError as e:
+            print(f"[{self.topic}] Bad telemetry: {e}")
+            return
+        callback = self._telemetry_callback
+        if callback is not None:
+            callback(timestamp, readings)
 
     def close(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+        self.unsubscribe_telemetry()
+        super().close()
 
 
 if __name__ == "__main__":
     psu = RemotePowerSupply("RIGOLPS/0000")
-    psu.set_voltage(1, 5.0)  # Set Ch1 to 5V
-    psu.enable(1)            # Turn Ch1 ON
+    with psu.batch():         # Sent as one envelope, executed atomically
+        psu.set_voltage(1, 5.0)  # Set Ch1 to 5V
+        psu.enable(1)            # Turn Ch1 ON
     time.sleep(2)
     psu.disable(1)           # Turn Ch1 OFF
     psu.close()
@@ -1,40 +1,53 @@
-import paho.mqtt.client as mqtt
 import time
+from concurrent.futures import Future
+from src.instruments.codec import SHUTTER
+from src.instruments.mqtt_connection import DEFAULT_BROKER
+from src.instruments.frontend.remote_device import RemoteDevice
 
-class RemoteShutter:
-    def __init__(self, mqtt_topic: str, broker_address="fys-s-dep-bkr01.fysad.fys.kuleuven.be"):
-        self.topic = mqtt_topic
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.connect(broker_address)
-        self.client.loop_start()
+class RemoteShutter(RemoteDevice):
+    schema = SHUTTER
 
-    def open(self):
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER):
+        # Every shutter command is ordering sensitive: nothing to coalesce, send at once
+        super().__init__(mqtt_topic, broker_address, flush_interval=0)
+
+    def open(self) -> Future:
         """Open the shutter permanently."""
         # Backend expects: ('open', value)
-        payload = "('open', 0)"
-        self.client.publish(self.topic, payload)
+        return self._send(('open', 0))
 
-    def close_shutter(self):
+    def close_shutter(self) -> Future:
         """Close the shutter immediately."""
-        payload = "('close', 0)"
-        self.client.publish(self.topic, payload)
+        return self._send(('close', 0))
+
+    def pulse(self, duration_ms: float, count: int = 1, period_ms: float = 0) -> Future:
+        """Pulse the shutter for X milliseconds, `count` times every `period_ms`."""
+        # Backend expects: ('pulse', duration), after the train settings
+        return self._send_train('pulse', duration_ms, count, period_ms)
+
+    def pulse_train(self, count: int, period_ms: float, duty: float = 0.5) -> Future:
+        """`count` pulses, one every `period_ms`, open for `duty` of each period."""
+        return self.pulse(period_ms * duty, count, period_ms)
 
-    def pulse(self, duration_ms: float):
-        """Pulse the shutter for X milliseconds."""
-        # Backend expects: ('pulse', duration)
-        payload = f"('pulse', {duration_ms})"
-        self.client.publish(self.topic, payload)
+    def arm(self, duration_ms: float, count: int = 1, period_ms: float = 0) -> Future:
+        """Pulse (train) on every edge of the backend's trigger line, until disarm/open/close."""
+        return self._send_train('arm', duration_ms, count, period_ms)
 
-    def close(self):
-        self.client.loop_stop()
-        self.client.disconnect()
+    def disarm(self) -> Future:
+        return self._send(('disarm', 0))
+
+    def _send_train(self, mode: str, duration_ms: float, count: int, period_ms: float) -> Future:
+        if count == 1:
+            return self._send((mode, duration_ms))
+        # Train settings apply to the next pulse/arm: one batch keeps them together
+        return self._send_all([('count', count), ('period', period_ms), (mode, duration_ms)])
 
 
 if __name__ == "__main__":
     shutter = RemoteShutter("shutter/0000")
-    
+
     print("Pulsing for 500ms...")
     shutter.pulse(500)
-    
+
     time.sleep(1)
     shutter.close()
@@ -1,41 +1,51 @@
-from typing import Any
+from typing import Any, Dict, List
 import paho.mqtt.client as mqtt
 from PyQt6.QtCore import QObject, pyqtSignal
+from src.instruments.mqtt_connection import DEFAULT_BROKER, acquire_connection, release_connection
 from collections import deque
 import statistics
 
+# Optional batched reading of every channel on <base>/frequency/all:
+# "[timestamp, ch1, ch2, ...]", a value <= 0 meaning "no reading" for that channel
+BATCH_CHANNEL = "all"
+
+
+def parse_reading(payload: bytes) -> List[float]:
+    """Numbers of a "[timestamp, value, ...]" payload. float() parses bytes, no decode needed."""
+    return [float(x) for x in payload.strip(b"[] \r\n").split(b",")]
+
+
 class MqttWavemeter(QObject):
     frequency_updated = pyqtSignal(float)
     sigma_updated = pyqtSignal(float)
 
     wavelength_value = 0.0
-    client = None
+    connection = None
     mqtt_path = ''
 
 
-    def __init__(self, resource_string: str):
+    def __init__(self, resource_string: str, broker_address=DEFAULT_BROKER):
         super().__init__()
         self.mqtt_path = resource_string
+        self.broker_address = broker_address
         self.history = deque(maxlen=20) # Store last 20 readings for stability calc
-        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
 
     def open(self):
-        # Using a dummy host for now as per original code, or localhost if testing
-        self.client.connect(host="fys-s-dep-bkr01.fysad.fys.kuleuven.be")
-        self.client.loop_start()
-
-    def on_connect(self,client: mqtt.Client, userdata, flags, rc, bla):
-        client.subscribe(self.mqtt_path)
+        # All channels share the same process-wide connection
+        self.connection = acquire_connection(self.broker_address)
+        self.connection.subscribe(self.mqtt_path, self.on_message)
         print('subscribed to '+str(self.mqtt_path))
 
+    def close(self):
+        if self.connection:
+            self.connection.unsubscribe(self.mqtt_path, self.on_message)
+            release_connection(self.connection)
+            self.connection = None
+
     def on_message(self,client: mqtt.Client,userdata: Any,message: mqtt.MQTTMessage,):
         try:
             # Payload format expected: "[timestamp, value]"
-            payload = message.payload.decode()
-            # Remove brackets and split
-            parts = payload.strip("[]").split(", ")
+            parts = parse_reading(message.payload)
             if len(parts) >= 2:
                 timestamp = float(parts[0])
                 value = float(parts[1])
@@ -61,7 +71,72 @@ class MqttWavemeter(QObject):
         # Deducing setpoint topic: HFWM/8731/frequency/X -> HFWM/8731/setpoint/X
         topic = self.mqtt_path.replace("frequency", "setpoint")
         print(f"[{self.mqtt_path}] Publishing setpoint {value} to {topic}")
-        self.client.publish(topic, str(value))
+        self.connection.publish(topic, str(value))
+
+
+class MqttWavemeterChannels(QObject):
+    """All channels of one wavemeter through a single '<base>/frequency/+' subscription.
+
+    Accepts the per-channel topics (<base>/frequency/N, "[timestamp, value]") and
+    the batched one (<base>/frequency/all, "[timestamp, v1, v2, ...]").
+    """
+    frequency_updated = pyqtSignal(int, float)  # channel, THz
+    reading_updated = pyqtSignal(int, float, float)  # channel, timestamp of the reading, THz
+    sigma_updated = pyqtSignal(int, float)
+
+    connection = None
+
+    def __init__(self, base_topic: str, channels: int = 8, broker_address=DEFAULT_BROKER):
+        super().__init__()
+        self.base_topic = base_topic.rstrip('/')
+        self.channels = channels
+        self.broker_address = broker_address
+        self.mqtt_filter = f"{self.base_topic}/frequency/+"
+        self.values: Dict[int, float] = {}
+        self.histories = {ch: deque(maxlen=20) for ch in range(1, channels + 1)}
+        self.timestamp = 0.0
+
+    def open(self):
+        self.connection = acquire_connection(self.broker_address)
+        self.connection.subscribe(self.mqtt_filter, self.on_message)
+        print('subscribed to ' + self.mqtt_filter)
+
+    def close(self):
+        if self.connection:
+            self.connection.unsubscribe(self.mqtt_filter, self.on_message)
+            release_connection(self.connection)
+            self.connection = None
+
+    def on_message(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage):
+        channel = message.topic.rsplit('/', 1)[-1]
+        try:
+            parts = parse_reading(message.payload)
+            self.timestamp = parts[0]
+            if channel == BATCH_CHANNEL:
+                for ch, value in enumerate(parts[1:self.channels + 1], start=1):
+                    self._update(ch, value)
+            elif len(parts) >= 2:
+                self._update(int(channel), parts[1])
+        except Exception as e:
+            print(f"Error parsing MQTT message on {message.topic}: {e}")
+
+    def _update(self, channel: int, value: float):
+        history = self.histories.get(channel)
+        if history is None or value <= 0:
+            return
+        self.values[channel] = value
+        history.append(value)
+        self.frequency_updated.emit(channel, value)
+        self.reading_updated.emit(channel, self.timestamp, value)
+        self.sigma_updated.emit(channel, statistics.stdev(history) if len(history) >= 2 else 999.0)
+
+    def getdata(self, channel: int) -> float:
+        return self.values.get(channel, 0.0)
+
+    def set_setpoint(self, channel: int, value: float):
+        topic = f"{self.base_topic}/setpoint/{channel}"
+        print(f"[{self.base_topic}] Publishing setpoint {value} to {topic}")
+        self.connection.publish(topic, str(value))
 
 
 if __name__ == "__main__":
@@ -70,9 +145,8 @@ if __name__ == "__main__":
     import sys
 
     app = QApplication(sys.argv)
-    wm = MqttWavemeter('HFWM/8731/frequency/1')
+    wm = MqttWavemeterChannels('HFWM/8731')
+    wm.frequency_updated.connect(lambda ch, f: print(f"Signal received: Ch{ch} {f}"))
     wm.open()
 
-    wm.frequency_updated.connect(lambda f: print(f"Signal received: {f}"))
-
     sys.exit(app.exec())
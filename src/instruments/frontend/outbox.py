@@ -0,0 +1,99 @@
+"""
+Last-value-wins outbox for frontend commands.
+
+Setpoints (voltage, frequency, ...) are keyed by (topic, command, channel).
+Isolated commands go out immediately; during a burst (typing, scripted
+stepping) the outbox holds commands for `flush_interval` seconds and only the
+latest value per key is sent, so the backend never works through a queue of
+stale VISA writes.
+
+Commands posted without a key (enable/disable, pulses, ...) are ordering
+sensitive: they are always sent, in order, and setpoints are never merged
+across them.
+"""
+import threading
+import time
+from typing import Hashable, List, Optional, Tuple
+
+from src.instruments.codec import read_correlation_id
+from src.instruments.tracing import tracer
+
+
+class CommandOutbox:
+    def __init__(self, connection, flush_interval: float = 0.05):
+        """
+        Args:
+            connection: shared MqttConnection used to publish
+            flush_interval: minimum time between two flushes in seconds
+                            (0 disables coalescing, every command is sent at once)
+        """
+        self.connection = connection
+        self.flush_interval = flush_interval
+
+        self.sent = 0
+        self.coalesced = 0
+
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()   # keeps flushes in order
+        self._pending: List[Tuple[str, bytes]] = []
+        self._latest = {}                    # key -> index in _pending, reset at every barrier
+        self._timer: Optional[threading.Timer] = None
+        self._last_flush = 0.0
+
+    def post(self, topic: str, payload: bytes, coalesce_key: Optional[Hashable] = None) -> Optional[bytes]:
+        """
+        Queues a command.
+
+        Args:
+            coalesce_key: e.g. ('set', channel). Commands with the same topic and key
+                          replace each other until the next flush. None = never coalesce.
+
+        Returns:
+            The payload this command superseded (it will never be sent), or None.
+        """
+        superseded = None
+        with self._lock:
+            if coalesce_key is None:
+                self._pending.append((topic, payload))
+                self._latest.clear()  # Barrier: later setpoints must stay after this one
+            else:
+                key = (topic, coalesce_key)
+                index = self._latest.get(key)
+                if index is not None:
+                    superseded = self._pending[index][1]
+                    self._pending[index] = (topic, payload)
+                    self.coalesced += 1
+                else:
+                    self._latest[key] = len(self._pending)
+                    self._pending.append((topic, payload))
+
+            if self._timer is not None:
+                return superseded  # A flush is already scheduled
+
+            wait = self._last_flush + self.flush_interval - time.monotonic()
+            if wait > 0:
+                self._timer = threading.Timer(wait, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+                return superseded
+
+        # Quiet period: send right away (no added latency for single commands)
+        self.flush()
+        return superseded
+
+    def flush(self):
+        """Sends everything pending now."""
+        with self._send_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._latest.clear()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._last_flush = time.monotonic()
+
+            for topic, payload in pending:
+                self.connection.publish(topic, payload)
+                if tracer.enabled:
+                    tracer.published(read_correlation_id(payload))
+            self.sent += len(pending)
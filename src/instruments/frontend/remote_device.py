@@ -0,0 +1,229 @@
+"""
+Common base for the MQTT frontend drivers (RemoteAWG, RemotePowerSupply, RemoteShutter).
+
+A subclass sets `schema` (see codec.py) and sends its commands as tuples
+through `_send`, or `_send_all` for commands that must run together. The base
+handles the shared connection, the coalescing outbox, batch envelopes and
+acknowledgments.
+
+Every command carries a correlation id and returns a concurrent.futures.Future
+that resolves with the backend's Ack (timestamps for receive, hardware start
+and hardware done) or fails with CommandError / TimeoutError:
+
+    awg.set_frequency(15.5).result(timeout=5)      # wait for exact completion
+    psu.enable(1).add_done_callback(on_done)       # or get called back
+
+Futures are resolved on the MQTT network thread; keep callbacks short.
+"""
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from src.instruments.codec import Ack, DeviceSchema, ack_topic, read_correlation_id
+from src.instruments.mqtt_connection import DEFAULT_BROKER, acquire_connection, release_connection
+from src.instruments.frontend.outbox import CommandOutbox
+from src.instruments.tracing import tracer
+
+# Random start so two GUIs/scripts on the same device are unlikely to collide
+_correlation_ids = itertools.count(random.randrange(1, 0xFFFFFFFF))
+
+
+def _next_correlation_id() -> int:
+    return next(_correlation_ids) % 0xFFFFFFFF + 1  # 1 .. 2**32-1, 0 means "no ack"
+
+
+def _settle(future: Future, result=None, exception: Optional[BaseException] = None):
+    """Completes `future` unless it is already done, e.g. cancelled by an asyncio task that timed out."""
+    if not future.set_running_or_notify_cancel():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+class CommandError(Exception):
+    """The backend reported an error for a command (details in .ack)."""
+
+    def __init__(self, ack: Ack):
+        super().__init__(ack.error)
+        self.ack = ack
+
+
+class RemoteDevice:
+    schema: DeviceSchema = None
+
+    def __init__(self, mqtt_topic: str, broker_address=DEFAULT_BROKER, flush_interval: float = 0.05,
+                 ack_timeout: float = 10.0):
+        self.topic = mqtt_topic
+        self.ack_timeout = ack_timeout
+        # Shared with every other driver on this broker (one socket, one network thread)
+        self.connection = acquire_connection(broker_address)
+        # Collapses superseded setpoints (see outbox.py), flush_interval in seconds
+        self.outbox = CommandOutbox(self.connection, flush_interval)
+        self._batch: Optional[List[tuple]] = None
+        self._batch_future: Optional[Future] = None
+
+        # correlation id -> (future, time.time() at send)
+        self._pending: Dict[int, Tuple[Future, float]] = {}
+        self._pending_lock = threading.Lock()
+        # Fires when the oldest pending command runs out of time (see _expire)
+        self._expiry_timer: Optional[threading.Timer] = None
+        self.connection.subscribe(ack_topic(self.topic), self._on_ack)
+
+    def _send(self, command: tuple, coalesce_key: Optional[Hashable] = None) -> Future:
+        """Encodes and posts one command, or adds it to the open batch."""
+        if self._batch is not None:
+            self._batch.append(command)
+            return self._batch_future
+
+        future = Future()
+        correlation_id = self._track(future)  # Before posting: the ack may come back immediately
+        self._post(self.topic, self.schema.encode(*command, correlation_id=correlation_id), future, coalesce_key)
+        return future
+
+    def _post(self, topic: str, payload: bytes, future: Future, coalesce_key: Optional[Hashable] = None):
+        """Posts an encoded message tracked by `future` (see _track)."""
+        superseded = self.outbox.post(topic, payload, coalesce_key)
+        if superseded is not None:
+            # The older setpoint is never sent: it completes together with this one
+            superseded_id = read_correlation_id(superseded)
+            if tracer.enabled:
+                tracer.discard(superseded_id)
+            self._chain(superseded_id, future)
+
+    def _send_all(self, commands) -> Future:
+        """Sends commands that must reach the backend together: joins the open batch, or makes one."""
+        if self._batch is not None:
+            self._batch.extend(commands)
+            return self._batch_future
+        with self.batch() as done:
+            for command in commands:
+                self._send(command)
+        return done
+
+    @contextmanager
+    def batch(self):
+        """
+        Groups the commands issued inside the block into one envelope that the
+        backend executes as one unit (single lock, single instrument write if possible).
+        Yields the future of the whole batch:
+
+            with psu.batch() as done:
+                for ch in (1, 2, 3):
+                    psu.set_voltage(ch, 5.0)
+                for ch in (1, 2, 3):
+                    psu.enable(ch)
+            done.result(timeout=5)
+
+        Nothing is sent if the block raises. Not meant to be shared between threads.
+        """
+        future = Future()
+        self._batch = []
+        self._batch_future = future
+        try:
+            yield future
+            commands = self._batch
+        finally:
+            self._batch = None
+            self._batch_future = None
+
+        if commands:
+            correlation_id = self._track(future)
+            self.outbox.post(self.topic, self.schema.encode_batch(commands, correlation_id))
+        else:
+            future.cancel()
+
+    # --- Acknowledgments ---
+
+    def _track(self, future: Future) -> int:
+        correlation_id = _next_correlation_id()
+        now = time.time()
+        with self._pending_lock:
+            self._pending[correlation_id] = (future, now)
+            self._schedule_expiry()
+        # A cancelled command no longer waits for its ack
+        future.add_done_callback(lambda done: done.cancelled() and self._forget(correlation_id))
+        if tracer.enabled:
+            tracer.start(self.topic, correlation_id)
+        return correlation_id
+
+    def _forget(self, correlation_id: int):
+        with self._pending_lock:
+            self._pending.pop(correlation_id, None)
+
+    def _schedule_expiry(self):
+        """Arms the timer for the oldest pending command (dict keeps send order). _pending_lock held."""
+        if self._expiry_timer is not None or not self._pending:
+            return
+        _, sent = next(iter(self._pending.values()))
+        self._expiry_timer = threading.Timer(max(0.0, sent + self.ack_timeout - time.time()), self._expire)
+        self._expiry_timer.daemon = True
+        self._expiry_timer.start()
+
+    def _expire(self):
+        """Fails commands that were never acknowledged, whether or not anything else is sent."""
+        now = time.time()
+        expired = []
+        with self._pending_lock:
+            self._expiry_timer = None
+            for correlation_id, (future, sent) in self._pending.items():
+                if now - sent < self.ack_timeout:
+                    break
+                expired.append((correlation_id, future))
+            for correlation_id, _ in expired:
+                del self._pending[correlation_id]
+            self._schedule_expiry()
+        # Resolved without the lock: a done-callback may send the next command
+        for correlation_id, future in expired:
+            _settle(future, exception=TimeoutError(
+                f"No ack from {self.topic} within {self.ack_timeout}s (id {correlation_id})"))
+
+    def _chain(self, correlation_id: int, future: Future):
+        with self._pending_lock:
+            entry = self._pending.pop(correlation_id, None)
+        if entry is None:
+            return
+        old_future = entry[0]
+
+        def copy_outcome(done: Future):
+            if done.cancelled():
+                old_future.cancel()
+            else:
+                _settle(old_future, done.result() if done.exception() is None else None, done.exception())
+
+        future.add_done_callback(copy_outcome)
+
+    def _on_ack(self, client, userdata, message):
+        try:
+            ack = self.schema.decode_ack(message.payload)
+        except ValueError as e:
+            print(f"[{self.topic}] Bad ack: {e}")
+            return
+
+        with self._pending_lock:
+            entry = self._pending.pop(ack.correlation_id, None)
+        if entry is None:
+            return  # Timed out already, or a command from another client
+
+        future, sent = entry
+        ack = ack._replace(sent=sent, acked=time.time())
+        if tracer.enabled:
+            tracer.complete(ack.correlation_id, ack)
+        _settle(future, ack, None if ack.ok else CommandError(ack))
+
+    def close(self):
+        self.outbox.flush()
+        self.connection.unsubscribe(ack_topic(self.topic), self._on_ack)
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            if self._expiry_timer is not None:
+                self._expiry_timer.cancel()
+                self._expiry_timer = None
+        for future, _ in pending.values():
+            future.cancel()
+        release_connection(self.connection)
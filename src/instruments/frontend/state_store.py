@@ -0,0 +1,107 @@
+"""
+Frontend mirror of the retained backend state snapshots (see codec.state_topic).
+
+One wildcard subscription (STATE_FILTER) receives the snapshot of every
+device; the broker delivers all retained snapshots right after subscribing,
+so the GUI knows the last state of each instrument before drawing anything.
+
+    store = get_state_store()
+    store.get("RIGOLPS/0000", "ch1_volt")           # -> 5.0 or None
+    store.watch("RIGOLPS/0000", on_values)          # on_values({"ch1_volt": 5.0, ...})
+
+Watch callbacks run on the MQTT network thread.
+"""
+import json
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+from src.instruments.codec import STATE_FILTER, STATE_SUFFIX
+from src.instruments.mqtt_connection import (DEFAULT_BROKER, MqttConnection, acquire_connection,
+                                             release_connection)
+
+StateCallback = Callable[[Dict[str, Any]], None]
+
+
+class StateStore:
+    def __init__(self, connection: MqttConnection):
+        self.connection = connection
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._timestamps: Dict[str, float] = {}
+        self._listeners: Dict[str, List[StateCallback]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.connection.subscribe(STATE_FILTER, self._on_state)
+
+    def close(self):
+        self.connection.unsubscribe(STATE_FILTER, self._on_state)
+
+    def get(self, topic: str, name: str, default=None):
+        with self._lock:
+            return self._states.get(topic, {}).get(name, default)
+
+    def snapshot(self, topic: str) -> Dict[str, Any]:
+        """Copy of every known value of the device on `topic`."""
+        with self._lock:
+            return dict(self._states.get(topic, {}))
+
+    def timestamp(self, topic: str) -> float:
+        """time.time() at which the backend published the last snapshot (0 if none)."""
+        return self._timestamps.get(topic, 0.0)
+
+    def watch(self, topic: str, callback: StateCallback):
+        """Calls callback(values) now with the known snapshot, then with every new one."""
+        with self._lock:
+            self._listeners[topic].append(callback)
+            values = dict(self._states.get(topic, {}))
+        if values:
+            callback(values)
+
+    def unwatch(self, topic: str, callback: StateCallback):
+        with self._lock:
+            if callback in self._listeners.get(topic, ()):
+                self._listeners[topic].remove(callback)
+
+    def _on_state(self, client, userdata, message):
+        topic = message.topic[:-len(STATE_SUFFIX)]
+        try:
+            snapshot = json.loads(message.payload)
+            values = snapshot["values"]
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[StateStore] Bad snapshot on {message.topic}: {e}")
+            return
+
+        with self._lock:
+            self._states.setdefault(topic, {}).update(values)
+            self._timestamps[topic] = snapshot.get("timestamp", 0.0)
+            listeners = list(self._listeners.get(topic, ()))
+        for callback in listeners:
+            callback(dict(values))
+
+
+# ==============================================================================
+#   SHARED STORE (one per broker, started on first use)
+# ==============================================================================
+
+_stores: Dict[str, StateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_state_store(broker_address: str = DEFAULT_BROKER) -> StateStore:
+    with _stores_lock:
+        store = _stores.get(broker_address)
+        if store is None:
+            store = StateStore(acquire_connection(broker_address))
+            store.start()
+            _stores[broker_address] = store
+    return store
+
+
+def close_state_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+        _stores.clear()
+    for store in stores:
+        store.close()
+        release_connection(store.connection)
@@ -0,0 +1,244 @@
+"""
+Process-wide metrics (counters, gauges, histograms) in the Prometheus text format.
+
+Everything that moves is counted here instead of only being printed: MQTT
+messages in and out per topic, handler time per topic, backend queue depth,
+hardware (VISA / DAQ) call durations, telemetry reads and GUI updates.
+render() returns the text exposition format (version 0.0.4), and
+start_http_server() serves it on http://127.0.0.1:<port>/metrics for
+Prometheus, Grafana or simply curl:
+
+    python backend_main.py --metrics-port 9101
+    curl -s localhost:9101/metrics | grep hardware_seconds
+
+Updating a metric is a dict lookup and a short lock (about 2 us), so it is
+always on. Label values are given positionally, in the order of labelnames:
+
+    MESSAGES_IN = registry.counter("cortex_mqtt_messages_received_total", "...", ("topic",))
+    MESSAGES_IN.labels(message.topic).inc()
+
+    with HARDWARE_SECONDS.labels("RIGOLPS/0000").time():
+        psu.set_voltage(1, 5.0)
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds, from a fast socket write to a slow instrument
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _CounterChild:
+    __slots__ = ("_value", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name: str, label_text: str) -> List[str]:
+        return [f"{name}{label_text} {_format_value(self._value)}"]
+
+
+class _GaugeChild:
+    __slots__ = ("_value", "_function", "_lock")
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Evaluated at every scrape instead of being pushed (e.g. a queue depth)."""
+        self._function = function
+
+    def samples(self, name: str, label_text: str) -> List[str]:
+        value = self._value
+        if self._function is not None:
+            try:
+                value = float(self._function())
+            except Exception:
+                value = math.nan
+        return [f"{name}{label_text} {_format_value(value) if not math.isnan(value) else 'NaN'}"]
+
+
+class _HistogramChild:
+    __slots__ = ("_buckets", "_counts", "_sum", "_count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # Last one is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self):
+        """Observes the duration of the block (time.perf_counter)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def samples(self, name: str, label_text: str) -> List[str]:
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        inner = label_text[1:-1] + "," if label_text else ""
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self._buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{inner}le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{name}_sum{label_text} {_format_value(total)}")
+        lines.append(f"{name}_count{label_text} {count}")
+        return lines
+
+
+class Metric:
+    def __init__(self, kind: str, name: str, documentation: str, labelnames: Sequence[str], child_factory):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self._child_factory = child_factory
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """The time series for these label values (created on first use)."""
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(key, self._child_factory())
+        return child
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(value) for value in values), None)
+
+    # Metrics without labels are used directly: COUNTER.inc()
+    def __getattr__(self, attribute):
+        if attribute.startswith('_') or self.labelnames:
+            raise AttributeError(attribute)
+        return getattr(self.labels(), attribute)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {_escape(self.documentation)}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = sorted(self._children.items())
+        for values, child in children:
+            lines.extend(child.samples(self.name, _label_text(self.labelnames, values)))
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, kind: str, name: str, documentation: str, labelnames, child_factory) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(kind, name, documentation, labelnames, child_factory)
+            elif metric.kind != kind or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind} {metric.labelnames}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._get_or_create("counter", name, documentation, labelnames, _CounterChild)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Metric:
+        return self._get_or_create("gauge", name, documentation, labelnames, _GaugeChild)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        buckets = tuple(sorted(buckets))
+        return self._get_or_create("histogram", name, documentation, labelnames, lambda: _HistogramChild(buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# One registry per process (the GUI, or the backend host)
+registry = Registry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = registry
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape would drown the console
+
+
+def start_http_server(port: int, host: str = "127.0.0.1", metrics_registry: Registry = registry) -> ThreadingHTTPServer:
+    """Serves /metrics from a daemon thread. Stop it with server.shutdown()."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": metrics_registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=f"metrics:{port}", daemon=True).start()
+    print(f"[Metrics] Serving http://{host}:{server.server_address[1]}/metrics")
+    return server
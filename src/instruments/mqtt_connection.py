@@ -0,0 +1,167 @@
+"""
+Process-wide MQTT connection shared by every frontend driver.
+
+Instead of every instrument owning a paho client (one socket and one network
+thread each), drivers acquire the connection for their broker and register a
+handler per topic. The connection keeps one client, re-subscribes after a
+reconnect and routes incoming messages to the registered handlers.
+
+Usage:
+    connection = acquire_connection("localhost")
+    connection.subscribe("HFWM/8731/frequency/1", my_handler)
+    connection.publish("TG2511A/0000", payload)
+    release_connection(connection)
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List
+
+import paho.mqtt.client as mqtt
+from src.instruments.metrics import registry
+from src.instruments.topic_router import TopicRouter
+
+# Override with e.g. CORTEX_MQTT_BROKER=localhost to run against a local broker
+DEFAULT_BROKER = os.environ.get("CORTEX_MQTT_BROKER", "fys-s-dep-bkr01.fysad.fys.kuleuven.be")
+DEFAULT_PORT = int(os.environ.get("CORTEX_MQTT_PORT", "1883"))
+
+# Handlers use the same signature as paho's per-topic callbacks
+MessageHandler = Callable[[mqtt.Client, object, mqtt.MQTTMessage], None]
+
+_messages_in = registry.counter("cortex_mqtt_messages_received_total", "MQTT messages received", ("topic",))
+_bytes_in = registry.counter("cortex_mqtt_received_bytes_total", "MQTT payload bytes received", ("topic",))
+_messages_out = registry.counter("cortex_mqtt_messages_published_total", "MQTT messages published", ("topic",))
+_bytes_out = registry.counter("cortex_mqtt_published_bytes_total", "MQTT payload bytes published", ("topic",))
+_handler_seconds = registry.histogram("cortex_mqtt_handler_seconds",
+                                      "Time spent in the message handlers (network thread)", ("topic",))
+
+
+class MqttConnection:
+    """
+    One paho client shared by all drivers talking to the same broker.
+    Subscriptions are reference counted per topic filter, so several drivers
+    can listen to the same topic without subscribing twice on the broker.
+    Incoming messages are routed through a TopicRouter (see topic_router.py).
+    """
+
+    def __init__(self, broker_address: str = DEFAULT_BROKER, port: int = DEFAULT_PORT):
+        self.broker_address = broker_address
+        self.port = port
+        self.connected = False
+        self.users = 0
+
+        self._lock = threading.RLock()
+        self._router = TopicRouter()
+        self._started = False
+
+        self.client = mqtt.Client(callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self.on_connect
+        self.client.on_message = self.on_message
+
+    def open(self):
+        """Connects and starts the network thread (only once per connection)."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        try:
+            self.client.connect(host=self.broker_address, port=self.port)
+        except Exception:
+            with self._lock:
+                self._started = False
+            raise
+        self.client.loop_start()
+
+    def close(self):
+        with self._lock:
+            if not self._started:
+                return
+            self._started = False
+            self.connected = False
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    # --- paho callbacks ---
+
+    def on_connect(self, client, userdata, flags, rc, props=None):
+        if rc != 0:
+            print(f"[MQTT] Connection to {self.broker_address} refused: {rc}")
+            return
+        with self._lock:
+            self.connected = True
+            topics = self._router.filters()
+        # (Re)subscribe everything, also after an automatic reconnect
+        for topic in topics:
+            client.subscribe(topic)
+        print(f"[MQTT] Connected to {self.broker_address}, {len(topics)} subscription(s)")
+
+    def on_message(self, client, userdata, message):
+        start = time.perf_counter()
+        handlers = self._handlers_for(message.topic)
+        for handler in handlers:
+            try:
+                handler(client, userdata, message)
+            except Exception as e:
+                print(f"[MQTT] Handler error on {message.topic}: {e}")
+        _handler_seconds.labels(message.topic).observe(time.perf_counter() - start)
+        _messages_in.labels(message.topic).inc()
+        _bytes_in.labels(message.topic).inc(len(message.payload))
+
+    # --- Routing ---
+
+    def _handlers_for(self, topic: str) -> List[MessageHandler]:
+        return self._router.match(topic)
+
+    def subscribe(self, topic: str, handler: MessageHandler):
+        """Registers `handler` for messages on `topic` (wildcards allowed)."""
+        with self._lock:
+            first = self._router.add(topic, handler)
+            connected = self.connected
+        if first and connected:
+            self.client.subscribe(topic)
+
+    def unsubscribe(self, topic: str, handler: MessageHandler):
+        with self._lock:
+            last = self._router.remove(topic, handler)
+            connected = self.connected
+        if last and connected:
+            self.client.unsubscribe(topic)
+
+    def publish(self, topic: str, payload, qos: int = 0, retain: bool = False):
+        _messages_out.labels(topic).inc()
+        _bytes_out.labels(topic).inc(len(payload) if payload else 0)
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+
+# ==============================================================================
+#   SHARED REGISTRY (one connection per broker and port)
+# ==============================================================================
+
+_connections: Dict[tuple, MqttConnection] = {}
+_registry_lock = threading.Lock()
+
+
+def acquire_connection(broker_address: str = DEFAULT_BROKER, port: int = DEFAULT_PORT) -> MqttConnection:
+    """Returns the shared connection for this broker, opening it on first use."""
+    key = (broker_address, port)
+    with _registry_lock:
+        connection = _connections.get(key)
+        if connection is None:
+            connection = MqttConnection(broker_address, port)
+            _connections[key] = connection
+        # Opened under the registry lock so no driver publishes before connect()
+        connection.open()
+        connection.users += 1
+    return connection
+
+
+def release_connection(connection: MqttConnection):
+    """Drops one user of the connection and closes it when nobody uses it anymore."""
+    key = (connection.broker_address, connection.port)
+    with _registry_lock:
+        connection.users -= 1
+        if connection.users > 0:
+            return
+        if _connections.get(key) is connection:
+            del _connections[key]
+    connection.close()
@@ -0,0 +1,130 @@
+"""
+MQTT topic router: maps subscription filters to subscribers in a trie of topic levels.
+
+match() walks the levels of a topic once, following the exact child, the '+'
+child and collecting '#' children on the way, so the cost depends on the
+topic depth and not on the number of subscriptions. A subscriber whose
+filters overlap (e.g. "a/#" and "a/+") is returned only once per topic.
+
+Used by MqttConnection, the mock broker and the fake backend. Does not import
+paho, so the mock can use it before it is patched in.
+
+    router = TopicRouter()
+    router.add("HFWM/8731/frequency/+", handler)
+    for handler in router.match("HFWM/8731/frequency/3"):
+        ...
+"""
+import threading
+from typing import Any, Dict, List
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Returns True if `topic` matches the MQTT subscription `topic_filter` ('+' and '#' wildcards)."""
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.subscribers: List[Any] = []
+
+
+class TopicRouter:
+    def __init__(self):
+        self._root = _Node()
+        self._filters: Dict[str, _Node] = {}  # filter -> node holding its subscribers
+        self._lock = threading.Lock()
+
+    def add(self, topic_filter: str, subscriber) -> bool:
+        """Registers `subscriber` for `topic_filter`. Returns True if the filter is new."""
+        with self._lock:
+            node = self._filters.get(topic_filter)
+            first = node is None
+            if first:
+                node = self._root
+                for level in topic_filter.split('/'):
+                    node = node.children.setdefault(level, _Node())
+                self._filters[topic_filter] = node
+            node.subscribers.append(subscriber)
+            return first
+
+    def remove(self, topic_filter: str, subscriber) -> bool:
+        """Unregisters one registration. Returns True if the filter has no subscriber left."""
+        with self._lock:
+            node = self._filters.get(topic_filter)
+            if node is None or subscriber not in node.subscribers:
+                return False
+            node.subscribers.remove(subscriber)
+            if node.subscribers:
+                return False
+            del self._filters[topic_filter]
+            self._prune(topic_filter.split('/'))
+            return True
+
+    def _prune(self, levels: List[str]):
+        path = [self._root]
+        for level in levels:
+            path.append(path[-1].children[level])
+        for depth in range(len(levels), 0, -1):
+            node = path[depth]
+            if node.children or node.subscribers:
+                break
+            del path[depth - 1].children[levels[depth - 1]]
+
+    def match(self, topic: str) -> List[Any]:
+        """Subscribers of every filter matching `topic`, each once, in registration order per filter."""
+        found: Dict[Any, None] = {}  # Ordered set; bound methods compare equal, so a handler is called once
+        levels = topic.split('/')
+        with self._lock:
+            nodes = [self._root]
+            for depth, level in enumerate(levels):
+                # Wildcards do not match topics starting with '$' at the first level (MQTT 4.7.2)
+                wildcards = not (depth == 0 and level.startswith('$'))
+                next_nodes = []
+                for node in nodes:
+                    if wildcards:
+                        hash_node = node.children.get('#')
+                        if hash_node is not None:
+                            for subscriber in hash_node.subscribers:
+                                found.setdefault(subscriber)
+                        plus_node = node.children.get('+')
+                        if plus_node is not None:
+                            next_nodes.append(plus_node)
+                    child = node.children.get(level)
+                    if child is not None:
+                        next_nodes.append(child)
+                nodes = next_nodes
+                if not nodes:
+                    break
+            for node in nodes:
+                for subscriber in node.subscribers:
+                    found.setdefault(subscriber)
+                # "a/#" also matches "a"
+                hash_node = node.children.get('#')
+                if hash_node is not None:
+                    for subscriber in hash_node.subscribers:
+                        found.setdefault(subscriber)
+        return list(found)
+
+    def filters(self) -> List[str]:
+        with self._lock:
+            return list(self._filters)
+
+    def __contains__(self, topic_filter: str) -> bool:
+        return topic_filter in self._filters
+
+    def __len__(self) -> int:
+        return len(self._filters)
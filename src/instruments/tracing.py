@@ -0,0 +1,175 @@
+"""
+Per-command latency tracing, from the GUI click to the hardware write and back.
+
+Every hop of a command is stamped and split into stages:
+
+    gui        click in InstrumentFrame.send_command -> RemoteDevice._send
+    outbox     RemoteDevice._send -> publish by the CommandOutbox (coalescing wait)
+    network    publish -> ack received, minus the backend time (paho, broker, both ways)
+    queue      backend receive (on_message) -> hardware start (CommandQueue wait)
+    hardware   hardware start -> hardware done (the pyvisa / nidaqmx calls)
+    total      click (or _send for scripts) -> ack received
+
+Frontend stamps use time.perf_counter() (monotonic, high resolution). Backend
+stages come from the ack timestamps, which are only ever subtracted from each
+other, so the frontend and backend clocks never have to agree.
+
+The last `window` traces of each device are kept; summary() gives
+count / p50 / p95 / p99 / max per device and stage, dump() writes them to a
+JSON file. When tracing is off (the default, CORTEX_TRACE=1 turns it on) each
+hop costs one attribute check.
+
+    from src.instruments.tracing import tracer
+    tracer.enable()
+    ...
+    tracer.summary()["RIGOLPS/0000"]["hardware"]   # {"count": 120, "p50": 0.0031, ...}
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Optional
+
+from src.instruments.codec import Ack
+
+STAGES = ("gui", "outbox", "network", "queue", "hardware", "total")
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class _Trace:
+    __slots__ = ("device", "correlation_id", "clicked", "posted", "published")
+
+    def __init__(self, device: str, correlation_id: int, clicked: Optional[float], posted: float):
+        self.device = device
+        self.correlation_id = correlation_id
+        self.clicked = clicked
+        self.posted = posted
+        self.published = None
+
+
+class Tracer:
+    def __init__(self, window: int = 2000, max_in_flight: int = 10000):
+        self.enabled = False
+        self.window = window
+        self.max_in_flight = max_in_flight
+        self._in_flight: "OrderedDict[int, _Trace]" = OrderedDict()
+        self._done: Dict[str, Deque[dict]] = {}
+        self._click = threading.local()
+        self._lock = threading.Lock()
+
+    def enable(self, enabled: bool = True):
+        self.enabled = enabled
+        if not enabled:
+            with self._lock:
+                self._in_flight.clear()
+
+    def reset(self):
+        with self._lock:
+            self._in_flight.clear()
+            self._done.clear()
+
+    # --- Hops ---
+
+    @contextmanager
+    def click(self):
+        """Marks the commands sent inside the block (same thread) as started by a GUI click."""
+        if not self.enabled:
+            yield
+            return
+        self._click.time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._click.time = None
+
+    def start(self, device: str, correlation_id: int):
+        """A command with `correlation_id` was handed to the outbox."""
+        trace = _Trace(device, correlation_id, getattr(self._click, "time", None), time.perf_counter())
+        with self._lock:
+            self._in_flight[correlation_id] = trace
+            while len(self._in_flight) > self.max_in_flight:
+                self._in_flight.popitem(last=False)  # Never acknowledged
+
+    def published(self, correlation_id: int):
+        now = time.perf_counter()
+        with self._lock:
+            trace = self._in_flight.get(correlation_id)
+            if trace is not None:
+                trace.published = now
+
+    def discard(self, correlation_id: int):
+        """The command was superseded in the outbox and never sent."""
+        with self._lock:
+            self._in_flight.pop(correlation_id, None)
+
+    def complete(self, correlation_id: int, ack: Ack):
+        acked = time.perf_counter()
+        with self._lock:
+            trace = self._in_flight.pop(correlation_id, None)
+        if trace is None:
+            return
+
+        published = trace.published if trace.published is not None else trace.posted
+        backend = max(0.0, ack.done - ack.received)
+        record = {
+            "device": trace.device,
+            "correlation_id": correlation_id,
+            "ok": ack.ok,
+            "gui": trace.posted - trace.clicked if trace.clicked is not None else None,
+            "outbox": published - trace.posted,
+            "network": max(0.0, acked - published - backend),
+            "queue": max(0.0, ack.started - ack.received),
+            "hardware": max(0.0, ack.done - ack.started),
+            "total": acked - (trace.clicked if trace.clicked is not None else trace.posted),
+        }
+        with self._lock:
+            done = self._done.get(trace.device)
+            if done is None:
+                done = self._done[trace.device] = deque(maxlen=self.window)
+            done.append(record)
+
+    # --- Results ---
+
+    def summary(self) -> Dict[str, Dict[str, dict]]:
+        """{device: {stage: {"count", "p50", "p95", "p99", "max"}}}, in seconds."""
+        with self._lock:
+            records = {device: list(done) for device, done in self._done.items()}
+
+        summary = {}
+        for device, traces in records.items():
+            stages = {}
+            for stage in STAGES:
+                values = sorted(r[stage] for r in traces if r[stage] is not None)
+                if not values:
+                    continue
+                stats = {"count": len(values)}
+                for p in PERCENTILES:
+                    stats[f"p{p}"] = percentile(values, p)
+                stats["max"] = values[-1]
+                stages[stage] = stats
+            summary[device] = stages
+        return summary
+
+    def dump(self, path: str):
+        """Writes the summary and every kept trace to a JSON file."""
+        with self._lock:
+            traces = [r for done in self._done.values() for r in done]
+        with open(path, "w") as f:
+            json.dump({"created": time.time(), "summary": self.summary(), "traces": traces}, f, indent=1)
+        print(f"[Tracer] {len(traces)} traces written to {path}")
+
+
+# One tracer per process, shared by the frontend drivers and the GUI
+tracer = Tracer()
+if os.environ.get("CORTEX_TRACE") == "1":
+    tracer.enable()
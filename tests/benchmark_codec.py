@@ -0,0 +1,88 @@
+"""
+Benchmark: binary wire codec vs. the old `ast.literal_eval` string tuples.
+
+Decodes the same stream of power supply commands both ways and reports the
+per-message cost and the CPU share needed to sustain 10k msgs/s.
+
+Run from the repository root:
+    python tests/benchmark_codec.py [n_messages]
+"""
+import ast
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.instruments.codec import POWER_SUPPLY
+
+TARGET_RATE = 10_000  # msgs/s
+
+
+def legacy_encode(cmd, channel, value):
+    return f"('{cmd}', {channel}, {value})".encode()
+
+
+def legacy_decode(payload: bytes):
+    # Same steps as the old BackendPowerSupply.on_message
+    data = ast.literal_eval(payload.decode())
+    return data[0], int(data[1]), float(data[2])
+
+
+def make_commands(n: int):
+    rng = random.Random(0)
+    cmds = []
+    for _ in range(n):
+        cmd = rng.choice(("set", "set", "set", "enable", "disable"))
+        cmds.append((cmd, rng.randint(1, 3), round(rng.uniform(0, 30), 3)))
+    return cmds
+
+
+def time_per_message(func, items, repeats=5):
+    """Best of `repeats` runs, in seconds per message."""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for item in items:
+            func(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items)
+
+
+def report(label, seconds):
+    us = seconds * 1e6
+    rate = 1.0 / seconds
+    cpu = TARGET_RATE * seconds * 100
+    print(f"{label:<28} {us:8.2f} us/msg {rate:12,.0f} msgs/s {cpu:7.2f} % CPU @ 10k msgs/s")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else TARGET_RATE
+    cmds = make_commands(n)
+
+    legacy_frames = [legacy_encode(*c) for c in cmds]
+    binary_frames = [POWER_SUPPLY.encode(*c) for c in cmds]
+
+    # Sanity: both paths agree on every message
+    for old, new in zip(legacy_frames, binary_frames):
+        assert legacy_decode(old) == POWER_SUPPLY.decode(new)
+
+    print(f"{n} power supply commands")
+    print(f"Average frame size: legacy {sum(map(len, legacy_frames)) / n:.1f} B, "
+          f"binary {POWER_SUPPLY.size} B\n")
+
+    t_old_enc = time_per_message(lambda c: legacy_encode(*c), cmds)
+    t_new_enc = time_per_message(lambda c: POWER_SUPPLY.encode(*c), cmds)
+    t_old_dec = time_per_message(legacy_decode, legacy_frames)
+    t_new_dec = time_per_message(POWER_SUPPLY.decode, binary_frames)
+
+    report("encode: f-string", t_old_enc)
+    report("encode: codec", t_new_enc)
+    report("decode: ast.literal_eval", t_old_dec)
+    report("decode: codec", t_new_dec)
+    print(f"\nDecode speed-up: {t_old_dec / t_new_dec:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark: TopicRouter trie vs. the old linear scan of every subscription.
+
+Builds a GUI-sized subscription table (devices, acks, telemetry, state,
+wavemeter channels and a few wildcards) and times matching a stream of
+published topics both ways.
+
+Run from the repository root:
+    python tests/benchmark_topic_router.py [n_devices]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.instruments.topic_router import TopicRouter, topic_matches
+
+
+def build_filters(n_devices):
+    filters = []
+    for i in range(n_devices):
+        device = f"DEV{i % 7}/{i:04d}"
+        filters += [device, f"{device}/ack", f"{device}/telemetry"]
+    filters += [f"HFWM/8731/frequency/{ch}" for ch in range(1, 9)]
+    filters += ["+/+/state", "HFWM/8731/setpoint/#"]
+    return filters
+
+
+def linear_match(filters, topic):
+    # Same work as the old MockBroker.publish: test every subscription
+    return [f for f in filters if topic_matches(f, topic)]
+
+
+def main():
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    filters = build_filters(n_devices)
+    router = TopicRouter()
+    for f in filters:
+        router.add(f, f)
+
+    topics = [random.choice(filters).replace('+', 'X').replace('#', 'Y') for _ in range(20_000)]
+
+    start = time.perf_counter()
+    for topic in topics:
+        linear_match(filters, topic)
+    linear = (time.perf_counter() - start) / len(topics)
+
+    start = time.perf_counter()
+    for topic in topics:
+        router.match(topic)
+    trie = (time.perf_counter() - start) / len(topics)
+
+    for topic in topics[:500]:
+        assert sorted(router.match(topic)) == sorted(linear_match(filters, topic)), topic
+
+    print(f"{len(filters)} subscriptions, {len(topics)} publishes")
+    print(f"  linear scan : {linear * 1e6:8.2f} us/publish")
+    print(f"  topic trie  : {trie * 1e6:8.2f} us/publish  ({linear / trie:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
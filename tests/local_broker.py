@@ -0,0 +1,327 @@
+"""
+Minimal MQTT 3.1.1 broker for offline end-to-end runs and benchmarks.
+
+Pure python (asyncio), no dependencies besides the repository itself:
+QoS 0 and 1 (QoS 2 publishes are acknowledged and delivered as QoS 1),
+retained messages, '+' / '#' wildcards (TopicRouter), keepalive and
+client id takeover. Sessions are always clean; there is no persistence,
+authentication or last will. Good enough for the real paho clients of
+CORTEX, the backends and the fake backend on one machine.
+
+Usage (repository root):
+    python tests/local_broker.py [--host 127.0.0.1] [--port 1883] [-v]
+
+    # Real sockets and real paho threads end to end:
+    python -m src.instruments.backend.fake_backend --broker localhost
+    CORTEX_MQTT_MOCK=0 CORTEX_MQTT_BROKER=localhost python CORTEX.py
+    CORTEX_MQTT_MOCK=0 CORTEX_MQTT_BROKER=localhost python tests/run_async_with_fake_backend.py
+"""
+import argparse
+import asyncio
+import os
+import signal
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.instruments.topic_router import TopicRouter, topic_matches
+
+# Control packet types (MQTT 3.1.1, section 2.2.1)
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_length(length: int) -> bytes:
+    """Remaining Length field (variable byte integer)."""
+    out = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        out.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(out)
+
+
+def encode_string(text) -> bytes:
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    return struct.pack('!H', len(data)) + data
+
+
+def packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + encode_length(len(body)) + body
+
+
+class Reader:
+    """Cursor over a packet body."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def uint16(self) -> int:
+        if self.pos + 2 > len(self.data):
+            raise ProtocolError("Truncated packet")
+        value, = struct.unpack_from('!H', self.data, self.pos)
+        self.pos += 2
+        return value
+
+    def byte(self) -> int:
+        if self.pos >= len(self.data):
+            raise ProtocolError("Truncated packet")
+        self.pos += 1
+        return self.data[self.pos - 1]
+
+    def bytes(self) -> bytes:
+        length = self.uint16()
+        if self.pos + length > len(self.data):
+            raise ProtocolError("Truncated string")
+        value = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return value
+
+    def string(self) -> str:
+        return self.bytes().decode('utf-8')
+
+    def rest(self) -> bytes:
+        return self.data[self.pos:]
+
+    @property
+    def remaining(self) -> int:
+        return len(self.data) - self.pos
+
+
+class Session:
+    def __init__(self, broker: "Broker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = ""
+        self.keepalive = 0
+        self.subscriptions = {}  # filter -> granted qos
+        self._next_packet_id = 0
+        self.closed = False
+
+    def __repr__(self):
+        return f"<Session {self.client_id!r}>"
+
+    def packet_id(self) -> int:
+        self._next_packet_id = self._next_packet_id % 0xFFFF + 1
+        return self._next_packet_id
+
+    def send(self, data: bytes):
+        if not self.closed:
+            self.writer.write(data)
+            self.broker.bytes_out += len(data)
+
+    def send_publish(self, topic: str, payload: bytes, qos: int, retain: bool):
+        flags = (qos << 1) | (1 if retain else 0)
+        body = encode_string(topic)
+        if qos:
+            body += struct.pack('!H', self.packet_id())  # Clean sessions: no retry, PUBACK is ignored
+        self.send(packet(PUBLISH, flags, body + payload))
+        self.broker.sent += 1
+
+    def granted_qos(self, topic: str) -> int:
+        return max((qos for f, qos in self.subscriptions.items() if topic_matches(f, topic)), default=0)
+
+    async def read_packet(self):
+        timeout = self.keepalive * 1.5 if self.keepalive else None
+        first = await asyncio.wait_for(self.reader.readexactly(1), timeout)
+        length, multiplier = 0, 1
+        for _ in range(4):
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        else:
+            raise ProtocolError("Malformed remaining length")
+        body = await self.reader.readexactly(length) if length else b''
+        self.broker.bytes_in += 2 + length
+        return first[0] >> 4, first[0] & 0x0F, body
+
+    async def run(self):
+        try:
+            packet_type, _, body = await self.read_packet()
+            if packet_type != CONNECT:
+                raise ProtocolError("First packet must be CONNECT")
+            self.handle_connect(Reader(body))
+            while not self.closed:
+                packet_type, flags, body = await self.read_packet()
+                if packet_type == DISCONNECT:
+                    break
+                self.handle(packet_type, flags, Reader(body))
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass
+        except ProtocolError as e:
+            self.broker.log(f"{self}: protocol error: {e}")
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.broker.remove_session(self)
+        self.writer.close()
+
+    # --- Packet handlers ---
+
+    def handle_connect(self, r: Reader):
+        protocol = r.string()
+        level = r.byte()
+        if protocol not in ("MQTT", "MQIsdp") or level not in (3, 4):
+            self.send(packet(CONNACK, 0, bytes([0, CONNACK_BAD_PROTOCOL])))
+            raise ProtocolError(f"Unsupported protocol {protocol} level {level}")
+        flags = r.byte()
+        self.keepalive = r.uint16()
+        self.client_id = r.string() or f"auto-{id(self):x}"
+        if flags & 0x04:  # Will flag: parsed, not used
+            r.string()
+            r.bytes()
+        if flags & 0x80:
+            r.string()
+        if flags & 0x40:
+            r.bytes()
+        self.broker.add_session(self)
+        self.send(packet(CONNACK, 0, bytes([0, CONNACK_ACCEPTED])))
+
+    def handle(self, packet_type: int, flags: int, r: Reader):
+        if packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            topic = r.string()
+            packet_id = r.uint16() if qos else 0
+            self.broker.publish(topic, r.rest(), min(qos, 1), bool(flags & 0x01))
+            if qos == 1:
+                self.send(packet(PUBACK, 0, struct.pack('!H', packet_id)))
+            elif qos == 2:
+                self.send(packet(PUBREC, 0, struct.pack('!H', packet_id)))
+        elif packet_type == PUBREL:
+            self.send(packet(PUBCOMP, 0, struct.pack('!H', r.uint16())))
+        elif packet_type in (PUBACK, PUBREC, PUBCOMP):
+            pass  # Acks for our QoS 1 deliveries: nothing is retried
+        elif packet_type == SUBSCRIBE:
+            packet_id = r.uint16()
+            granted = []
+            filters = []
+            while r.remaining:
+                topic_filter = r.string()
+                qos = min(r.byte() & 0x03, 1)
+                filters.append(topic_filter)
+                granted.append(qos)
+                self.broker.subscribe(self, topic_filter, qos)
+            self.send(packet(SUBACK, 0, struct.pack('!H', packet_id) + bytes(granted)))
+            for topic_filter in filters:
+                self.broker.send_retained(self, topic_filter)
+        elif packet_type == UNSUBSCRIBE:
+            packet_id = r.uint16()
+            while r.remaining:
+                self.broker.unsubscribe(self, r.string())
+            self.send(packet(UNSUBACK, 0, struct.pack('!H', packet_id)))
+        elif packet_type == PINGREQ:
+            self.send(packet(PINGRESP, 0, b''))
+        else:
+            raise ProtocolError(f"Unexpected packet type {packet_type}")
+
+
+class Broker:
+    def __init__(self, verbose: bool = False):
+        self.verbose = verbose
+        self.router = TopicRouter()
+        self.retained = {}  # topic -> (payload, qos)
+        self.sessions = {}  # client id -> Session
+
+        self.received = 0
+        self.sent = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def log(self, text: str):
+        if self.verbose:
+            print(f"[Broker] {text}")
+
+    def add_session(self, session: Session):
+        previous = self.sessions.get(session.client_id)
+        if previous is not None:
+            self.log(f"{session.client_id}: taking over existing connection")
+            previous.close()
+        self.sessions[session.client_id] = session
+        self.log(f"{session.client_id} connected ({len(self.sessions)} clients)")
+
+    def remove_session(self, session: Session):
+        for topic_filter in list(session.subscriptions):
+            self.router.remove(topic_filter, session)
+        session.subscriptions.clear()
+        if self.sessions.get(session.client_id) is session:
+            del self.sessions[session.client_id]
+            self.log(f"{session.client_id} disconnected ({len(self.sessions)} clients)")
+
+    def subscribe(self, session: Session, topic_filter: str, qos: int):
+        if topic_filter not in session.subscriptions:
+            self.router.add(topic_filter, session)
+        session.subscriptions[topic_filter] = qos
+        self.log(f"{session.client_id} subscribed to {topic_filter}")
+
+    def unsubscribe(self, session: Session, topic_filter: str):
+        if session.subscriptions.pop(topic_filter, None) is not None:
+            self.router.remove(topic_filter, session)
+
+    def publish(self, topic: str, payload: bytes, qos: int, retain: bool):
+        self.received += 1
+        if retain:
+            # An empty retained payload clears the topic
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        for session in self.router.match(topic):
+            session.send_publish(topic, payload, min(qos, session.granted_qos(topic)), False)
+
+    def send_retained(self, session: Session, topic_filter: str):
+        for topic, (payload, qos) in list(self.retained.items()):
+            if topic_matches(topic_filter, topic):
+                session.send_publish(topic, payload, min(qos, session.subscriptions[topic_filter]), True)
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        await Session(self, reader, writer).run()
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"[Broker] Listening on {host}:{port}")
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+        start = time.perf_counter()
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            elapsed = time.perf_counter() - start
+            print(f"\n[Broker] {self.received} messages in, {self.sent} out "
+                  f"({self.bytes_in} / {self.bytes_out} bytes) in {elapsed:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Minimal local MQTT 3.1.1 broker.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("-v", "--verbose", action="store_true", help="log connections and subscriptions")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(Broker(args.verbose).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
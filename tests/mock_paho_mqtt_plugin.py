@@ -1,7 +1,28 @@
+"""
+In-process stand-in for paho.mqtt.client (patched into sys.modules, see
+configure_mqtt_environment in src/gui/tabs/devices_tab.py).
+
+Two delivery modes:
+    sync  (default)  messages are delivered inside the publisher's call stack
+    async            every client gets a delivery queue served by its own thread
+                     (started by loop_start(), like paho's network thread), with
+                     optional latency and jitter, so callbacks run concurrently as
+                     they would with a real broker
+
+Enable async mode with configure(async_delivery=True, latency=0.002, jitter=0.001)
+or the environment: MOCK_MQTT_ASYNC=1 MOCK_MQTT_LATENCY_MS=2 MOCK_MQTT_JITTER_MS=1.
+MockBroker().stats() returns the published / delivered / dropped / queued counters.
+"""
+import os
+import queue
+import random
 import sys
+import threading
 import time
-import fnmatch
-from collections import defaultdict
+import weakref
+
+# Pure python, no paho import: safe to load before this module is patched in
+from src.instruments.topic_router import TopicRouter, topic_matches
 
 # --- Constants & Enums ---
 class CallbackAPIVersion:
@@ -9,9 +30,11 @@ class CallbackAPIVersion:
     VERSION2 = 2
 
 class MQTTMessage:
-    def __init__(self, topic, payload):
+    def __init__(self, topic, payload, retain=False):
         self.topic = topic
         self.payload = payload.encode('utf-8') if isinstance(payload, str) else payload
+        self.retain = retain
+
 
 # --- Mock Broker Singleton ---
 class MockBroker:
@@ -20,40 +43,86 @@ class MockBroker:
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(MockBroker, cls).__new__(cls)
-            cls._instance.subscribers = defaultdict(list)
+            cls._instance._init()
         return cls._instance
 
+    def _init(self):
+        # Filter -> clients; one client gets a message once even with overlapping filters
+        self.router = TopicRouter()
+        self.retained = {}  # topic -> payload, like a real broker
+        self._lock = threading.RLock()
+        self.clients = weakref.WeakSet()  # For the queued counter
+
+        # Delivery mode (see configure())
+        self.async_delivery = os.environ.get("MOCK_MQTT_ASYNC", "0") == "1"
+        self.latency = float(os.environ.get("MOCK_MQTT_LATENCY_MS", "0")) / 1000
+        self.jitter = float(os.environ.get("MOCK_MQTT_JITTER_MS", "0")) / 1000
+        self.queue_size = 10000  # Per client, messages beyond are dropped
+
+        # Counters
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def configure(self, async_delivery=None, latency=None, jitter=None, queue_size=None):
+        """Changes the delivery mode for clients connecting afterwards. Times in seconds."""
+        if async_delivery is not None:
+            self.async_delivery = async_delivery
+        if latency is not None:
+            self.latency = latency
+        if jitter is not None:
+            self.jitter = jitter
+        if queue_size is not None:
+            self.queue_size = queue_size
+
+    def stats(self):
+        with self._lock:
+            clients = list(self.clients)
+        return {
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "queued": sum(client.queued for client in clients),
+        }
+
     def subscribe(self, topic, client):
-        self.subscribers[topic].append(client)
+        with self._lock:
+            self.router.add(topic, client)
+            retained = [(t, p) for t, p in self.retained.items() if topic_matches(topic, t)]
+        # New subscribers get the retained messages matching their filter right away
+        for retained_topic, payload in retained:
+            client._enqueue(MQTTMessage(retained_topic, payload, retain=True))
 
     def unsubscribe(self, topic, client):
-        if topic in self.subscribers:
-            if client in self.subscribers[topic]:
-                self.subscribers[topic].remove(client)
-
-    def publish(self, topic, payload):
-        # Very basic matching: Direct match or simple wildcard handling could be added
-        # iterating a copy to avoid modification during iteration issues
-        for sub_topic, clients in list(self.subscribers.items()):
-            # Check for match (using fnmatch for simple wildcard support like # or +)
-            # MQTT wildcards are specific, but fnmatch is a decent approx for a mock
-            # Mapping MQTT wildcards to fnmatch: + -> *, # -> * (roughly)
-            # A proper MQTT matcher is complex, we will support direct match and simple # at end
-
-            match = False
-            if sub_topic == topic:
-                match = True
-            elif sub_topic.endswith('#') and topic.startswith(sub_topic[:-1]):
-                match = True
-
-            if match:
-                msg = MQTTMessage(topic, payload)
-                for client in clients:
-                    if client.on_message:
-                        try:
-                            client.on_message(client, None, msg)
-                        except Exception as e:
-                            print(f"[MOCK BROKER] Error delivering message to client: {e}")
+        with self._lock:
+            self.router.remove(topic, client)
+
+    def publish(self, topic, payload, retain=False):
+        with self._lock:
+            self.published += 1
+            if retain:
+                # An empty retained payload clears the topic
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            clients = self.router.match(topic)
+
+        # One message object shared by every matching client
+        msg = MQTTMessage(topic, payload)
+        for client in clients:
+            client._enqueue(msg)
+
+    def _count(self, delivered=0, dropped=0):
+        with self._lock:
+            self.delivered += delivered
+            self.dropped += dropped
+
+
+def configure(async_delivery=None, latency=None, jitter=None, queue_size=None):
+    """Module-level shortcut for MockBroker().configure(...)."""
+    MockBroker().configure(async_delivery, latency, jitter, queue_size)
+
 
 # --- The Fake Client ---
 class Client:
@@ -66,20 +135,40 @@ class Client:
         self.on_message = None
         self.broker = MockBroker()
 
+        # Async mode: (deliver_at, callable) items served by the loop thread
+        self._queue = None
+        self._thread = None
+
+    @property
+    def queued(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
     def connect(self, host, port=1883, keepalive=60):
         print(f"[MOCK] Connecting to {host}:{port}...")
         self.connected = True
-        if self.on_connect:
+        with self.broker._lock:
+            self.broker.clients.add(self)
+        if self.broker.async_delivery:
+            self._queue = queue.Queue(self.broker.queue_size)
+            # Like paho, on_connect runs on the network thread once the loop runs
+            self._enqueue(None)
+        elif self.on_connect:
             self.on_connect(self, None, {}, 0, None)
         return 0
 
     def loop_start(self):
-        # print(f"[MOCK] Loop started.")
-        pass
+        if self._queue is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name=f"mock-mqtt-{self.client_id}", daemon=True)
+        self._thread.start()
 
     def loop_stop(self, force=False):
-        # print(f"[MOCK] Loop stopped.")
-        pass
+        if self._thread is None:
+            return
+        self._queue.put((0.0, StopIteration))
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
 
     def disconnect(self):
         print(f"[MOCK] Disconnected.")
@@ -87,13 +176,22 @@ class Client:
 
     def subscribe(self, topic, qos=0):
         print(f"[MOCK] Subscribed to '{topic}'")
+        if topic in self.subscriptions:
+            return (0, 1)  # Like a real broker: re-subscribing replaces, no duplicate
         self.subscriptions.append(topic)
         self.broker.subscribe(topic, self)
         return (0, 1)
 
+    def unsubscribe(self, topic):
+        print(f"[MOCK] Unsubscribed from '{topic}'")
+        if topic in self.subscriptions:
+            self.subscriptions.remove(topic)
+        self.broker.unsubscribe(topic, self)
+        return (0, 1)
+
     def publish(self, topic, payload=None, qos=0, retain=False):
         # print(f"[MOCK] >> PUBLISH: {topic} : {payload}")
-        self.broker.publish(topic, payload)
+        self.broker.publish(topic, payload, retain)
         return None 
     
     def simulate_rx(self, topic, payload_str):
@@ -102,6 +200,42 @@ class Client:
             print(f"[MOCK] << SIMULATED RX: {topic} : {payload_str}")
             self.on_message(self, None, msg)
 
+    # --- Delivery ---
+
+    def _enqueue(self, msg):
+        """Delivers now (sync mode) or queues for the loop thread. msg None = on_connect."""
+        if self._queue is None:
+            self._deliver(msg)
+            return
+        broker = self.broker
+        deliver_at = time.monotonic() + broker.latency + random.uniform(0, broker.jitter)
+        try:
+            self._queue.put_nowait((deliver_at, msg))
+        except queue.Full:
+            broker._count(dropped=1)
+
+    def _loop(self):
+        while True:
+            deliver_at, msg = self._queue.get()
+            if msg is StopIteration:
+                return
+            delay = deliver_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)  # Messages stay in order: each waits for the previous one
+            if msg is None:
+                if self.on_connect:
+                    self.on_connect(self, None, {}, 0, None)
+            else:
+                self._deliver(msg)
+
+    def _deliver(self, msg):
+        if self.on_message:
+            try:
+                self.on_message(self, None, msg)
+            except Exception as e:
+                print(f"[MOCK BROKER] Error delivering message to client: {e}")
+        self.broker._count(delivered=1)
+
 # ==============================================================================
 # CRITICAL FIX: SELF-REFERENCE
 # This tricks Python into thinking this file is 'paho', 'paho.mqtt', AND 'paho.mqtt.client'
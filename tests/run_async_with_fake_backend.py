@@ -0,0 +1,70 @@
+"""
+Drives the fake instruments concurrently through the asyncio frontend API.
+
+By default everything runs in-process on the mock paho module. Add
+MOCK_MQTT_ASYNC=1 (and e.g. MOCK_MQTT_LATENCY_MS=2 MOCK_MQTT_JITTER_MS=1) for
+threaded delivery like a real broker. Set CORTEX_MQTT_MOCK=0 to go through a
+real broker instead (CORTEX_MQTT_BROKER, e.g. a local one) with the fake
+backend started separately. CORTEX_TRACE=1 prints the per-stage latency
+percentiles of every device at the end.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if os.environ.get("CORTEX_MQTT_MOCK", "1") != "0":
+    import tests.mock_paho_mqtt_plugin as mock_mqtt
+    sys.modules["paho"] = mock_mqtt
+    sys.modules["paho.mqtt"] = mock_mqtt
+    sys.modules["paho.mqtt.client"] = mock_mqtt
+
+    from src.instruments.backend.fake_backend import FakeBackend
+    backend = FakeBackend()
+    threading.Thread(target=backend.run, daemon=True).start()
+
+from src.instruments.frontend.aio import AsyncRemoteAWG, AsyncRemotePowerSupply
+from src.instruments.tracing import tracer
+
+PSU_TOPICS = ["RIGOLPS/0000", "RIGOLPS/0001", "RIGOLPS/0002", "UNITYPS/0003"]
+
+
+async def main():
+    awg = AsyncRemoteAWG("TG2511A/0000")
+    psus = [AsyncRemotePowerSupply(topic) for topic in PSU_TOPICS]
+
+    start = time.perf_counter()
+    # Step the AWG and ramp every supply in parallel, each await ends on the backend ack
+    for step in range(10):
+        commands = [awg.set_frequency(10.0 + step)]
+        commands += [psu.set_voltage(1, 0.5 * step) for psu in psus]
+        acks = await asyncio.gather(*commands)
+    elapsed = time.perf_counter() - start
+
+    print(f"\n10 steps x {len(acks)} instruments in {elapsed * 1e3:.1f} ms")
+    print("Last step round trips: " + ", ".join(f"{ack.latency * 1e3:.2f} ms" for ack in acks))
+
+    async with psus[0].batch() as psu:
+        for ch in (1, 2, 3):
+            psu.set_voltage(ch, 5.0)
+            psu.enable(ch)
+    print("Batch acknowledged")
+
+    for device in [awg] + psus:
+        device.close()
+
+    if tracer.enabled:
+        for device, stages in sorted(tracer.summary().items()):
+            print(device + ": " + ", ".join(f"{stage} p50 {stats['p50'] * 1e3:.2f} / p99 {stats['p99'] * 1e3:.2f} ms"
+                                            for stage, stats in stages.items()))
+
+    if "mock_mqtt" in globals():
+        print(f"Mock broker: {mock_mqtt.MockBroker().stats()}")
+        backend.stop()  # Releases the simulated camera's frame ring
+
+
+if __name__ == "__main__":
+    asyncio.run(main())